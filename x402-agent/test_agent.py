@@ -3,11 +3,12 @@
 Quick test of x402 agent - single ping execution
 """
 
-from x402_agent import X402Agent, Config
+from x402_agent import X402Agent, Config, setup_logging
 
 
 def main():
     print("🧪 Testing x402 Agent (Single Ping)\n")
+    setup_logging()
 
     # Create agent (will generate wallet if needed)
     agent = X402Agent()
@@ -9,14 +9,22 @@ and reports if the host is alive or dead.
 import time
 import json
 import uuid
+import queue
+import atexit
+import logging
+import secrets
 import asyncio
+import sys
 from datetime import datetime, timezone
 from decimal import Decimal
-from typing import Optional, Dict, Any
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, Dict, Any, List, Tuple
 
 import requests
+from eth_abi import encode as abi_encode
 from eth_account import Account
 from eth_account.messages import encode_typed_data
+from eth_utils import keccak
 from web3 import Web3
 
 # ============================================================================
@@ -39,13 +47,109 @@ class Config:
     # Payment settings (must match backend config)
     PAYMENT_RECIPIENT = "0x6b27b7af171b6042238f1034ef1815037ab9bfa5"  # From backend config
     TOKEN_ADDRESS     = "0x7143401013282067926d25e316f055fF3bc6c3FD"  # U token
-    CHAIN_ID          = 84532  # Base Sepolia
+    CHAIN_ID          = 84532  # Base Sepolia (or 11155111, Sepolia, with its U TOKEN_ADDRESS)
+
+    # Prepaid session: sign one spending cap instead of a payment per job
+    # (set SESSION_CAP_U to None to sign every job)
+    SESSION_CAP_U     = Decimal("0.5")
+    SESSION_SECONDS   = 3600
+
+    # Tracing: send a W3C traceparent with each job's requests, so the
+    # backend's spans for the job form one trace (recorded if it traces)
+    TRACE_REQUESTS    = True
+
+    # Logging: JSON lines on stdout, written by a background thread
+    LOG_LEVEL         = "INFO"  # DEBUG also logs each line of job output
+    LOG_QUEUE_SIZE    = 1000  # records waiting to be written; more are dropped
 
     # Wallet (set via environment or here)
     # IMPORTANT: In production, use environment variables!
     PRIVATE_KEY = None  # Will be set from env or generated
 
 
+# ============================================================================
+# LOGGING
+# ============================================================================
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, event and the event's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {})
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queues records without waiting; a record that doesn't fit is dropped"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class DrainingQueueListener(QueueListener):
+    """Stops after writing every queued record, even when the queue is full"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class EventLogger:
+    """Logs an event with fields, e.g. log.info("job_authorized", job_id=job_id)"""
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(name)
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any]):
+        if self.logger.isEnabledFor(level):
+            self.logger.handle(self.logger.makeRecord(
+                self.logger.name, level, "", 0, event, (), None, extra={"fields": fields}
+            ))
+
+    def debug(self, event: str, **fields: Any):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any):
+        self._log(logging.ERROR, event, fields)
+
+
+def setup_logging():
+    """Write the agent's log records to stdout from a background thread"""
+    records: "queue.Queue[logging.LogRecord]" = queue.Queue(Config.LOG_QUEUE_SIZE)
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(JsonFormatter())
+    listener = DrainingQueueListener(records, writer)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger("x402_agent")
+    logger.setLevel(Config.LOG_LEVEL)
+    logger.addHandler(DroppingQueueHandler(records))
+    logger.propagate = False
+
+
+log = EventLogger("x402_agent")
+
+
 # ============================================================================
 # EIP-712 SIGNATURE UTILITIES
 # ============================================================================
@@ -120,10 +224,145 @@ def create_payment_signature(
         "jobId": job_id,
         "timestamp": timestamp,
         "validUntil": valid_until,
+        "chainId": Config.CHAIN_ID,  # Chain the payment settles on (the signed domain's)
         "signature": signed_message.signature.hex()
     }
 
 
+SPENDING_CAP_TYPES = {
+    "SpendingCap": [
+        {"name": "recipient", "type": "address"},
+        {"name": "token", "type": "address"},
+        {"name": "cap", "type": "uint256"},
+        {"name": "nonce", "type": "string"},
+        {"name": "timestamp", "type": "uint256"},
+        {"name": "validUntil", "type": "uint256"},
+    ]
+}
+
+
+def create_spending_cap(
+    account: Account,
+    recipient: str,
+    token: str,
+    cap_wei: int,
+    valid_seconds: int
+) -> Dict[str, Any]:
+    """
+    Create an EIP-712 spending cap that opens a prepaid session
+
+    Returns cap data with signature
+    """
+    timestamp = int(time.time())
+    cap_data = {
+        "recipient": Web3.to_checksum_address(recipient),
+        "token": Web3.to_checksum_address(token),
+        "cap": str(cap_wei),
+        "nonce": uuid.uuid4().hex,
+        "timestamp": timestamp,
+        "validUntil": timestamp + valid_seconds,
+    }
+
+    message_data = {
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **SPENDING_CAP_TYPES
+        },
+        "primaryType": "SpendingCap",
+        "domain": get_payment_domain(),
+        "message": cap_data
+    }
+
+    encoded_message = encode_typed_data(full_message=message_data)
+    signed_message = account.sign_message(encoded_message)
+
+    return {**cap_data, "chainId": Config.CHAIN_ID, "signature": signed_message.signature.hex()}
+
+
+BATCH_AUTHORIZATION_TYPES = {
+    "BatchAuthorization": [
+        {"name": "recipient", "type": "address"},
+        {"name": "token", "type": "address"},
+        {"name": "totalAmount", "type": "uint256"},
+        {"name": "jobCount", "type": "uint256"},
+        {"name": "jobsRoot", "type": "bytes32"},
+        {"name": "timestamp", "type": "uint256"},
+        {"name": "validUntil", "type": "uint256"},
+    ]
+}
+
+
+def jobs_merkle_root(jobs: List[Tuple[str, int]]) -> str:
+    """
+    Merkle root over (job_id, amount_wei) pairs, built as the backend does:
+    leaves are keccak256(keccak256(abi.encode(jobId, amount))), pairs are
+    hashed sorted, and an unpaired node moves up unchanged
+    """
+    level = [keccak(keccak(abi_encode(["string", "uint256"], [job_id, amount]))) for job_id, amount in jobs]
+    while len(level) > 1:
+        parents = [keccak(b"".join(sorted(level[i:i + 2]))) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return "0x" + level[0].hex()
+
+
+def create_batch_signature(
+    account: Account,
+    recipient: str,
+    token: str,
+    jobs: List[Tuple[str, int]]
+) -> Dict[str, Any]:
+    """
+    Create one EIP-712 authorization paying for every (job_id, amount_wei)
+    in a batch, by signing the Merkle root of the jobs
+
+    Returns batch authorization data with signature
+    """
+    timestamp = int(time.time())
+    batch_data = {
+        "recipient": Web3.to_checksum_address(recipient),
+        "token": Web3.to_checksum_address(token),
+        "totalAmount": str(sum(amount for _, amount in jobs)),
+        "jobCount": len(jobs),
+        "jobsRoot": jobs_merkle_root(jobs),
+        "timestamp": timestamp,
+        "validUntil": timestamp + 300,  # Valid for 5 minutes
+    }
+
+    message_data = {
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **BATCH_AUTHORIZATION_TYPES
+        },
+        "primaryType": "BatchAuthorization",
+        "domain": get_payment_domain(),
+        "message": batch_data
+    }
+
+    encoded_message = encode_typed_data(full_message=message_data)
+    signed_message = account.sign_message(encoded_message)
+
+    return {**batch_data, "chainId": Config.CHAIN_ID, "signature": signed_message.signature.hex()}
+
+
+# ============================================================================
+# TRACE CONTEXT
+# ============================================================================
+
+def new_traceparent() -> str:
+    """W3C traceparent header starting a new sampled trace"""
+    return f"00-{secrets.token_hex(16)}-{secrets.token_hex(8)}-01"
+
+
 # ============================================================================
 # X402 AGENT
 # ============================================================================
@@ -144,6 +383,81 @@ class X402Agent:
 
         print(f"🔑 Agent wallet: {self.account.address}")
 
+        # Prepaid session token (opened on first use)
+        self.session_token: Optional[str] = None
+
+        # Trace context of the current job's requests
+        self.traceparent: Optional[str] = None
+
+    def trace_headers(self) -> Dict[str, str]:
+        """Headers carrying the current job's trace context"""
+        return {"traceparent": self.traceparent} if self.traceparent else {}
+
+    def open_session(self) -> bool:
+        """Sign a spending cap and open a prepaid session with it"""
+        cap_wei = int(Config.SESSION_CAP_U * Decimal(10**18))
+        log.info("session_opening", cap_u=str(Config.SESSION_CAP_U))
+
+        cap_data = create_spending_cap(
+            self.account,
+            Config.PAYMENT_RECIPIENT,
+            Config.TOKEN_ADDRESS,
+            cap_wei,
+            Config.SESSION_SECONDS
+        )
+        response = requests.post(f"{Config.API_URL}/api/sessions/cap", json=cap_data)
+        if response.status_code != 200:
+            log.error("session_rejected", status=response.status_code, response=response.text)
+            return False
+
+        self.session_token = response.json()["session_token"]
+        return True
+
+    def request_job_with_session(
+        self,
+        job_type: str,
+        params: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Request job paid from the prepaid session, reopening the session
+        once if it ran out or expired
+
+        Returns job_id if successful, None otherwise
+        """
+        try:
+            for attempt in range(2):
+                if not self.session_token and not self.open_session():
+                    return None
+
+                response = requests.post(
+                    f"{Config.API_URL}/api/jobs/request",
+                    json={
+                        "job_type": job_type,
+                        "params": params,
+                        "wallet_address": self.account.address
+                    },
+                    headers={"X-SESSION": self.session_token, **self.trace_headers()}
+                )
+
+                if response.status_code == 200:
+                    data = response.json()
+                    log.info("job_authorized", job_id=data["job_id"], payment="session", balance_wei=data["balance_wei"])
+                    return data["job_id"]
+
+                if response.status_code in (401, 402):
+                    # Session spent, expired or unknown to a restarted server
+                    self.session_token = None
+                    continue
+
+                log.error("job_request_failed", status=response.status_code, response=response.text)
+                return None
+
+            return None
+
+        except Exception as e:
+            log.error("job_request_error", error=str(e))
+            return None
+
     def request_job_with_x402(
         self,
         job_type: str,
@@ -158,11 +472,27 @@ class X402Agent:
             # Generate job ID (client-side for x402)
             job_id = str(uuid.uuid4())
 
-            # Get job price (hardcoded for now, could fetch from /api/jobs)
-            job_price = Decimal("0.01")  # 0.01 U tokens
-            amount_wei = int(job_price * Decimal(10**18))
+            # Get a price quote: prices depend on params and server load, and a
+            # quote holds for this job ID until the payment window closes
+            quote = requests.post(
+                f"{Config.API_URL}/api/jobs/request",
+                json={
+                    "job_type": job_type,
+                    "params": params,
+                    "wallet_address": self.account.address,
+                    "job_id": job_id
+                },
+                headers=self.trace_headers()
+            )
+            if quote.status_code != 402:
+                log.error("quote_failed", status=quote.status_code, response=quote.text)
+                return None
+
+            payment = quote.json()["payment"]
+            job_price = Decimal(payment["amount"])
+            amount_wei = int(payment["amount_wei"])
 
-            print(f"💰 Creating payment signature for {job_price} U...")
+            log.info("payment_signing", job_id=job_id, amount_u=str(job_price))
 
             # Create payment signature
             payment_data = create_payment_signature(
@@ -176,8 +506,6 @@ class X402Agent:
             # Create X-PAYMENT header
             x_payment_header = json.dumps(payment_data)
 
-            print(f"📡 Requesting job with x402 payment...")
-
             # Make request with X-PAYMENT header
             response = requests.post(
                 f"{Config.API_URL}/api/jobs/request",
@@ -189,70 +517,151 @@ class X402Agent:
                 },
                 headers={
                     "Content-Type": "application/json",
-                    "X-PAYMENT": x_payment_header
+                    "X-PAYMENT": x_payment_header,
+                    **self.trace_headers()
                 }
             )
 
             if response.status_code == 200:
                 data = response.json()
                 if data.get("status") == "authorized":
-                    print(f"✅ Payment authorized! Job ID: {data['job_id']}")
+                    log.info("job_authorized", job_id=data["job_id"], payment="x402")
                     return data['job_id']
                 else:
-                    print(f"❌ Unexpected response: {data}")
+                    log.error("job_request_unexpected", response=data)
                     return None
             else:
-                print(f"❌ Request failed: {response.status_code}")
-                print(f"   Response: {response.text}")
+                log.error("job_request_failed", status=response.status_code, response=response.text)
                 return None
 
         except Exception as e:
-            print(f"❌ Error requesting job: {e}")
+            log.error("job_request_error", error=str(e))
             return None
 
-    def execute_job(self, job_id: str) -> Optional[str]:
+    def request_jobs_batch(
+        self,
+        job_type: str,
+        params_list: List[Dict[str, Any]]
+    ) -> List[str]:
+        """
+        Request several jobs paid by one batch signature
+
+        Returns the authorized job IDs (empty if the batch was refused)
+        """
+        try:
+            batch = {
+                "jobs": [
+                    {"job_type": job_type, "params": params, "job_id": str(uuid.uuid4())}
+                    for params in params_list
+                ],
+                "wallet_address": self.account.address
+            }
+
+            # Quote every job in the batch; the quotes hold for these job IDs
+            quote = requests.post(f"{Config.API_URL}/api/jobs/request-batch", json=batch)
+            if quote.status_code != 402:
+                log.error("batch_quote_failed", status=quote.status_code, response=quote.text)
+                return []
+
+            quoted = quote.json()
+            jobs = [(job["job_id"], int(job["amount_wei"])) for job in quoted["jobs"]]
+
+            log.info("batch_signing", jobs=len(jobs), amount_u=quoted["payment"]["amount"])
+            batch_data = create_batch_signature(
+                self.account,
+                Config.PAYMENT_RECIPIENT,
+                Config.TOKEN_ADDRESS,
+                jobs
+            )
+
+            response = requests.post(
+                f"{Config.API_URL}/api/jobs/request-batch",
+                json=batch,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-PAYMENT": json.dumps(batch_data)
+                }
+            )
+
+            if response.status_code != 200:
+                log.error("batch_request_failed", status=response.status_code, response=response.text)
+                return []
+
+            job_ids = [job["job_id"] for job in response.json()["jobs"]]
+            log.info("batch_authorized", jobs=len(job_ids))
+            return job_ids
+
+        except Exception as e:
+            log.error("batch_request_error", error=str(e))
+            return []
+
+    def execute_job(self, job_id: str) -> Optional[List[Dict[str, Any]]]:
         """
         Execute job and stream results
 
-        Returns job output as string, or None on error
+        Returns the received SSE events as {"event", "data"} dicts
+        (typed events have their JSON data decoded), or None on error
         """
         try:
-            print(f"🚀 Executing job {job_id}...")
+            log.info("job_executing", job_id=job_id)
 
             # Connect to SSE stream
             execute_url = f"{Config.API_URL}/api/jobs/execute/{job_id}"
 
-            response = requests.get(execute_url, stream=True)
+            response = requests.get(execute_url, stream=True, headers=self.trace_headers())
 
             if response.status_code != 200:
-                print(f"❌ Execute failed: {response.status_code}")
+                log.error("execute_failed", job_id=job_id, status=response.status_code)
                 return None
 
-            output_lines = []
+            events = []
+            event_name = "message"
 
             # Parse SSE events
             for line in response.iter_lines():
-                if line:
-                    line_str = line.decode('utf-8')
+                if not line:
+                    event_name = "message"
+                    continue
+
+                line_str = line.decode('utf-8')
 
-                    # Parse SSE format: "event: output\ndata: <line>"
-                    if line_str.startswith('data: '):
-                        data = line_str[6:]  # Remove "data: " prefix
+                # Parse SSE format: "event: <name>\ndata: <payload>"
+                if line_str.startswith('event: '):
+                    event_name = line_str[7:]
+                elif line_str.startswith('data: '):
+                    data = line_str[6:]  # Remove "data: " prefix
 
-                        # Collect output lines
-                        if data and data != "Job started" and data != "Job completed":
-                            output_lines.append(data)
-                            print(f"   {data}")
+                    if event_name in ("start", "complete"):
+                        continue
 
-            full_output = "\n".join(output_lines)
-            print(f"✅ Job completed!")
+                    if event_name not in ("output", "error", "message"):
+                        try:
+                            data = json.loads(data)
+                        except json.JSONDecodeError:
+                            pass
 
-            return full_output
+                    events.append({"event": event_name, "data": data})
+                    log.debug("job_output", job_id=job_id, sse_event=event_name, data=data)
+
+            log.info("job_completed", job_id=job_id, events=len(events))
+
+            return events
 
         except Exception as e:
-            print(f"❌ Error executing job: {e}")
+            log.error("execute_error", job_id=job_id, error=str(e))
             return None
 
+    def parse_ping_summary(self, events: List[Dict[str, Any]]) -> Optional[bool]:
+        """
+        Determine liveness from a structured ping summary event
+
+        Returns True if alive, False if dead, None if there is no summary
+        """
+        for event in reversed(events):
+            if event["event"] == "summary" and isinstance(event["data"], dict):
+                return event["data"].get("received", 0) > 0
+        return None
+
     def parse_ping_result(self, output: str) -> bool:
         """
         Parse ping output to determine if host is alive
@@ -302,14 +711,18 @@ class X402Agent:
         print(f"   Time: {datetime.now(timezone.utc).isoformat()}")
         print(f"{'='*60}")
 
-        # Request job with x402 payment
-        job_id = self.request_job_with_x402(
-            Config.JOB_TYPE,
-            {
-                "host": Config.PING_HOST,
-                "count": Config.PING_COUNT
-            }
-        )
+        # One trace per job, across its request and execution
+        self.traceparent = new_traceparent() if Config.TRACE_REQUESTS else None
+
+        # Request job from the prepaid session, or with a per-job x402 payment
+        params = {
+            "host": Config.PING_HOST,
+            "count": Config.PING_COUNT
+        }
+        if Config.SESSION_CAP_U:
+            job_id = self.request_job_with_session(Config.JOB_TYPE, params)
+        else:
+            job_id = self.request_job_with_x402(Config.JOB_TYPE, params)
 
         if not job_id:
             return {
@@ -320,9 +733,9 @@ class X402Agent:
             }
 
         # Execute job and get output
-        output = self.execute_job(job_id)
+        events = self.execute_job(job_id)
 
-        if output is None:
+        if events is None:
             return {
                 "success": False,
                 "alive": False,
@@ -330,8 +743,14 @@ class X402Agent:
                 "timestamp": datetime.now(timezone.utc).isoformat()
             }
 
-        # Parse result
-        is_alive = self.parse_ping_result(output)
+        # Parse result: prefer the structured summary, fall back to text output
+        output = "\n".join(
+            event["data"] if isinstance(event["data"], str) else json.dumps(event["data"])
+            for event in events
+        )
+        is_alive = self.parse_ping_summary(events)
+        if is_alive is None:
+            is_alive = self.parse_ping_result(output)
 
         result = {
             "success": True,
@@ -407,6 +826,8 @@ def main():
         print("⚠️  Generating a new wallet (payments won't work without U tokens)")
         print("⚠️  Set AGENT_PRIVATE_KEY environment variable to reuse a wallet\n")
 
+    setup_logging()
+
     # Create and run agent
     agent = X402Agent(private_key=private_key)
     agent.run_periodic()
@@ -0,0 +1,93 @@
+"""
+Cold-start benchmark for job discovery.
+
+Each scenario runs in a fresh interpreter, the way a new API process or
+pool worker starts, and reports the time spent importing and using the
+job registry, the process's peak RSS and how many modules were loaded.
+
+Run from the x402-backend directory:
+
+    python -m benchmarks.cold_start [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child; SETUP is timed, the result is printed as JSON
+_CHILD = """
+import json, resource, sys, time
+started = time.perf_counter()
+{setup}
+elapsed_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{
+    "elapsed_ms": elapsed_ms,
+    "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+}}))
+"""
+
+SCENARIOS = {
+    "interpreter only": "pass",
+    "lazy: list jobs": (
+        "from jobs.registry import job_registry\n"
+        "job_registry.list_jobs()"
+    ),
+    "lazy: list + first ping": (
+        "from jobs.registry import job_registry\n"
+        "job_registry.list_jobs()\n"
+        "job_registry.get_job_class('ping')"
+    ),
+    "eager: preload all jobs": (
+        "from jobs.registry import job_registry\n"
+        "job_registry.preload(['*'])\n"
+        "job_registry.list_jobs()"
+    ),
+}
+
+
+def run_scenario(setup: str, runs: int) -> dict:
+    """Run one scenario `runs` times in fresh interpreters and summarize"""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _CHILD.format(setup=setup)],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    elapsed = [sample["elapsed_ms"] for sample in samples]
+    return {
+        "median_ms": round(statistics.median(elapsed), 2),
+        "min_ms": round(min(elapsed), 2),
+        "maxrss_kb": int(statistics.median(sample["maxrss_kb"] for sample in samples)),
+        "modules": samples[-1]["modules"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Job registry cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per scenario")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {name: run_scenario(setup, args.runs) for name, setup in SCENARIOS.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'SCENARIO':<28} {'MEDIAN ms':>10} {'MIN ms':>8} {'RSS KB':>9} {'MODULES':>8}")
+    for name, result in results.items():
+        print(
+            f"{name:<28} {result['median_ms']:>10.2f} {result['min_ms']:>8.2f} "
+            f"{result['maxrss_kb']:>9} {result['modules']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Microbenchmarks of the per-request payment hot paths.
+
+Each case runs a fixed input: warmup iterations first, then timed rounds,
+reporting the median ops/sec and the peak memory one call allocates
+(tracemalloc). Results can be saved as a baseline; later runs compare
+against it and exit non-zero when a case is slower, or allocates more,
+than the baseline by more than --threshold.
+
+Run from the x402-backend directory:
+
+    python -m benchmarks.hot_paths --save-baseline    # record this machine's baseline
+    python -m benchmarks.hot_paths [--threshold 0.2]  # compare against it
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from eth_account import Account
+from web3 import Web3
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENT_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "x402-agent")
+BASELINE_FILE = os.path.join(BACKEND_DIR, "benchmarks", "baselines", "hot_paths.json")
+
+# Fixed inputs
+PRIVATE_KEY = "0x" + "11" * 32
+JOB_ID = "00000000-0000-4000-8000-000000000000"
+AMOUNT_WEI = 10**16
+ADDRESS = "0x6b27b7af171b6042238f1034ef1815037ab9bfa5"
+
+
+def build_cases() -> Dict[str, Callable[[], Any]]:
+    """Name -> a call on a fixed input"""
+    sys.path.insert(0, AGENT_DIR)
+    from x402_agent import create_payment_signature
+    from main import JobRequest
+    from payments.x402_auth import parse_x_payment_header, verify_payment_signature
+    from config import PAYMENT_RECIPIENT_ADDRESS, TOKEN_ADDRESS
+
+    account = Account.from_key(PRIVATE_KEY)
+    payment = create_payment_signature(account, PAYMENT_RECIPIENT_ADDRESS, TOKEN_ADDRESS, AMOUNT_WEI, JOB_ID)
+    header = json.dumps(payment)
+    body = json.dumps({
+        "job_type": "ping",
+        "params": {"host": "example.com", "count": 4},
+        "wallet_address": account.address,
+        "job_id": JOB_ID,
+    })
+
+    return {
+        "create_payment_signature": lambda: create_payment_signature(
+            account, PAYMENT_RECIPIENT_ADDRESS, TOKEN_ADDRESS, AMOUNT_WEI, JOB_ID
+        ),
+        "parse_x_payment_header": lambda: parse_x_payment_header(header),
+        "verify_payment_signature": lambda: verify_payment_signature(payment, JOB_ID, str(AMOUNT_WEI)),
+        "to_checksum_address": lambda: Web3.to_checksum_address(ADDRESS),
+        "JobRequest validation": lambda: JobRequest.model_validate_json(body),
+    }
+
+
+def measure(call: Callable[[], Any], warmup: int, rounds: int, min_round_seconds: float) -> Dict[str, float]:
+    """Median ops/sec over rounds, and peak bytes allocated by one call"""
+    for _ in range(warmup):
+        call()
+
+    # Size rounds so each takes about min_round_seconds
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        if time.perf_counter() - started >= min_round_seconds:
+            break
+        number *= 2
+
+    rates = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        rates.append(number / (time.perf_counter() - started))
+
+    tracemalloc.start()
+    call()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops_per_sec": round(statistics.median(rates), 1), "peak_alloc_bytes": peak - baseline}
+
+
+def regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                threshold: float) -> Dict[str, str]:
+    """Cases slower, or allocating more, than their baseline by more than threshold"""
+    found = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            found[name] = f"ops/sec {before['ops_per_sec']:.0f} -> {result['ops_per_sec']:.0f}"
+        elif result["peak_alloc_bytes"] > before["peak_alloc_bytes"] * (1 + threshold):
+            found[name] = f"peak alloc {before['peak_alloc_bytes']} -> {result['peak_alloc_bytes']} bytes"
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment hot path microbenchmarks")
+    parser.add_argument("--warmup", type=int, default=200, help="Untimed calls before measuring")
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds per case")
+    parser.add_argument("--round-seconds", type=float, default=0.2, help="Minimum length of a timed round")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown versus the baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {
+        name: measure(call, args.warmup, args.rounds, args.round_seconds)
+        for name, call in build_cases().items()
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    found = regressions(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": found}, indent=2))
+    else:
+        print(f"{'CASE':<28} {'OPS/SEC':>12} {'BASELINE':>12} {'PEAK ALLOC B':>13}")
+        for name, result in results.items():
+            before = baseline.get(name, {}).get("ops_per_sec")
+            print(
+                f"{name:<28} {result['ops_per_sec']:>12.1f} {before or 0:>12.1f} "
+                f"{result['peak_alloc_bytes']:>13}{'  REGRESSION' if name in found else ''}"
+            )
+        for name, change in found.items():
+            print(f"Regression in {name}: {change} (threshold {args.threshold:.0%})")
+
+    if found and not args.save_baseline:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
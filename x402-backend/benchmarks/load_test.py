@@ -0,0 +1,286 @@
+"""
+End-to-end load test of the request -> pay -> execute -> stream pipeline.
+
+Starts one backend instance (uvicorn running main:app in a subprocess)
+whose only payment chain is the local simulated node, then drives many
+concurrent agents through it. Agents use keys derived from --seed, and
+each runs one of the two payment flows:
+
+    x402:   quote (402) -> signed request -> execute
+    verify: quote (402) -> transfer on the simulated chain -> verify-payment -> execute
+
+Reports jobs per second and p50/p95/p99 latency of every stage,
+including the time to the first byte of the SSE stream. Jobs are
+tcp_probe runs against the backend's own port, so execution costs little.
+
+Run from the x402-backend directory:
+
+    python -m benchmarks.load_test [--agents 20] [--jobs 5] [--flow both] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from eth_account import Account
+from eth_account.messages import encode_typed_data
+from web3 import Web3
+
+from payments.x402_auth import PAYMENT_AUTHORIZATION_TYPES, get_payment_domain
+from simchain.chain import SimulatedChain
+from simchain.node import SimulatedNode
+from config import CHAIN_ID, TOKEN_ADDRESS, TOKEN_DECIMALS, PAYMENT_RECIPIENT_ADDRESS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FLOWS = ["x402", "verify"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 of latencies in seconds, as milliseconds"""
+    ordered = sorted(samples)
+
+    def rank(q: float) -> Optional[float]:
+        if not ordered:
+            return None
+        return round(ordered[max(0, math.ceil(q * len(ordered)) - 1)] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": rank(0.50), "p95_ms": rank(0.95), "p99_ms": rank(0.99)}
+
+
+def sign_payment(account, amount_wei: int, job_id: str) -> str:
+    """X-PAYMENT header authorizing amount_wei for a job"""
+    now = int(time.time())
+    payment = {
+        "recipient": Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS),
+        "token": Web3.to_checksum_address(TOKEN_ADDRESS),
+        "amount": str(amount_wei),
+        "jobId": job_id,
+        "timestamp": now,
+        "validUntil": now + 300,
+    }
+    signed = account.sign_message(encode_typed_data(full_message={
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **PAYMENT_AUTHORIZATION_TYPES
+        },
+        "primaryType": "PaymentAuthorization",
+        "domain": get_payment_domain(),
+        "message": payment,
+    }))
+    return json.dumps({**payment, "chainId": CHAIN_ID, "signature": signed.signature.hex()})
+
+
+class LoadTest:
+    """Concurrent agents against one backend, recording each stage's latency"""
+
+    def __init__(self, api_url: str, chain: SimulatedChain, job: Dict[str, Any]):
+        self.api_url = api_url
+        self.chain = chain
+        self.job = job
+        # flow -> stage -> latencies (seconds)
+        self.latencies: Dict[str, Dict[str, List[float]]] = {flow: {} for flow in FLOWS}
+        self.completed = {flow: 0 for flow in FLOWS}
+        self.errors: Dict[str, int] = {}
+
+    def _record(self, flow: str, stage: str, started: float) -> float:
+        now = time.perf_counter()
+        self.latencies[flow].setdefault(stage, []).append(now - started)
+        return now
+
+    async def agent(self, session: aiohttp.ClientSession, account, flow: str, jobs: int, index: int):
+        for number in range(jobs):
+            try:
+                await self.run_job(session, account, flow, f"load-{index}-{number}-{time.time_ns()}")
+                self.completed[flow] += 1
+            except Exception as e:
+                error = f"{flow}: {type(e).__name__}: {e}"[:120]
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+    async def run_job(self, session: aiohttp.ClientSession, account, flow: str, job_id: str):
+        request = {**self.job, "wallet_address": account.address, "job_id": job_id}
+        started = stage = time.perf_counter()
+
+        async with session.post(f"{self.api_url}/api/jobs/request", json=request) as response:
+            if response.status != 402:
+                raise RuntimeError(f"quote returned {response.status}")
+            amount_wei = int((await response.json())["payment"]["amount_wei"])
+        stage = self._record(flow, "quote", stage)
+
+        if flow == "x402":
+            headers = {"X-PAYMENT": sign_payment(account, amount_wei, job_id)}
+            async with session.post(f"{self.api_url}/api/jobs/request", json=request, headers=headers) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"signed request returned {response.status}")
+            stage = self._record(flow, "authorize", stage)
+        else:
+            tx_hash = self.chain.send_transaction(account.address, "transfer", PAYMENT_RECIPIENT_ADDRESS, amount_wei)
+            while self.chain.receipt(tx_hash) is None:
+                await asyncio.sleep(0.01)
+            stage = self._record(flow, "pay", stage)
+            async with session.post(f"{self.api_url}/api/jobs/verify-payment", json={"job_id": job_id}) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"verify-payment returned {response.status}")
+            stage = self._record(flow, "verify", stage)
+
+        async with session.get(f"{self.api_url}/api/jobs/execute/{job_id}") as response:
+            if response.status != 200:
+                raise RuntimeError(f"execute returned {response.status}")
+            await response.content.readany()
+            stage = self._record(flow, "first_byte", stage)
+            await response.read()
+            self._record(flow, "stream", stage)
+
+        self._record(flow, "total", started)
+
+    def results(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "jobs_per_second": round(sum(self.completed.values()) / elapsed, 2),
+            "flows": {
+                flow: {
+                    "completed": self.completed[flow],
+                    "jobs_per_second": round(self.completed[flow] / elapsed, 2),
+                    "stages": {stage: percentiles(samples) for stage, samples in stages.items()},
+                }
+                for flow, stages in self.latencies.items() if self.completed[flow] or stages
+            },
+            "errors": self.errors,
+        }
+
+
+async def wait_for_server(url: str, server: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError("backend exited during startup")
+            try:
+                async with session.get(f"{url}/") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("backend did not start")
+
+
+async def run(args) -> Dict[str, Any]:
+    chain = SimulatedChain(block_time=args.block_time, seed=args.seed)
+    node = SimulatedNode(chain, TOKEN_ADDRESS, latency=args.rpc_latency, seed=args.seed)
+    await node.start()
+    miner = asyncio.create_task(chain.run())
+
+    port = _free_port()
+    api_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, BASE_RPC=node.http_url, PAYMENT_CHAINS=str(CHAIN_ID), PAYMENT_DETECTION="poll",
+               PROBE_ALLOW_PRIVATE="true")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=None if args.server_logs else subprocess.DEVNULL
+    )
+
+    try:
+        await wait_for_server(api_url, server)
+
+        # Keys are derived from the seed, and every payer is funded up front
+        accounts = [Account.from_key(Web3.keccak(text=f"load-{args.seed}-{index}")) for index in range(args.agents)]
+        for account in accounts:
+            chain.mint(account.address, 10**6 * 10**TOKEN_DECIMALS)
+        flows = FLOWS if args.flow == "both" else [args.flow]
+        params = json.loads(args.params) if args.params else {"host": "127.0.0.1", "port": port, "count": 1, "interval": 0}
+        load = LoadTest(api_url, chain, {"job_type": args.job, "params": params})
+
+        connector = aiohttp.TCPConnector(limit=args.agents * 2)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                load.agent(session, account, flows[index % len(flows)], args.jobs, index)
+                for index, account in enumerate(accounts)
+            ))
+            elapsed = time.perf_counter() - started
+
+        results = load.results(elapsed)
+        results["rpc_requests"] = node.requests
+    finally:
+        server.terminate()
+        server.wait()
+        miner.cancel()
+        await node.stop()
+
+    return {
+        "commit": _commit(),
+        "config": {
+            "agents": args.agents, "jobs": args.jobs, "flow": args.flow, "job": args.job,
+            "block_time": args.block_time, "rpc_latency": args.rpc_latency, "seed": args.seed,
+        },
+        **results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test of the paid job pipeline")
+    parser.add_argument("--agents", type=int, default=20, help="Concurrent agents")
+    parser.add_argument("--jobs", type=int, default=5, help="Jobs each agent runs, one after another")
+    parser.add_argument("--flow", choices=FLOWS + ["both"], default="both", help="Payment flow the agents use")
+    parser.add_argument("--job", default="tcp_probe", help="Job type to run")
+    parser.add_argument("--params", help="Job params as JSON (default: one TCP probe of the backend)")
+    parser.add_argument("--block-time", type=float, default=0.5, help="Seconds between simulated blocks")
+    parser.add_argument("--rpc-latency", type=float, default=0, help="Seconds added to every RPC request")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for agent keys and chain hashes")
+    parser.add_argument("--server-logs", action="store_true", help="Show the backend's stderr")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['jobs_per_second']:.2f} jobs/s over {results['elapsed_s']:.2f}s (commit {results['commit']})")
+    print(f"{'FLOW':<8} {'STAGE':<12} {'COUNT':>6} {'P50 ms':>9} {'P95 ms':>9} {'P99 ms':>9}")
+    for flow, result in results["flows"].items():
+        for stage, summary in result["stages"].items():
+            print(
+                f"{flow:<8} {stage:<12} {summary['count']:>6} {summary['p50_ms'] or 0:>9.2f} "
+                f"{summary['p95_ms'] or 0:>9.2f} {summary['p99_ms'] or 0:>9.2f}"
+            )
+    for error, count in results["errors"].items():
+        print(f"error x{count}: {error}")
+
+
+if __name__ == "__main__":
+    main()
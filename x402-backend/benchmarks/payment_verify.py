@@ -0,0 +1,126 @@
+"""
+Payment verification benchmark against the local simulated node.
+
+Scripted payers each send one transfer while the chain mines a block
+every --block-time seconds, and PaymentVerifier waits for all of them
+over JSON-RPC, as /api/jobs/verify-payment does. Reports how long after
+its block was mined each payment was verified, and how many RPC requests
+the node served per payment. Latency and error rates are injected by the
+node; a fixed --seed makes runs repeat.
+
+Run from the x402-backend directory:
+
+    python -m benchmarks.payment_verify [--payments 20] [--latency 0.05] [--error-rate 0.02]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from decimal import Decimal
+from typing import Dict
+
+from payments.base_token import PaymentVerifier
+from payments.log_stream import LogStream
+from simchain.chain import SimulatedChain
+from simchain.node import SimulatedNode
+from config import TOKEN_ADDRESS, TOKEN_DECIMALS, PAYMENT_RECIPIENT_ADDRESS
+
+PRICE = Decimal("0.01")
+
+# Payment detection modes (PAYMENT_DETECTION)
+SCENARIOS = ["poll", "subscribe"]
+
+
+async def run_scenario(detection: str, payments: int, block_time: float, latency: float,
+                       error_rate: float, seed: int) -> dict:
+    """Verify `payments` scripted transfers with one detection mode and summarize"""
+    chain = SimulatedChain(block_time=block_time, seed=seed)
+    node = SimulatedNode(chain, TOKEN_ADDRESS, latency=latency, error_rate=error_rate, seed=seed)
+    await node.start()
+    verifier = PaymentVerifier(rpc_url=node.http_url)
+
+    stream_task = None
+    if detection == "subscribe":
+        stream = LogStream(node.url, TOKEN_ADDRESS, verifier, reconnect_seconds=0.1)
+        verifier.source = stream
+        stream_task = asyncio.create_task(stream.run())
+        while not stream.live:
+            await asyncio.sleep(0.01)
+
+    mined_at: Dict[int, float] = {}
+    chain.listeners.append(lambda kind, number: mined_at.setdefault(number, time.perf_counter())
+                           if kind == "block" else None)
+
+    # Spread the transfers over the next few blocks
+    amount_wei = int(PRICE * 10**TOKEN_DECIMALS)
+    payers = [f"0x{index + 1:040x}" for index in range(payments)]
+    tx_hashes = {}
+    for index, payer in enumerate(payers):
+        chain.mint(payer, amount_wei)
+        block = chain.block_number + 1 + index % 5
+        tx_hashes[payer] = chain.script_transfer(block, payer, PAYMENT_RECIPIENT_ADDRESS, amount_wei)
+
+    requests_before = node.requests
+    miner = asyncio.create_task(chain.run())
+
+    async def verify(payer: str):
+        success, tx_hash = await verifier.verify_payment(payer, PRICE, timeout=60)
+        if not success or tx_hash != tx_hashes[payer]:
+            return None
+        return time.perf_counter() - mined_at[chain.receipt(tx_hash)["blockNumber"]]
+
+    latencies = await asyncio.gather(*(verify(payer) for payer in payers))
+    requests = node.requests - requests_before
+
+    for task in (miner, stream_task):
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    await node.stop()
+
+    verified = sorted(latency for latency in latencies if latency is not None)
+    return {
+        "verified": len(verified),
+        "median_ms": round(statistics.median(verified) * 1000, 1) if verified else None,
+        "p95_ms": round(verified[int(len(verified) * 0.95) - 1] * 1000, 1) if verified else None,
+        "rpc_per_payment": round(requests / payments, 1),
+        "rpc_errors": node.errors,
+    }
+
+
+async def run(args) -> dict:
+    return {
+        detection: await run_scenario(
+            detection, args.payments, args.block_time, args.latency, args.error_rate, args.seed
+        )
+        for detection in SCENARIOS
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payment verification benchmark on a simulated node")
+    parser.add_argument("--payments", type=int, default=20, help="Concurrent payments to verify")
+    parser.add_argument("--block-time", type=float, default=1, help="Seconds between blocks")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every RPC request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of RPC requests that fail")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for hashes and injected errors")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'DETECTION':<12} {'VERIFIED':>9} {'MEDIAN ms':>10} {'P95 ms':>8} {'RPC/PAYMENT':>12} {'ERRORS':>7}")
+    for name, result in results.items():
+        print(
+            f"{name:<12} {result['verified']:>9} {result['median_ms'] or 0:>10.1f} {result['p95_ms'] or 0:>8.1f} "
+            f"{result['rpc_per_payment']:>12.1f} {result['rpc_errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -6,15 +6,89 @@ from decimal import Decimal
 
 # Network Configuration
 BASE_SEPOLIA_RPC = os.getenv("BASE_RPC", "https://base-sepolia-rpc.publicnode.com")
-CHAIN_ID = 84532  # Base Sepolia
+SEPOLIA_RPC = os.getenv("SEPOLIA_RPC", "https://ethereum-sepolia-rpc.publicnode.com")
+# Websocket endpoints, for subscribing to payment logs (PAYMENT_DETECTION=subscribe)
+BASE_SEPOLIA_WS = os.getenv("BASE_WS", "wss://base-sepolia-rpc.publicnode.com")
+SEPOLIA_WS = os.getenv("SEPOLIA_WS", "wss://ethereum-sepolia-rpc.publicnode.com")
+CHAIN_ID = 84532  # Base Sepolia: the default chain (x402 signatures without a chainId)
 
 # Token Configuration
 TOKEN_ADDRESS = "0x7143401013282067926d25e316f055fF3bc6c3FD"    # Base Sepolia U Token
 TOKEN_DECIMALS = 18
 
+# U is a LayerZero OFT deployed on each of these chains (same decimals everywhere)
+U_TOKEN_CHAINS = {
+    84532: {"network": "Base Sepolia", "rpc": BASE_SEPOLIA_RPC, "ws": BASE_SEPOLIA_WS, "token": TOKEN_ADDRESS},
+    11155111: {
+        "network": "Sepolia", "rpc": SEPOLIA_RPC, "ws": SEPOLIA_WS,
+        "token": "0x3edEa36d049fFeF9Ac3fC3646227ca81C9A87118"
+    },
+}
+# Chains payments are accepted on (comma-separated chain IDs); payers use whichever suits them
+PAYMENT_CHAINS = {
+    int(chain_id): U_TOKEN_CHAINS[int(chain_id)]
+    for chain_id in os.getenv("PAYMENT_CHAINS", "84532,11155111").split(",") if chain_id.strip()
+}
+
 # Payment Configuration
 PAYMENT_TIMEOUT_SECONDS = int(os.getenv("PAYMENT_TIMEOUT", "300"))  # 5 minutes default
-PING_PRICE_U = Decimal("0.01")  # Price per ping in U tokens
+PING_PRICE_U = Decimal("0.0025")  # Price per ping packet in U tokens (default 4 packets: 0.01)
+BATCH_PING_PRICE_U = Decimal("0.008")  # Price per target in a batch ping
+TRACEROUTE_PRICE_U = Decimal("0.02")  # Price per traceroute / MTR cycle
+TCP_PROBE_PRICE_U = Decimal("0.00125")  # Price per TCP-connect attempt (default 4 attempts: 0.005)
+HTTP_PROBE_PRICE_U = Decimal("0.0025")  # Price per HTTP(S) probe attempt (default 4 attempts: 0.01)
+MAX_BATCH_JOBS = 256  # jobs covered by one batch authorization
+
+# Dynamic Pricing Configuration
+# Graduated volume tiers per job type: units from `first_unit` on cost `multiplier` x the unit price
+PRICE_TIERS = {
+    "ping": [(6, Decimal("0.8"))],
+    "batch_ping": [(11, Decimal("0.75")), (26, Decimal("0.5"))],
+}
+SURGE_CAPACITY = int(os.getenv("SURGE_CAPACITY", "64"))  # concurrent job streams counted as full load
+# Prices are multiplied by the highest level whose load (streams / SURGE_CAPACITY) is reached
+SURGE_LEVELS = [(0.5, Decimal("1.25")), (0.75, Decimal("1.5")), (1.0, Decimal("2"))]
+
+# Speculative Authorization Configuration (traditional ERC20 flow)
+# Jobs up to this price may start once their payment is seen, before it is mined (0 disables)
+SPECULATIVE_MAX_PRICE_U = Decimal(os.getenv("SPECULATIVE_MAX_PRICE", "0.05"))
+SPECULATIVE_WALLET_LIMIT_U = Decimal(os.getenv("SPECULATIVE_WALLET_LIMIT", "0.1"))  # unconfirmed payments per wallet
+SPECULATIVE_CONFIRM_SECONDS = 120  # a speculative payment must be mined within this
+SPECULATIVE_FLAG_SECONDS = 24 * 3600  # how long a flagged wallet is kept off speculative payments
+SPECULATIVE_WITHHOLD = os.getenv("SPECULATIVE_WITHHOLD", "false").lower() == "true"  # hold output until it is
+
+# Payment Confirmation Configuration
+# A policy is a block depth (0 = as soon as the transfer is mined) or "safe"/"finalized".
+# Job types set their own (Job.confirmations); CONFIRMATIONS overrides them, e.g. "traceroute=finalized,ping=1"
+CONFIRMATION_OVERRIDES = dict(
+    item.strip().split("=", 1) for item in os.getenv("CONFIRMATIONS", "").split(",") if "=" in item
+)
+SESSION_DEPOSIT_CONFIRMATIONS = os.getenv("SESSION_DEPOSIT_CONFIRMATIONS", "2")  # a deposit funds many jobs
+REORG_CHECK_SECONDS = 4  # how often accepted payments are re-checked until finalized
+PAYMENT_CLAIM_TTL_SECONDS = 24 * 3600  # a transfer that paid for something is refused again for this long
+
+# Payment Detection Configuration
+# "poll" polls each chain's RPC for Transfer logs; "subscribe" also streams them over
+# a websocket eth_subscribe and polls only while the subscription is down
+PAYMENT_DETECTION = os.getenv("PAYMENT_DETECTION", "poll")
+LOG_STREAM_BACKFILL_BLOCKS = 256  # blocks of logs fetched on first connect (and the longest gap backfilled)
+LOG_STREAM_REFETCH_BLOCKS = 16  # already-seen blocks re-fetched after a reconnect, in case of a reorg
+LOG_STREAM_RECONNECT_SECONDS = 1  # first reconnect delay, doubled per failure
+
+# Prepaid Session Configuration
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")  # HMAC key for session tokens (random per start if unset)
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL", "3600"))  # longest a session stays open
+SESSION_SETTLE_SECONDS = int(os.getenv("SESSION_SETTLE_INTERVAL", "60"))  # how often session spend is settled
+SESSION_NONCE_TTL_SECONDS = 600  # how long a deposit claim nonce can be used
+
+# Settlement Configuration
+# Account that collects x402-signed payments with transferFrom (payers approve it); empty disables settlement
+SETTLEMENT_PRIVATE_KEY = os.getenv("SETTLEMENT_PRIVATE_KEY", "")
+SETTLEMENT_INTERVAL_SECONDS = int(os.getenv("SETTLEMENT_INTERVAL", "30"))  # how often a batch is settled
+SETTLEMENT_BATCH_SIZE = 200  # authorizations per batch
+SETTLEMENT_MAX_ATTEMPTS = 5  # attempts per authorization before it is marked failed
+SETTLEMENT_RETRY_SECONDS = 15  # first retry delay, doubled per attempt
+SETTLEMENT_CONFIRM_SECONDS = 120  # how long a sent transfer may stay unmined
 
 # Wallet Configuration
 PAYMENT_RECIPIENT_ADDRESS = os.getenv("RECIPIENT_ADDRESS", "0x6b27b7af171b6042238f1034ef1815037ab9bfa5")
@@ -27,3 +101,70 @@ CORS_ORIGINS = ["*"]  # For development; restrict in production
 # Job Configuration
 MAX_PING_COUNT = 10
 PING_TIMEOUT = 5  # seconds per ping
+MAX_BATCH_HOSTS = 50  # targets per batch ping
+MAX_BATCH_PARALLELISM = 16  # concurrent pings per batch
+DEFAULT_BATCH_PARALLELISM = 8
+MAX_TRACE_HOPS = 30
+MAX_MTR_CYCLES = 10
+MAX_PROBE_COUNT = 10  # attempts per TCP/HTTP probe job
+MAX_PROBE_INTERVAL = 5  # seconds between probe attempts
+PROBE_TIMEOUT = 5  # seconds per TCP/HTTP probe attempt
+HTTP_PROBE_MAX_BODY = 1024 * 1024  # bytes read per HTTP response
+HTTP_PROBE_KEEPALIVE = os.getenv("HTTP_PROBE_KEEPALIVE", "false").lower() == "true"  # default for 'keepalive'
+# Let probes connect to loopback, private and link-local addresses (for tests only:
+# otherwise anyone who pays can reach the backend's own admin API and internal hosts)
+PROBE_ALLOW_PRIVATE = os.getenv("PROBE_ALLOW_PRIVATE", "false").lower() == "true"
+HTTP_POOL_MAX_PER_ORIGIN = 4  # idle pooled connections kept per origin
+HTTP_POOL_IDLE_SECONDS = 30  # idle pooled connections are closed after this
+DNS_CACHE_TTL = int(os.getenv("DNS_CACHE_TTL", "60"))  # seconds a resolved name is reused
+DNS_NEGATIVE_TTL = 5  # seconds a failed lookup is remembered (cap)
+DNS_CACHE_MAX_ENTRIES = 10000
+RESULT_CACHE_TTL = 10  # default age of a cached probe result a client opting in accepts
+RESULT_CACHE_MAX_STALENESS = 60  # oldest cached probe result a client may ask for via 'max_age'
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # recorded output kept
+
+# Job Discovery Configuration
+JOB_MANIFEST = os.getenv("JOB_MANIFEST", os.path.join(os.path.dirname(__file__), "jobs", "manifest.json"))
+# Job types imported at startup ("*" for all); the rest load on first use
+PRELOAD_JOBS = [name.strip() for name in os.getenv("PRELOAD_JOBS", "").split(",") if name.strip()]
+
+# Job Runner Configuration
+JOB_RUNNER = os.getenv("JOB_RUNNER", "inline")  # "inline" (API process), "pool" (worker processes) or "remote" (worker nodes)
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", str(os.cpu_count() or 2)))
+JOB_CPU_SECONDS = int(os.getenv("JOB_CPU_SECONDS", "30"))  # CPU time per job in a worker
+JOB_MEMORY_MB = int(os.getenv("JOB_MEMORY_MB", "1024"))  # address space per worker
+JOB_WALL_SECONDS = int(os.getenv("JOB_WALL_SECONDS", "120"))  # wall-clock cap per job (every runner)
+
+# Remote Worker Dispatch Configuration (JOB_RUNNER=remote)
+DISPATCH_QUEUE = os.getenv("DISPATCH_QUEUE", "memory")  # "memory" or "sqlite:<path>"
+DISPATCH_LEASE_SECONDS = 15  # a worker must heartbeat within this
+DISPATCH_HEARTBEAT_SECONDS = 5
+DISPATCH_MAX_ATTEMPTS = 3  # dispatches per job before it fails
+DISPATCH_POLL_INTERVAL = 0.05  # seconds between output polls for SQLite queues
+WORKER_TOKEN = os.getenv("WORKER_TOKEN", "")  # shared secret for worker endpoints; empty disables them
+
+# Tracing Configuration
+# Spans go to "file:<path>" (JSON lines) or "otlp:<url>" (an OTLP/HTTP JSON collector); empty disables tracing
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))  # share of traces recorded when the client sent no sampled trace
+TRACE_FLUSH_SECONDS = 5  # how often finished spans are exported
+TRACE_MAX_PENDING_SPANS = 10000  # finished spans held between exports (the oldest are dropped)
+
+# Runtime Diagnostics Configuration
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # shared secret for /api/admin endpoints; empty disables them
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "false").lower() == "true"  # watch event-loop lag from startup
+LOOP_MONITOR_INTERVAL = 0.25  # seconds between lag measurements
+LOOP_SLOW_SECONDS = float(os.getenv("LOOP_SLOW_SECONDS", "0.1"))  # a loop blocked this long has its stack logged
+PROFILE_INTERVAL = 0.005  # default seconds between profiler samples
+PROFILE_MAX_SECONDS = 60  # longest profile one request may take
+
+# Logging Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = 10000  # records waiting for the log writer thread; more are dropped, never waited for
+# Share of an event's records written, e.g. "payment_verified=0.1" (events not listed are all written)
+LOG_SAMPLE_RATES = {
+    event.strip(): float(rate)
+    for event, rate in (item.split("=", 1) for item in os.getenv("LOG_SAMPLE_RATES", "").split(",") if "=" in item)
+}
+LOG_RATE_LIMIT = 10  # warnings and errors written per event per window; the rest are only counted
+LOG_RATE_WINDOW_SECONDS = 60
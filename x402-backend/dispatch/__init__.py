@@ -0,0 +1 @@
+# Dispatch package
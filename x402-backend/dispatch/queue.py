@@ -0,0 +1,381 @@
+"""
+Pull-based job dispatch queues with leases, heartbeats and re-dispatch
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from config import DISPATCH_LEASE_SECONDS, DISPATCH_MAX_ATTEMPTS
+
+# Task states
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class DispatchQueue(ABC):
+    """
+    Queue of authorized jobs pulled by worker nodes.
+
+    A worker leases a task for `lease_seconds` and must heartbeat before
+    the lease runs out; a task whose lease expires is re-queued (with a
+    'redispatch' marker in its output) until it has been attempted
+    `max_attempts` times. Output is an append-only log the API relays to
+    the SSE client with a cursor.
+    """
+
+    def __init__(self, lease_seconds: float = DISPATCH_LEASE_SECONDS,
+                 max_attempts: int = DISPATCH_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    # API side
+
+    @abstractmethod
+    async def enqueue(self, task_id: str, job_name: str, params: Dict[str, Any]):
+        """Add an authorized job"""
+        pass
+
+    @abstractmethod
+    async def read_output(self, task_id: str, cursor: int) -> Tuple[List[Any], int, str, Optional[str]]:
+        """Return (outputs after cursor, new cursor, status, error)"""
+        pass
+
+    @abstractmethod
+    async def cancel(self, task_id: str):
+        """Stop a task whose client went away"""
+        pass
+
+    @abstractmethod
+    async def requeue_expired(self) -> int:
+        """Re-dispatch tasks whose lease expired; returns the number affected"""
+        pass
+
+    @abstractmethod
+    async def forget(self, task_id: str):
+        """Drop a finished task"""
+        pass
+
+    async def wait_for_change(self, task_id: str, timeout: float):
+        """Wait until a task may have new output (polls by default)"""
+        await asyncio.sleep(timeout)
+
+    # Worker side
+
+    @abstractmethod
+    async def lease(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued task, or None"""
+        pass
+
+    @abstractmethod
+    async def heartbeat(self, task_id: str, worker_id: str) -> bool:
+        """Extend a lease; False means the worker no longer owns the task"""
+        pass
+
+    @abstractmethod
+    async def append_output(self, task_id: str, worker_id: str, outputs: List[Any]) -> bool:
+        """Append output for a leased task; False means the lease was lost"""
+        pass
+
+    @abstractmethod
+    async def complete(self, task_id: str, worker_id: str, error: Optional[str] = None) -> bool:
+        """Mark a leased task done (or failed with error)"""
+        pass
+
+
+class MemoryQueue(DispatchQueue):
+    """In-process queue; remote workers reach it through the API's worker endpoints"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._ready: deque = deque()
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    async def enqueue(self, task_id: str, job_name: str, params: Dict[str, Any]):
+        self._tasks[task_id] = {
+            "task_id": task_id, "job_name": job_name, "params": params,
+            "status": QUEUED, "attempt": 0, "worker_id": None, "lease_expires": 0.0,
+            "error": None, "outputs": [],
+        }
+        self._changed[task_id] = asyncio.Event()
+        self._ready.append(task_id)
+
+    async def read_output(self, task_id, cursor):
+        task = self._tasks.get(task_id)
+        if task is None:
+            return [], cursor, FAILED, "Unknown task"
+        outputs = task["outputs"][cursor:]
+        return outputs, cursor + len(outputs), task["status"], task["error"]
+
+    async def cancel(self, task_id):
+        task = self._tasks.get(task_id)
+        if task and task["status"] not in FINISHED:
+            task["status"] = CANCELLED
+            self._notify(task_id)
+
+    async def requeue_expired(self):
+        now = time.time()
+        count = 0
+        for task in self._tasks.values():
+            if task["status"] == LEASED and task["lease_expires"] < now:
+                self._expire(task)
+                count += 1
+        return count
+
+    def _expire(self, task):
+        task["worker_id"] = None
+        if task["attempt"] >= self.max_attempts:
+            task["status"] = FAILED
+            task["error"] = f"Job failed after {task['attempt']} attempts (worker lost)"
+        else:
+            task["status"] = QUEUED
+            task["outputs"].append({"type": "redispatch", "attempt": task["attempt"] + 1})
+            self._ready.append(task["task_id"])
+        self._notify(task["task_id"])
+
+    async def lease(self, worker_id):
+        while self._ready:
+            task = self._tasks.get(self._ready.popleft())
+            if task is None or task["status"] != QUEUED:
+                continue
+            task["status"] = LEASED
+            task["attempt"] += 1
+            task["worker_id"] = worker_id
+            task["lease_expires"] = time.time() + self.lease_seconds
+            return {key: task[key] for key in ("task_id", "job_name", "params", "attempt")}
+        return None
+
+    def _owned(self, task_id, worker_id) -> Optional[Dict[str, Any]]:
+        task = self._tasks.get(task_id)
+        if task and task["status"] == LEASED and task["worker_id"] == worker_id:
+            return task
+        return None
+
+    async def heartbeat(self, task_id, worker_id):
+        task = self._owned(task_id, worker_id)
+        if task is None:
+            return False
+        task["lease_expires"] = time.time() + self.lease_seconds
+        return True
+
+    async def append_output(self, task_id, worker_id, outputs):
+        task = self._owned(task_id, worker_id)
+        if task is None:
+            return False
+        task["outputs"].extend(outputs)
+        self._notify(task_id)
+        return True
+
+    async def complete(self, task_id, worker_id, error=None):
+        task = self._owned(task_id, worker_id)
+        if task is None:
+            return False
+        task["status"] = FAILED if error else DONE
+        task["error"] = error
+        self._notify(task_id)
+        return True
+
+    async def forget(self, task_id: str):
+        """Drop a finished task"""
+        self._tasks.pop(task_id, None)
+        self._changed.pop(task_id, None)
+
+    def _notify(self, task_id: str):
+        event = self._changed.get(task_id)
+        if event:
+            event.set()
+
+    async def wait_for_change(self, task_id, timeout):
+        event = self._changed.setdefault(task_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+
+class SQLiteQueue(DispatchQueue):
+    """
+    Queue in a SQLite file, shared by processes on one host (API replicas
+    and local workers). Calls run in a thread so they don't block the loop.
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        db = self._connect()
+        try:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    job_name TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempt INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, created);
+                CREATE TABLE IF NOT EXISTS outputs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS outputs_task ON outputs (task_id, id);
+            """)
+        finally:
+            db.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    async def _run(self, fn, *args):
+        def call():
+            db = self._connect()
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                result = fn(db, *args)
+                db.execute("COMMIT")
+                return result
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            finally:
+                db.close()
+        return await asyncio.to_thread(call)
+
+    async def enqueue(self, task_id, job_name, params):
+        def op(db):
+            db.execute(
+                "INSERT INTO tasks (task_id, job_name, params, status, created) VALUES (?, ?, ?, ?, ?)",
+                (task_id, job_name, json.dumps(params), QUEUED, time.time())
+            )
+        await self._run(op)
+
+    async def read_output(self, task_id, cursor):
+        def op(db):
+            row = db.execute("SELECT status, error FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                return [], cursor, FAILED, "Unknown task"
+            rows = db.execute(
+                "SELECT id, payload FROM outputs WHERE task_id = ? AND id > ? ORDER BY id",
+                (task_id, cursor)
+            ).fetchall()
+            new_cursor = rows[-1][0] if rows else cursor
+            return [json.loads(payload) for _, payload in rows], new_cursor, row[0], row[1]
+        return await self._run(op)
+
+    async def cancel(self, task_id):
+        def op(db):
+            db.execute(
+                f"UPDATE tasks SET status = ? WHERE task_id = ? AND status NOT IN {FINISHED}",
+                (CANCELLED, task_id)
+            )
+        await self._run(op)
+
+    async def requeue_expired(self):
+        def op(db):
+            expired = db.execute(
+                "SELECT task_id, attempt FROM tasks WHERE status = ? AND lease_expires < ?",
+                (LEASED, time.time())
+            ).fetchall()
+            for task_id, attempt in expired:
+                if attempt >= self.max_attempts:
+                    db.execute(
+                        "UPDATE tasks SET status = ?, worker_id = NULL, error = ? WHERE task_id = ?",
+                        (FAILED, f"Job failed after {attempt} attempts (worker lost)", task_id)
+                    )
+                else:
+                    db.execute(
+                        "UPDATE tasks SET status = ?, worker_id = NULL, created = ? WHERE task_id = ?",
+                        (QUEUED, time.time(), task_id)
+                    )
+                    db.execute(
+                        "INSERT INTO outputs (task_id, payload) VALUES (?, ?)",
+                        (task_id, json.dumps({"type": "redispatch", "attempt": attempt + 1}))
+                    )
+            return len(expired)
+        return await self._run(op)
+
+    async def lease(self, worker_id):
+        def op(db):
+            row = db.execute(
+                "SELECT task_id, job_name, params, attempt FROM tasks WHERE status = ? ORDER BY created LIMIT 1",
+                (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            task_id, job_name, params, attempt = row
+            db.execute(
+                "UPDATE tasks SET status = ?, attempt = ?, worker_id = ?, lease_expires = ? WHERE task_id = ?",
+                (LEASED, attempt + 1, worker_id, time.time() + self.lease_seconds, task_id)
+            )
+            return {"task_id": task_id, "job_name": job_name, "params": json.loads(params), "attempt": attempt + 1}
+        return await self._run(op)
+
+    def _owned(self, db, task_id, worker_id) -> bool:
+        row = db.execute(
+            "SELECT 1 FROM tasks WHERE task_id = ? AND status = ? AND worker_id = ?",
+            (task_id, LEASED, worker_id)
+        ).fetchone()
+        return row is not None
+
+    async def heartbeat(self, task_id, worker_id):
+        def op(db):
+            if not self._owned(db, task_id, worker_id):
+                return False
+            db.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE task_id = ?",
+                (time.time() + self.lease_seconds, task_id)
+            )
+            return True
+        return await self._run(op)
+
+    async def append_output(self, task_id, worker_id, outputs):
+        def op(db):
+            if not self._owned(db, task_id, worker_id):
+                return False
+            db.executemany(
+                "INSERT INTO outputs (task_id, payload) VALUES (?, ?)",
+                [(task_id, json.dumps(output)) for output in outputs]
+            )
+            return True
+        return await self._run(op)
+
+    async def complete(self, task_id, worker_id, error=None):
+        def op(db):
+            if not self._owned(db, task_id, worker_id):
+                return False
+            db.execute(
+                "UPDATE tasks SET status = ?, error = ? WHERE task_id = ?",
+                (FAILED if error else DONE, error, task_id)
+            )
+            return True
+        return await self._run(op)
+
+    async def forget(self, task_id: str):
+        """Drop a finished task and its output"""
+        def op(db):
+            db.execute("DELETE FROM outputs WHERE task_id = ?", (task_id,))
+            db.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+        await self._run(op)
+
+
+def create_queue(spec: str) -> DispatchQueue:
+    """Build a queue from a DISPATCH_QUEUE spec: 'memory' or 'sqlite:<path>'"""
+    if spec == "memory":
+        return MemoryQueue()
+    if spec.startswith("sqlite:"):
+        return SQLiteQueue(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown dispatch queue: {spec}")
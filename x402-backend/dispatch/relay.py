@@ -0,0 +1,66 @@
+"""
+API-side relay: put authorized jobs on the dispatch queue and stream their output
+"""
+import asyncio
+from typing import AsyncIterator
+from jobs.base import Job, JobOutput, job_executions
+from telemetry.logs import get_logger
+from config import DISPATCH_POLL_INTERVAL
+from .queue import DispatchQueue, DONE, FINISHED, LEASED
+
+log = get_logger("dispatch.relay")
+
+
+class DispatchError(Exception):
+    """Raised when a dispatched job fails, is cancelled or loses all its workers"""
+
+
+class Dispatcher:
+    """Runs jobs on remote worker nodes through a DispatchQueue"""
+
+    def __init__(self, queue: DispatchQueue, poll_interval: float = DISPATCH_POLL_INTERVAL):
+        self.queue = queue
+        self.poll_interval = poll_interval
+
+    async def run(self, job: Job) -> AsyncIterator[JobOutput]:
+        """Enqueue a job and yield its output as workers report it"""
+        task_id = job.job_id
+        await self.queue.enqueue(task_id, job.get_name(), job.params)
+
+        cursor = 0
+        status = None
+        running = False
+        try:
+            while True:
+                outputs, cursor, status, error = await self.queue.read_output(task_id, cursor)
+                # Running while a worker holds the lease (not while queued or re-queued)
+                if running != (status == LEASED):
+                    running = not running
+                    job_executions.running += 1 if running else -1
+                for output in outputs:
+                    yield output
+
+                if status == DONE:
+                    return
+                if status in FINISHED:
+                    raise DispatchError(error or f"Job {status}")
+
+                await self.queue.wait_for_change(task_id, self.poll_interval)
+        except (asyncio.CancelledError, GeneratorExit):
+            job_executions.cancelled += 1
+            raise
+        finally:
+            if running:
+                job_executions.running -= 1
+            # The client went away: tell the worker to stop
+            if status not in FINISHED:
+                await self.queue.cancel(task_id)
+            await self.queue.forget(task_id)
+
+    async def reap_expired_leases(self):
+        """Background task: re-dispatch jobs whose worker stopped heartbeating"""
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            requeued = await self.queue.requeue_expired()
+            if requeued:
+                log.warning("jobs_redispatched", count=requeued)
@@ -0,0 +1,176 @@
+"""
+Worker node: pulls jobs from the dispatch queue, runs them and streams output back.
+
+Run on any node that can reach the API (from the x402-backend directory):
+
+    python -m dispatch.worker --api http://api-host:8989 --token $WORKER_TOKEN
+
+or, for local testing against a shared SQLite queue:
+
+    python -m dispatch.worker --queue sqlite:/tmp/x402-dispatch.db
+"""
+import argparse
+import asyncio
+import os
+import socket
+import uuid
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from jobs.registry import job_registry
+from telemetry.logs import get_logger
+from config import DISPATCH_HEARTBEAT_SECONDS
+from .queue import create_queue
+
+log = get_logger("dispatch.worker")
+
+
+class HttpQueueClient:
+    """Worker-side view of the API's dispatch queue over its /api/workers endpoints"""
+
+    def __init__(self, api_url: str, token: str):
+        self.api_url = api_url.rstrip("/")
+        self.headers = {"X-WORKER-TOKEN": token}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _post(self, path: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(headers=self.headers)
+        async with self._session.post(f"{self.api_url}{path}", json=body) as response:
+            if response.status == 204:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def lease(self, worker_id):
+        return await self._post("/api/workers/lease", {"worker_id": worker_id})
+
+    async def heartbeat(self, task_id, worker_id):
+        result = await self._post(f"/api/workers/tasks/{task_id}/heartbeat", {"worker_id": worker_id})
+        return result["ok"]
+
+    async def append_output(self, task_id, worker_id, outputs):
+        result = await self._post(
+            f"/api/workers/tasks/{task_id}/output", {"worker_id": worker_id, "outputs": outputs}
+        )
+        return result["ok"]
+
+    async def complete(self, task_id, worker_id, error=None):
+        result = await self._post(
+            f"/api/workers/tasks/{task_id}/complete", {"worker_id": worker_id, "error": error}
+        )
+        return result["ok"]
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+
+
+class WorkerNode:
+    """Leases jobs one at a time per slot and keeps each lease alive with heartbeats"""
+
+    def __init__(self, queue, worker_id: Optional[str] = None, concurrency: int = 1,
+                 heartbeat_seconds: float = DISPATCH_HEARTBEAT_SECONDS, idle_seconds: float = 0.5):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.concurrency = concurrency
+        self.heartbeat_seconds = heartbeat_seconds
+        self.idle_seconds = idle_seconds
+
+    async def run_forever(self):
+        """Run `concurrency` lease loops until cancelled"""
+        await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+
+    async def _slot(self):
+        while True:
+            try:
+                task = await self.queue.lease(self.worker_id)
+            except (aiohttp.ClientError, OSError) as e:
+                log.warning("lease_failed", worker_id=self.worker_id, error=str(e))
+                task = None
+
+            if task is None:
+                await asyncio.sleep(self.idle_seconds)
+                continue
+
+            try:
+                await self.run_task(task)
+            except Exception as e:
+                # Losing the API mid-task must not take the other slots down with it
+                log.warning("task_failed", worker_id=self.worker_id, task_id=task["task_id"], error=str(e))
+
+    async def run_task(self, task: Dict[str, Any]):
+        """Run one leased task, stopping early if the lease is lost"""
+        task_id = task["task_id"]
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(task_id, lease_lost))
+        outputs = None
+
+        try:
+            job_class = job_registry.get_job_class(task["job_name"])
+            if not job_class:
+                await self.queue.complete(task_id, self.worker_id, error=f"Unknown job type: {task['job_name']}")
+                return
+
+            job = job_class(job_id=task_id, params=task["params"])
+            outputs = job.run()
+            async for output in outputs:
+                if lease_lost.is_set() or not await self.queue.append_output(task_id, self.worker_id, [output]):
+                    # Cancelled by the client or re-dispatched elsewhere
+                    return
+
+            await self.queue.complete(task_id, self.worker_id)
+        except Exception as e:
+            if not lease_lost.is_set():
+                await self.queue.complete(task_id, self.worker_id, error=str(e))
+        finally:
+            heartbeat.cancel()
+            if outputs is not None:
+                # Stopping early leaves the job suspended; close it so its processes are killed
+                await outputs.aclose()
+
+    async def _heartbeat(self, task_id: str, lease_lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                if not await self.queue.heartbeat(task_id, self.worker_id):
+                    lease_lost.set()
+                    return
+            except (aiohttp.ClientError, OSError) as e:
+                # Keep trying; the lease survives a few missed beats
+                log.warning("heartbeat_failed", worker_id=self.worker_id, task_id=task_id, error=str(e))
+
+
+async def _main(args):
+    if args.api:
+        queue = HttpQueueClient(args.api, args.token or os.getenv("WORKER_TOKEN", ""))
+    else:
+        queue = create_queue(args.queue)
+
+    node = WorkerNode(queue, concurrency=args.concurrency)
+    log.info("worker_started", worker_id=node.worker_id, slots=args.concurrency)
+    try:
+        await node.run_forever()
+    finally:
+        if isinstance(queue, HttpQueueClient):
+            await queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="x402 job worker node")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--api", help="API base URL (uses the /api/workers endpoints)")
+    source.add_argument("--queue", help="Direct queue spec, e.g. sqlite:/tmp/x402-dispatch.db")
+    parser.add_argument("--token", help="Worker token (default: WORKER_TOKEN env)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs run at once")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
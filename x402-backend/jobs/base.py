@@ -1,14 +1,72 @@
 """
 Base class for all executable jobs
 """
+import asyncio
 from abc import ABC, abstractmethod
-from typing import AsyncIterator, Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional, Pattern, Union
 from decimal import Decimal
+from config import JOB_WALL_SECONDS
+from telemetry.tracing import tracer
+
+# Output formats a job can stream: typed JSON events or raw text lines
+OUTPUT_FORMATS = ("events", "text")
+
+# Client cache-control params; they never change what a job does
+CACHE_PARAMS = ("cache", "max_age")
+
+# A job yields either a text chunk or a typed event dict with a "type" key
+JobOutput = Union[str, Dict[str, Any]]
+
+
+class JobTimeoutError(Exception):
+    """Raised when a job runs past its time limit"""
+
+
+class ExecutionCounters:
+    """
+    Counters for job executions in this process. "running" also counts
+    jobs this process has handed to its worker pool or remote workers.
+    """
+
+    def __init__(self):
+        self.running = 0
+        self.streams = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.processes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "streams": self.streams,
+            "cancelled": self.cancelled,
+            "timed_out": self.timed_out,
+            "processes": self.processes,
+        }
 
 
 class Job(ABC):
     """Abstract base class for jobs"""
 
+    # What get_price() is charged per ("job", or e.g. "target" for batches),
+    # and the most units one job can have (the size of its price table)
+    price_unit = "job"
+    max_units = 1
+
+    # Result caching: a client sending 'cache': true accepts a recorded
+    # result up to cache_ttl seconds old, or up to its own 'max_age'
+    # (at most max_staleness). 0 means results are never reused.
+    cache_ttl = 0
+    max_staleness = 0
+
+    # Text output lines that report a failed run (typed "error" events
+    # always do). Runs that fail are never recorded in the result cache.
+    text_failure: Optional[Pattern[str]] = None
+
+    # Confirmations the job's on-chain payment needs before it runs: a block
+    # depth (0 = once mined) or "safe" / "finalized" (see payments.confirmations)
+    confirmations = 1
+
     def __init__(self, job_id: str, params: Dict[str, Any]):
         self.job_id = job_id
         self.params = params
@@ -25,11 +83,120 @@ class Job(ABC):
         """Return the price for this job in U tokens"""
         pass
 
+    def units(self) -> int:
+        """
+        Return how many price units this job instance uses (see payments.pricing).
+        Defaults to one per job; override when the work depends on params.
+        """
+        return 1
+
+    @property
+    def output_format(self) -> str:
+        """Requested output format ('events' by default, 'text' for raw output)"""
+        return self.params.get("format", "events")
+
+    def validate_format(self) -> tuple[bool, str]:
+        """Validate the common 'format' parameter"""
+        if self.output_format not in OUTPUT_FORMATS:
+            return False, f"Format must be one of: {', '.join(OUTPUT_FORMATS)}"
+        return True, ""
+
+    def normalized_params(self) -> Dict[str, Any]:
+        """Params that determine the job's output (the result cache key)"""
+        params = {key: value for key, value in self.params.items() if key not in CACHE_PARAMS}
+        params["format"] = self.output_format
+        return params
+
+    def accepted_age(self) -> Optional[float]:
+        """How old a cached result the client accepts, or None if it didn't opt in"""
+        if not self.cache_ttl or not self.params.get("cache"):
+            return None
+        return self.params.get("max_age", self.cache_ttl)
+
+    def validate_cache_params(self) -> tuple[bool, str]:
+        """Validate the common 'cache' and 'max_age' parameters"""
+        cache = self.params.get("cache", False)
+        max_age = self.params.get("max_age")
+
+        if not isinstance(cache, bool):
+            return False, "'cache' must be true or false"
+
+        if max_age is not None:
+            if not self.cache_ttl:
+                return False, f"Job type {self.get_name()} does not serve cached results"
+            if isinstance(max_age, bool) or not isinstance(max_age, (int, float)) \
+                    or max_age < 0 or max_age > self.max_staleness:
+                return False, f"max_age must be between 0 and {self.max_staleness} seconds"
+
+        return True, ""
+
+    def is_failure(self, output: JobOutput) -> bool:
+        """Whether one output reports that this run failed"""
+        if isinstance(output, dict):
+            return output["type"] == "error"
+        return self.text_failure is not None and self.text_failure.search(output) is not None
+
+    def time_limit(self) -> float:
+        """
+        Wall-clock seconds this job may run for.
+        Override with a tighter bound derived from the params.
+        """
+        return JOB_WALL_SECONDS
+
+    def validate_time_limit(self) -> tuple[bool, str]:
+        """Reject params whose time limit exceeds the per-job wall-clock cap"""
+        limit = self.time_limit()
+        if limit > JOB_WALL_SECONDS:
+            return False, f"Job would need up to {limit:g}s, over the {JOB_WALL_SECONDS}s limit per job"
+        return True, ""
+
+    async def run(self) -> AsyncIterator[JobOutput]:
+        """
+        Execute the job under its time limit. This is how runners call a job.
+
+        Past the deadline the pending step of execute() is cancelled and
+        JobTimeoutError is raised. If the consumer is cancelled or stops
+        iterating, execute() is closed straight away. Either way the
+        job's finally blocks run, and any processes it started are killed.
+        Within a traced request, execution is a "Job.execute" span.
+        """
+        loop = asyncio.get_running_loop()
+        limit = min(self.time_limit(), JOB_WALL_SECONDS)
+        deadline = loop.time() + limit
+        outputs = self.execute()
+        finished = False
+        job_executions.running += 1
+
+        with tracer.child("Job.execute", job_id=self.job_id, job_type=self.get_name()) as span:
+            try:
+                while True:
+                    try:
+                        # wait_for runs each step in a task that copies the current context
+                        output = await asyncio.wait_for(outputs.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        finished = True
+                        return
+                    except asyncio.TimeoutError:
+                        finished = True
+                        job_executions.timed_out += 1
+                        span.set_attribute("timed_out", True)
+                        raise JobTimeoutError(f"Job exceeded its {limit:g}s time limit")
+                    yield output
+            except Exception:
+                finished = True
+                raise
+            finally:
+                job_executions.running -= 1
+                if not finished:
+                    job_executions.cancelled += 1
+                await outputs.aclose()
+
     @abstractmethod
-    async def execute(self) -> AsyncIterator[str]:
+    async def execute(self) -> AsyncIterator[JobOutput]:
         """
         Execute the job and yield results as they become available.
-        This is a generator that streams output.
+        This is a generator that streams output: text chunks, or event
+        dicts (with a "type" key) when the job runs in 'events' format.
         """
         pass
 
@@ -40,3 +207,7 @@ class Job(ABC):
         Returns: (is_valid, error_message)
         """
         pass
+
+
+# Global execution counters for this process
+job_executions = ExecutionCounters()
@@ -0,0 +1,141 @@
+"""
+Batch ping job: probe many hosts concurrently under one payment
+"""
+import asyncio
+import math
+import re
+from typing import AsyncIterator, Dict, Any, List
+from decimal import Decimal
+from .base import Job, JobOutput
+from .ping import PingJob
+from config import (
+    BATCH_PING_PRICE_U,
+    MAX_BATCH_HOSTS,
+    MAX_BATCH_PARALLELISM,
+    DEFAULT_BATCH_PARALLELISM,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_STALENESS
+)
+
+# Marks the end of one host's output on the shared queue
+_DONE = object()
+
+
+class BatchPingJob(Job):
+    """Ping a list of hosts concurrently and interleave their results on one stream"""
+
+    price_unit = "target"
+    max_units = MAX_BATCH_HOSTS
+    cache_ttl = RESULT_CACHE_TTL
+    max_staleness = RESULT_CACHE_MAX_STALENESS
+    # A host's ping error, behind its "[host] " line prefix
+    text_failure = re.compile(r"^\[[^\]]*\] Error", re.MULTILINE)
+
+    @classmethod
+    def get_name(cls) -> str:
+        return "batch_ping"
+
+    @classmethod
+    def get_price(cls) -> Decimal:
+        return BATCH_PING_PRICE_U
+
+    def units(self) -> int:
+        """Price scales with the number of targets"""
+        return len(self.params.get("hosts") or [])
+
+    def validate_params(self) -> tuple[bool, str]:
+        """Validate batch ping parameters"""
+        hosts = self.params.get("hosts")
+        parallelism = self.params.get("parallelism", DEFAULT_BATCH_PARALLELISM)
+
+        if not isinstance(hosts, list) or not hosts or not all(isinstance(host, str) for host in hosts):
+            return False, "Missing 'hosts' parameter (list of hosts)"
+
+        if len(hosts) > MAX_BATCH_HOSTS:
+            return False, f"At most {MAX_BATCH_HOSTS} hosts per batch"
+
+        if len(set(hosts)) != len(hosts):
+            return False, "Duplicate hosts in batch"
+
+        if not isinstance(parallelism, int) or parallelism < 1 or parallelism > MAX_BATCH_PARALLELISM:
+            return False, f"Parallelism must be between 1 and {MAX_BATCH_PARALLELISM}"
+
+        # Each target must be a valid ping job on its own
+        for job in self._host_jobs():
+            is_valid, error_msg = job.validate_params()
+            if not is_valid:
+                return False, error_msg
+
+        return True, ""
+
+    def time_limit(self) -> float:
+        """Hosts run in waves of `parallelism` pings"""
+        jobs = self._host_jobs()
+        parallelism = self.params.get("parallelism", DEFAULT_BATCH_PARALLELISM)
+        return math.ceil(len(jobs) / parallelism) * jobs[0].time_limit()
+
+    def validate_time_limit(self) -> tuple[bool, str]:
+        """Say which params bring an over-long batch back under the cap"""
+        is_valid, error_msg = super().validate_time_limit()
+        if not is_valid:
+            return False, f"{error_msg}; use fewer hosts, a lower count or more parallelism"
+        return True, ""
+
+    def _host_jobs(self) -> List[PingJob]:
+        """One ping job per target, sharing count and format"""
+        params = {key: value for key, value in self.params.items() if key in ("count", "format")}
+        return [
+            PingJob(job_id=f"{self.job_id}:{host}", params={**params, "host": host})
+            for host in self.params.get("hosts", [])
+        ]
+
+    async def execute(self) -> AsyncIterator[JobOutput]:
+        """Run host pings under a parallelism limit and yield output as it arrives"""
+        jobs = self._host_jobs()
+        parallelism = self.params.get("parallelism", DEFAULT_BATCH_PARALLELISM)
+        semaphore = asyncio.Semaphore(parallelism)
+        queue: asyncio.Queue = asyncio.Queue()
+        text = self.output_format == "text"
+
+        async def run(job: PingJob):
+            host = job.params["host"]
+            try:
+                async with semaphore:
+                    async for output in job.execute():
+                        if text:
+                            output = "".join(f"[{host}] {line}" for line in output.splitlines(keepends=True))
+                        await queue.put(output)
+            finally:
+                await queue.put(_DONE)
+
+        if text:
+            yield f"Starting batch ping of {len(jobs)} hosts (parallelism {parallelism})...\n"
+
+        tasks = [asyncio.create_task(run(job)) for job in jobs]
+        alive, dead = [], []
+
+        try:
+            remaining = len(tasks)
+            while remaining:
+                output = await queue.get()
+                if output is _DONE:
+                    remaining -= 1
+                    continue
+                if isinstance(output, dict) and output["type"] == "summary":
+                    (alive if output["received"] > 0 else dead).append(output["host"])
+                yield output
+        finally:
+            # Stop outstanding pings if the consumer goes away early
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if text:
+            yield f"\nBatch ping completed ({len(jobs)} hosts)\n"
+        else:
+            yield {
+                "type": "batch_summary",
+                "targets": len(jobs),
+                "alive": alive,
+                "dead": dead,
+            }
@@ -0,0 +1,132 @@
+"""
+Async DNS resolution cache shared by all probe jobs
+"""
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import DNS_CACHE_TTL, DNS_NEGATIVE_TTL, DNS_CACHE_MAX_ENTRIES
+
+
+class ResolutionError(OSError):
+    """Raised when a host name does not resolve"""
+
+
+class DnsCache:
+    """
+    Resolves host names through the system resolver and caches the
+    addresses. getaddrinfo does not expose record TTLs, so positive
+    answers live for DNS_CACHE_TTL seconds and failures for at most
+    DNS_NEGATIVE_TTL. Concurrent lookups of the same name share one query.
+    """
+
+    def __init__(self, ttl: float = DNS_CACHE_TTL, negative_ttl: float = DNS_NEGATIVE_TTL,
+                 max_entries: int = DNS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        # host -> (expires_at, addresses or None for a cached failure, error message)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[List[str]], str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+
+    async def resolve(self, host: str) -> List[str]:
+        """Return the addresses for host (IPv4 first), raising ResolutionError on failure"""
+        if _is_ip(host):
+            return [host]
+
+        key = host.lower()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, addresses, error = entry
+            if time.monotonic() < expires_at:
+                self._entries.move_to_end(key)
+                if addresses is None:
+                    self.negative_hits += 1
+                    raise ResolutionError(error)
+                self.hits += 1
+                return addresses
+            del self._entries[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            addresses = await self._lookup(host)
+        except OSError as e:
+            error = f"Cannot resolve {host}: {e}"
+            self._store(key, None, error, self.negative_ttl)
+            future.set_exception(ResolutionError(error))
+            # Mark the exception retrieved in case nobody else was waiting
+            future.exception()
+            raise ResolutionError(error) from e
+        except BaseException:
+            # The leading lookup was cancelled; don't cache, but release any waiters
+            future.set_exception(ResolutionError(f"Lookup of {host} was interrupted"))
+            future.exception()
+            raise
+        else:
+            self._store(key, addresses, "", self.ttl)
+            future.set_result(addresses)
+            return addresses
+        finally:
+            del self._inflight[key]
+
+    async def _lookup(self, host: str) -> List[str]:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        # Many tools (and some ping builds) only speak IPv4, so prefer it
+        addresses.sort(key=lambda address: ":" in address)
+        return addresses
+
+    def _store(self, key: str, addresses: Optional[List[str]], error: str, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, addresses, error)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached entries"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Lookup counters and hit ratio"""
+        lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def is_public_address(address: str) -> bool:
+    """Whether an IP address is globally routable (not loopback, private, link-local, ...)"""
+    ip = ipaddress.ip_address(address)
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+# Global cache instance
+dns_cache = DnsCache()
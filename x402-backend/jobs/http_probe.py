@@ -0,0 +1,223 @@
+"""
+HTTP(S) latency probe job implementation
+"""
+import asyncio
+import ssl
+import time
+from typing import Dict, Any, Optional, Tuple
+from decimal import Decimal
+from urllib.parse import urlsplit
+from .ping import is_valid_host
+from .pool import connection_pool, Origin, Connection
+from .probe import ProbeJob, elapsed_ms
+from config import HTTP_PROBE_PRICE_U, HTTP_PROBE_MAX_BODY, HTTP_PROBE_KEEPALIVE
+
+HTTP_METHODS = ("GET", "HEAD")
+USER_AGENT = "x402-probe/1.0"
+
+
+class HttpProbeJob(ProbeJob):
+    """
+    Time DNS, TCP connect, TLS handshake and time-to-first-byte for
+    requests to a URL. With 'keepalive' the connection is returned to a
+    shared pool, so back-to-back attempts measure the warm request cost.
+    """
+
+    @classmethod
+    def get_name(cls) -> str:
+        return "http_probe"
+
+    @classmethod
+    def get_price(cls) -> Decimal:
+        return HTTP_PROBE_PRICE_U
+
+    def validate_params(self) -> tuple[bool, str]:
+        """Validate HTTP probe parameters"""
+        url = self.params.get("url")
+        method = self.params.get("method", "GET")
+        keepalive = self.params.get("keepalive", HTTP_PROBE_KEEPALIVE)
+
+        if not url or not isinstance(url, str):
+            return False, "Missing 'url' parameter"
+
+        try:
+            parts = urlsplit(url)
+            parts.port
+        except ValueError:
+            return False, f"Invalid url: {url}"
+
+        if parts.scheme not in ("http", "https"):
+            return False, "URL scheme must be http or https"
+
+        if not parts.hostname or not is_valid_host(parts.hostname):
+            return False, f"Invalid host in url: {url}"
+
+        if method not in HTTP_METHODS:
+            return False, f"Method must be one of: {', '.join(HTTP_METHODS)}"
+
+        if not isinstance(keepalive, bool):
+            return False, "keepalive must be a boolean"
+
+        return self.validate_probe_params()
+
+    def target(self) -> str:
+        return self.params["url"]
+
+    def _origin(self) -> Tuple[Origin, str]:
+        parts = urlsplit(self.params["url"])
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        return (parts.scheme, parts.hostname, port), path
+
+    async def attempt(self, seq: int) -> Dict[str, Any]:
+        """Send one request, reusing a pooled connection when allowed"""
+        origin, path = self._origin()
+        keepalive = self.params.get("keepalive", HTTP_PROBE_KEEPALIVE)
+
+        connection = connection_pool.acquire(origin) if keepalive else None
+        if connection:
+            reader, writer = connection
+            result = {
+                "addr": writer.get_extra_info("peername")[0], "reused": True,
+                "dns_ms": None, "connect_ms": None, "tls_ms": None,
+            }
+            try:
+                return await self._exchange(origin, path, connection, result, time.perf_counter())
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # The server closed the idle connection; measure a fresh one instead
+                pass
+
+        started_total = time.perf_counter()
+        connection, result = await self._connect(origin)
+        try:
+            return await self._exchange(origin, path, connection, result, started_total)
+        except asyncio.IncompleteReadError:
+            raise ValueError("Connection closed before a complete response")
+
+    async def _connect(self, origin: Origin) -> Tuple[Connection, Dict[str, Any]]:
+        """Open a new connection, timing DNS, TCP connect and TLS separately"""
+        scheme, host, port = origin
+        result = {"addr": None, "reused": False, "dns_ms": None, "connect_ms": None, "tls_ms": None}
+
+        started = time.perf_counter()
+        result["addr"] = await self.resolve(host)
+        result["dns_ms"] = elapsed_ms(started)
+
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(result["addr"], port)
+        result["connect_ms"] = elapsed_ms(started)
+
+        if scheme == "https":
+            started = time.perf_counter()
+            try:
+                await writer.start_tls(ssl.create_default_context(), server_hostname=host)
+            except BaseException:
+                writer.close()
+                raise
+            result["tls_ms"] = elapsed_ms(started)
+
+        return (reader, writer), result
+
+    async def _exchange(self, origin: Origin, path: str, connection: Connection,
+                        result: Dict[str, Any], started_total: float) -> Dict[str, Any]:
+        """Send the request on a connection and time the response"""
+        _, host, port = origin
+        reader, writer = connection
+        method = self.params.get("method", "GET")
+        keepalive = self.params.get("keepalive", HTTP_PROBE_KEEPALIVE)
+
+        reusable = False
+        try:
+            host_header = host if port in (80, 443) else f"{host}:{port}"
+            request = (
+                f"{method} {path} HTTP/1.1\r\n"
+                f"Host: {host_header}\r\n"
+                f"User-Agent: {USER_AGENT}\r\n"
+                f"Accept: */*\r\n"
+                f"Connection: {'keep-alive' if keepalive else 'close'}\r\n\r\n"
+            )
+
+            started = time.perf_counter()
+            writer.write(request.encode("ascii"))
+            await writer.drain()
+
+            status_line = await reader.readuntil(b"\r\n")
+            result["ttfb_ms"] = elapsed_ms(started)
+
+            status, headers = self._parse_head(status_line, await reader.readuntil(b"\r\n\r\n"))
+            body_bytes, complete = await self._read_body(reader, method, status, headers)
+
+            result["status"] = status
+            result["bytes"] = body_bytes
+            result["total_ms"] = elapsed_ms(started_total)
+
+            reusable = keepalive and complete and headers.get("connection", "").lower() != "close"
+            return result
+        finally:
+            if reusable:
+                connection_pool.release(origin, connection)
+            else:
+                writer.close()
+
+    def _parse_head(self, status_line: bytes, header_block: bytes) -> Tuple[int, Dict[str, str]]:
+        parts = status_line.decode("latin-1").split()
+        if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+            raise ValueError(f"Malformed status line: {status_line[:64]!r}")
+
+        headers = {}
+        for line in header_block.decode("latin-1").split("\r\n"):
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), headers
+
+    async def _read_body(self, reader: asyncio.StreamReader, method: str, status: int,
+                         headers: Dict[str, str]) -> Tuple[int, bool]:
+        """Drain the response body; returns (bytes read, connection reusable)"""
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return 0, True
+
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            total = 0
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                if size == 0:
+                    # Skip optional trailer headers up to the terminating empty line
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return total, True
+                if total + size > HTTP_PROBE_MAX_BODY:
+                    return total, False
+                await reader.readexactly(size + 2)
+                total += size
+
+        length: Optional[str] = headers.get("content-length")
+        if length is not None and length.isdigit():
+            length = int(length)
+            if length > HTTP_PROBE_MAX_BODY:
+                return 0, False
+            await reader.readexactly(length)
+            return length, True
+
+        # No framing: the body runs until the server closes the connection
+        total = 0
+        while total < HTTP_PROBE_MAX_BODY:
+            chunk = await reader.read(min(65536, HTTP_PROBE_MAX_BODY - total))
+            if not chunk:
+                break
+            total += len(chunk)
+        return total, False
+
+    def format_attempt(self, result: Dict[str, Any]) -> str:
+        def ms(name):
+            value = result.get(name)
+            return f"{value:.3f} ms" if value is not None else "-"
+
+        return (
+            f"seq={result['seq']} {result['status']} {result['bytes']} bytes"
+            f"{' (reused)' if result['reused'] else ''} "
+            f"dns={ms('dns_ms')} connect={ms('connect_ms')} tls={ms('tls_ms')} "
+            f"ttfb={ms('ttfb_ms')} total={ms('total_ms')}\n"
+        )
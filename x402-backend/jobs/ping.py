@@ -1,17 +1,122 @@
 """
 Ping job implementation
 """
-import asyncio
 import re
-from typing import AsyncIterator, Dict, Any
+from typing import AsyncIterator, Dict, Any, List, Optional
 from decimal import Decimal
-from .base import Job
-from config import PING_PRICE_U, MAX_PING_COUNT, PING_TIMEOUT
+from .base import Job, JobOutput
+from .stats import ProbeStats
+from .dns_cache import dns_cache
+from .process import JobProcess
+from config import PING_PRICE_U, MAX_PING_COUNT, PING_TIMEOUT, RESULT_CACHE_TTL, RESULT_CACHE_MAX_STALENESS
+
+# "64 bytes from 8.8.8.8: icmp_seq=1 ttl=117 time=10.3 ms" (iputils, busybox, BSD)
+REPLY_PATTERN = re.compile(
+    r'from\s+(?P<addr>[^\s:]+).*?(?:icmp_)?seq[=\s](?P<seq>\d+).*?ttl=(?P<ttl>\d+).*?time[=<](?P<rtt>[\d.]+)\s*ms',
+    re.IGNORECASE
+)
+# "no answer yet for icmp_seq=3" (iputils -O) / "Request timeout for icmp_seq 3" (BSD)
+TIMEOUT_PATTERN = re.compile(r'(?:no answer yet|request timeout) for icmp_seq[=\s](?P<seq>\d+)', re.IGNORECASE)
+
+
+def is_valid_host(host: str) -> bool:
+    """Basic validation for hostname or IP address"""
+    # Allow alphanumeric, dots, hyphens (basic check)
+    pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9\-\.]*[a-zA-Z0-9])?$'
+    return bool(re.match(pattern, host)) and len(host) <= 253
+
+
+class PingParser:
+    """
+    Turns ping output lines into typed reply/timeout events while
+    maintaining loss and RTT statistics incrementally.
+
+    Ping sends one probe per second, so a sequence number that is still
+    unanswered once a reply PING_TIMEOUT sequence numbers later arrives
+    is reported as a timeout straight away; anything left unanswered
+    when ping exits is reported at the end.
+    """
+
+    def __init__(self, host: str, count: int):
+        self.host = host
+        self.count = count
+        self.stats = ProbeStats()
+        self._first_seq: Optional[int] = None
+        self._answered: set = set()
+        self._next_pending = None
+
+    def feed(self, line: str) -> List[Dict[str, Any]]:
+        """Parse one output line, returning the events it produced"""
+        match = REPLY_PATTERN.search(line)
+        if match:
+            seq = int(match.group("seq"))
+            self._start(seq)
+            if seq in self._answered:
+                return []
+            events = self._expire(seq - PING_TIMEOUT)
+            self._answered.add(seq)
+            rtt = float(match.group("rtt"))
+            self.stats.add_reply(rtt)
+            events.append({
+                "type": "reply",
+                "host": self.host,
+                "from": match.group("addr"),
+                "seq": seq,
+                "ttl": int(match.group("ttl")),
+                "rtt_ms": rtt,
+            })
+            return events
+
+        match = TIMEOUT_PATTERN.search(line)
+        if match:
+            seq = int(match.group("seq"))
+            self._start(seq)
+            return self._expire(seq)
+
+        return []
+
+    def finish(self, failed: bool = False) -> List[Dict[str, Any]]:
+        """
+        Flush unanswered probes and return the closing events.
+        If ping failed to run, only what was actually observed is
+        summarized and the summary is flagged with "error".
+        """
+        if failed:
+            return [{"type": "summary", "host": self.host, **self.stats.to_dict(), "error": True}]
+        self._start(1)
+        events = self._expire(self._first_seq + self.count - 1)
+        events.append({"type": "summary", "host": self.host, **self.stats.to_dict()})
+        return events
+
+    def _start(self, seq: int):
+        # iputils numbers probes from 1, busybox and BSD from 0
+        if self._first_seq is None:
+            self._first_seq = 0 if seq == 0 else 1
+            self._next_pending = self._first_seq
+
+    def _expire(self, up_to: int) -> List[Dict[str, Any]]:
+        """Report every unanswered sequence number up to and including up_to"""
+        events = []
+        while self._next_pending <= up_to:
+            seq = self._next_pending
+            if seq not in self._answered:
+                self._answered.add(seq)
+                self.stats.add_loss()
+                events.append({"type": "timeout", "host": self.host, "seq": seq})
+            self._next_pending += 1
+        return events
 
 
 class PingJob(Job):
     """Ping a host and stream results"""
 
+    price_unit = "packet"
+    max_units = MAX_PING_COUNT
+    cache_ttl = RESULT_CACHE_TTL
+    max_staleness = RESULT_CACHE_MAX_STALENESS
+    text_failure = re.compile(r"^Error", re.MULTILINE)
+    confirmations = 0
+
     @classmethod
     def get_name(cls) -> str:
         return "ping"
@@ -20,6 +125,10 @@ class PingJob(Job):
     def get_price(cls) -> Decimal:
         return PING_PRICE_U
 
+    def units(self) -> int:
+        """Each packet sent is charged"""
+        return self.params.get("count", 4)
+
     def validate_params(self) -> tuple[bool, str]:
         """Validate ping parameters"""
         host = self.params.get("host")
@@ -35,47 +144,88 @@ class PingJob(Job):
         if not isinstance(count, int) or count < 1 or count > MAX_PING_COUNT:
             return False, f"Count must be between 1 and {MAX_PING_COUNT}"
 
-        return True, ""
+        return self.validate_format()
+
+    def normalized_params(self) -> Dict[str, Any]:
+        """Host names are case-insensitive and count defaults to 4"""
+        params = super().normalized_params()
+        params["host"] = params["host"].lower()
+        params.setdefault("count", 4)
+        return params
+
+    def time_limit(self) -> float:
+        """One probe per second, plus the reply timeout for the last one and resolution"""
+        return self.params.get("count", 4) + 2 * PING_TIMEOUT
 
     def _is_valid_host(self, host: str) -> bool:
         """Basic validation for hostname or IP address"""
-        # Allow alphanumeric, dots, hyphens (basic check)
-        pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9\-\.]*[a-zA-Z0-9])?$'
-        return bool(re.match(pattern, host)) and len(host) <= 253
+        return is_valid_host(host)
 
-    async def execute(self) -> AsyncIterator[str]:
+    async def execute(self) -> AsyncIterator[JobOutput]:
         """Execute ping command and stream output"""
+        if self.output_format == "text":
+            async for output in self._execute_text():
+                yield output
+        else:
+            async for event in self._execute_events():
+                yield event
+
+    async def _start_process(self, host: str, count: int) -> JobProcess:
+        # Resolve through the shared cache so ping doesn't hit the resolver itself
+        address = (await dns_cache.resolve(host))[0]
+
+        # Build ping command (works on Linux)
+        cmd = ["ping", "-c", str(count), "-n", "-W", str(PING_TIMEOUT), address]
+
+        return await JobProcess.start(*cmd)
+
+    async def _execute_text(self) -> AsyncIterator[str]:
+        """Stream raw ping output"""
         host = self.params.get("host")
         count = self.params.get("count", 4)
 
         yield f"Starting ping to {host} ({count} packets)...\n"
 
         try:
-            # Build ping command (works on Linux)
-            cmd = ["ping", "-c", str(count), "-W", str(PING_TIMEOUT), host]
-
-            # Start the process
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-
-            # Stream output line by line
-            async for line in process.stdout:
-                decoded_line = line.decode('utf-8')
-                yield decoded_line
-
-            # Wait for process to complete
-            await process.wait()
-
-            # Check for errors
-            if process.returncode != 0:
-                stderr = await process.stderr.read()
-                error_msg = stderr.decode('utf-8')
-                yield f"\nError: {error_msg}\n"
-            else:
-                yield f"\nPing completed successfully!\n"
+            # Start the process; it is killed if the stream is abandoned
+            async with await self._start_process(host, count) as process:
+
+                # Stream output line by line
+                async for line in process.lines():
+                    yield line
+
+                # Wait for process to complete
+                returncode = await process.wait()
+
+                # Check for errors
+                if returncode != 0:
+                    yield f"\nError: {process.stderr}\n"
+                else:
+                    yield f"\nPing completed successfully!\n"
 
         except Exception as e:
             yield f"\nError executing ping: {str(e)}\n"
+
+    async def _execute_events(self) -> AsyncIterator[Dict[str, Any]]:
+        """Stream typed reply/timeout events followed by a summary"""
+        host = self.params.get("host")
+        count = self.params.get("count", 4)
+        parser = PingParser(host, count)
+        failed = False
+
+        try:
+            async with await self._start_process(host, count) as process:
+                async for line in process.lines():
+                    for event in parser.feed(line):
+                        yield event
+
+                # ping exits non-zero when nothing answered; only stderr means a real error
+                if await process.wait() != 0 and process.stderr:
+                    yield {"type": "error", "host": host, "message": process.stderr}
+
+        except Exception as e:
+            failed = True
+            yield {"type": "error", "host": host, "message": f"Error executing ping: {str(e)}"}
+
+        for event in parser.finish(failed):
+            yield event
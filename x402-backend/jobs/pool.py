@@ -0,0 +1,59 @@
+"""
+Shared keep-alive connection pool for probe jobs
+"""
+import asyncio
+import time
+from typing import Dict, List, Tuple, Optional
+from config import HTTP_POOL_MAX_PER_ORIGIN, HTTP_POOL_IDLE_SECONDS
+
+# (scheme, host, port)
+Origin = Tuple[str, str, int]
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class ConnectionPool:
+    """Idle connections per origin, reused by back-to-back probes"""
+
+    def __init__(self, max_per_origin: int = HTTP_POOL_MAX_PER_ORIGIN,
+                 idle_seconds: float = HTTP_POOL_IDLE_SECONDS):
+        self.max_per_origin = max_per_origin
+        self.idle_seconds = idle_seconds
+        self._idle: Dict[Origin, List[Tuple[Connection, float]]] = {}
+
+    def acquire(self, origin: Origin) -> Optional[Connection]:
+        """Take a live idle connection for the origin, if any"""
+        idle = self._idle.get(origin, [])
+        now = time.monotonic()
+        while idle:
+            (reader, writer), released_at = idle.pop()
+            if now - released_at < self.idle_seconds and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def release(self, origin: Origin, connection: Connection):
+        """Return a connection for reuse, closing it if the origin is full"""
+        reader, writer = connection
+        idle = self._idle.setdefault(origin, [])
+        if len(idle) >= self.max_per_origin or writer.is_closing():
+            writer.close()
+            return
+        idle.append((connection, time.monotonic()))
+
+    def close(self):
+        """Close all idle connections"""
+        for idle in self._idle.values():
+            for (_, writer), _ in idle:
+                writer.close()
+        self._idle.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Idle connection counts"""
+        return {
+            "origins": len(self._idle),
+            "idle_connections": sum(len(idle) for idle in self._idle.values()),
+        }
+
+
+# Global pool instance
+connection_pool = ConnectionPool()
@@ -0,0 +1,128 @@
+"""
+Base class for repeated network probes (TCP connect, HTTP)
+"""
+import asyncio
+import re
+import time
+from abc import abstractmethod
+from typing import AsyncIterator, Dict, Any
+from .base import Job, JobOutput
+from .stats import ProbeStats
+from .dns_cache import dns_cache, is_public_address
+from config import (
+    MAX_PROBE_COUNT,
+    MAX_PROBE_INTERVAL,
+    PROBE_TIMEOUT,
+    PROBE_ALLOW_PRIVATE,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_STALENESS
+)
+
+
+def elapsed_ms(started: float) -> float:
+    """Milliseconds since a time.perf_counter() reading"""
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+class ProbeJob(Job):
+    """
+    Runs `count` probe attempts `interval` seconds apart, streaming one
+    attempt event per probe (or a timeout/error) and a closing summary.
+    """
+
+    # Attempt field whose values feed the summary statistics
+    summary_field = "total_ms"
+
+    price_unit = "attempt"
+    max_units = MAX_PROBE_COUNT
+
+    cache_ttl = RESULT_CACHE_TTL
+    max_staleness = RESULT_CACHE_MAX_STALENESS
+    text_failure = re.compile(r"^seq=\d+ error: ", re.MULTILINE)
+    confirmations = 0
+
+    # Whether the target may resolve to a loopback, private or link-local address
+    allow_private = PROBE_ALLOW_PRIVATE
+
+    @abstractmethod
+    async def attempt(self, seq: int) -> Dict[str, Any]:
+        """Run one probe and return its timings"""
+        pass
+
+    @abstractmethod
+    def target(self) -> str:
+        """Human-readable probe target"""
+        pass
+
+    @abstractmethod
+    def format_attempt(self, result: Dict[str, Any]) -> str:
+        """Render one attempt as a text line"""
+        pass
+
+    async def resolve(self, host: str) -> str:
+        """The address to connect to for host; non-public addresses are refused"""
+        addr = (await dns_cache.resolve(host))[0]
+        if not self.allow_private and not is_public_address(addr):
+            raise ValueError(f"{host} resolves to a non-public address ({addr})")
+        return addr
+
+    def units(self) -> int:
+        """Each attempt is charged"""
+        return self.params.get("count", 4)
+
+    def validate_probe_params(self) -> tuple[bool, str]:
+        """Validate the parameters shared by all probe jobs"""
+        count = self.params.get("count", 4)
+        interval = self.params.get("interval", 1)
+
+        if not isinstance(count, int) or count < 1 or count > MAX_PROBE_COUNT:
+            return False, f"Count must be between 1 and {MAX_PROBE_COUNT}"
+
+        if not isinstance(interval, (int, float)) or interval < 0 or interval > MAX_PROBE_INTERVAL:
+            return False, f"Interval must be between 0 and {MAX_PROBE_INTERVAL} seconds"
+
+        return self.validate_format()
+
+    def time_limit(self) -> float:
+        """Every attempt may take the full probe timeout plus the interval"""
+        count = self.params.get("count", 4)
+        interval = self.params.get("interval", 1)
+        return count * (PROBE_TIMEOUT + interval) + PROBE_TIMEOUT
+
+    async def execute(self) -> AsyncIterator[JobOutput]:
+        """Run the probe attempts and stream their timings"""
+        count = self.params.get("count", 4)
+        interval = self.params.get("interval", 1)
+        target = self.target()
+        text = self.output_format == "text"
+        stats = ProbeStats()
+
+        if text:
+            yield f"Probing {target} ({count} attempts)...\n"
+
+        for seq in range(1, count + 1):
+            try:
+                result = await asyncio.wait_for(self.attempt(seq), timeout=PROBE_TIMEOUT)
+                stats.add_reply(result[self.summary_field])
+                event = {"type": "attempt", "target": target, "seq": seq, **result}
+                yield self.format_attempt(event) if text else event
+            except asyncio.TimeoutError:
+                stats.add_loss()
+                yield f"seq={seq} timeout\n" if text else {"type": "timeout", "target": target, "seq": seq}
+            except (OSError, ValueError, asyncio.LimitOverrunError) as e:
+                stats.add_loss()
+                yield f"seq={seq} error: {e}\n" if text else {
+                    "type": "error", "target": target, "seq": seq, "message": str(e)
+                }
+
+            if seq < count and interval:
+                await asyncio.sleep(interval)
+
+        summary = stats.to_dict()
+        if text:
+            yield (
+                f"\n{summary['transmitted']} attempts, {summary['received']} succeeded, "
+                f"{summary['loss_pct']}% failed\n"
+            )
+        else:
+            yield {"type": "summary", "target": target, **summary}
@@ -0,0 +1,99 @@
+"""
+Child processes started by jobs
+"""
+import asyncio
+import os
+import signal
+from typing import AsyncIterator, Callable, Optional
+from telemetry.tracing import tracer
+from .base import job_executions
+
+# stderr kept for error messages; anything beyond is read and discarded
+MAX_STDERR_BYTES = 64 * 1024
+
+
+class JobProcess:
+    """
+    A job's child process, started in its own process group. stderr is
+    drained in the background while stdout is read, so neither pipe can
+    fill up and stall the child. Leaving the `async with` block (normally,
+    on error or on cancellation) kills the whole group and reaps it, so an
+    abandoned job holds no PIDs or pipe descriptors.
+    """
+
+    # Called with each new process group id; pool workers use it to tell the
+    # pool which groups to kill if the worker itself is killed
+    group_listener: Optional[Callable[[int], None]] = None
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self._stderr = bytearray()
+        self._drain = asyncio.create_task(self._drain_stderr())
+        self._closed = False
+        job_executions.processes += 1
+
+    @classmethod
+    async def start(cls, *cmd: str) -> "JobProcess":
+        """Start cmd with stdout and stderr piped"""
+        with tracer.child("subprocess start", command=cmd[0]):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+        if cls.group_listener is not None:
+            cls.group_listener(process.pid)
+        return cls(process)
+
+    async def _drain_stderr(self):
+        while True:
+            chunk = await self.process.stderr.read(4096)
+            if not chunk:
+                return
+            room = MAX_STDERR_BYTES - len(self._stderr)
+            if room > 0:
+                self._stderr += chunk[:room]
+
+    async def lines(self) -> AsyncIterator[str]:
+        """Yield decoded stdout lines"""
+        async for line in self.process.stdout:
+            yield line.decode('utf-8', errors='replace')
+
+    async def wait(self) -> int:
+        """Wait for exit and for stderr to be fully read; returns the exit code"""
+        returncode = await self.process.wait()
+        await self._drain
+        return returncode
+
+    @property
+    def stderr(self) -> str:
+        """stderr output read so far"""
+        return self._stderr.decode('utf-8', errors='replace').strip()
+
+    def kill(self):
+        """Kill the process and anything it started"""
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    async def close(self):
+        """Kill the process group if still running and reap the child"""
+        if self._closed:
+            return
+        self._closed = True
+        self.kill()
+        try:
+            await self.process.wait()
+        finally:
+            self._drain.cancel()
+            await asyncio.gather(self._drain, return_exceptions=True)
+            job_executions.processes -= 1
+
+    async def __aenter__(self) -> "JobProcess":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -1,41 +1,159 @@
 """
 Job registry for managing available job types
 """
-from typing import Dict, Type, Optional
+import importlib
+import json
+from decimal import Decimal
+from importlib.metadata import entry_points
+from typing import Any, Dict, List, Optional, Type, Union
 from .base import Job
-from .ping import PingJob
+from telemetry.logs import get_logger
+from config import JOB_MANIFEST
+
+log = get_logger("jobs.registry")
+
+# Installed packages can provide job types under this entry point group,
+# e.g. in pyproject.toml: [project.entry-points."x402.jobs"] my_job = "my_pkg.jobs:MyJob"
+ENTRY_POINT_GROUP = "x402.jobs"
+
+
+class JobSpec:
+    """A discovered job type: where its class lives and the metadata clients see"""
+
+    def __init__(self, name: str, entry: str, price: Optional[Decimal] = None, price_unit: str = "job",
+                 max_units: int = 1, cache_ttl: float = 0, max_staleness: float = 0,
+                 confirmations: Union[int, str] = 1):
+        self.name = name
+        self.entry = entry
+        self.price = price
+        self.price_unit = price_unit
+        self.max_units = max_units
+        self.cache_ttl = cache_ttl
+        self.max_staleness = max_staleness
+        self.confirmations = confirmations
+        self.job_class: Optional[Type[Job]] = None
+
+    @classmethod
+    def from_manifest(cls, entry: Dict[str, Any]) -> "JobSpec":
+        return cls(
+            name=entry["name"],
+            entry=entry["entry"],
+            price=Decimal(entry["price"]),
+            price_unit=entry.get("price_unit", "job"),
+            max_units=entry.get("max_units", 1),
+            cache_ttl=entry.get("cache_ttl", 0),
+            max_staleness=entry.get("max_staleness", 0),
+            confirmations=entry.get("confirmations", 1)
+        )
+
+    @property
+    def described(self) -> bool:
+        """Whether the metadata is known without importing the job"""
+        return self.price is not None
+
+    def describe(self, job_class: Type[Job]):
+        """Take the metadata from the job class, which is authoritative"""
+        metadata = {
+            "price": job_class.get_price(),
+            "price_unit": job_class.price_unit,
+            "max_units": job_class.max_units,
+            "cache_ttl": job_class.cache_ttl,
+            "max_staleness": job_class.max_staleness,
+            "confirmations": job_class.confirmations,
+        }
+        described = self.described
+        for key, value in metadata.items():
+            if described and getattr(self, key) != value:
+                log.warning("job_manifest_mismatch", job_type=self.name, key=key, manifest=getattr(self, key), job_class=value)
+            setattr(self, key, value)
+        self.job_class = job_class
 
 
 class JobRegistry:
-    """Registry of all available job types"""
+    """
+    Registry of all available job types.
+
+    Job types are discovered without importing their code, from the job
+    manifest (JOB_MANIFEST) and from installed packages' "x402.jobs" entry
+    points, so listing jobs and quoting prices stays cheap. A job's module
+    is imported the first time the job is requested.
+    """
 
-    def __init__(self):
-        self._jobs: Dict[str, Type[Job]] = {}
-        self._register_default_jobs()
+    def __init__(self, manifest_path: Optional[str] = JOB_MANIFEST):
+        self._jobs: Dict[str, JobSpec] = {}
+        self._discover_entry_points()
+        if manifest_path:
+            self._load_manifest(manifest_path)
 
-    def _register_default_jobs(self):
-        """Register built-in job types"""
-        self.register(PingJob)
+    def _discover_entry_points(self):
+        """Register job types advertised by installed packages"""
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            self._jobs[entry_point.name] = JobSpec(entry_point.name, entry_point.value)
+
+    def _load_manifest(self, path: str):
+        """Register job types (with their metadata) listed in the manifest"""
+        with open(path) as f:
+            manifest = json.load(f)
+        for entry in manifest["jobs"]:
+            self._jobs[entry["name"]] = JobSpec.from_manifest(entry)
 
     def register(self, job_class: Type[Job]):
         """Register a new job type"""
         job_name = job_class.get_name()
-        self._jobs[job_name] = job_class
+        spec = JobSpec(job_name, f"{job_class.__module__}:{job_class.__qualname__}")
+        spec.describe(job_class)
+        self._jobs[job_name] = spec
 
     def get_job_class(self, job_name: str) -> Optional[Type[Job]]:
-        """Get a job class by name"""
-        return self._jobs.get(job_name)
+        """Get a job class by name, importing its module on first use"""
+        spec = self._jobs.get(job_name)
+        if spec is None:
+            return None
+        if spec.job_class is None:
+            self._load(spec)
+        return spec.job_class
 
-    def list_jobs(self) -> Dict[str, Dict]:
-        """List all available jobs with their details"""
+    def _load(self, spec: JobSpec):
+        module_name, _, class_name = spec.entry.partition(":")
+        job_class = getattr(importlib.import_module(module_name), class_name)
+        if job_class.get_name() != spec.name:
+            raise ValueError(f"{spec.entry} is job {job_class.get_name()}, not {spec.name}")
+        spec.describe(job_class)
+
+    def preload(self, job_names: List[str]):
+        """Import the given job types now ("*" for all) so their first request doesn't pay for it"""
+        if "*" in job_names:
+            job_names = list(self._jobs)
+        for job_name in job_names:
+            if job_name in self._jobs:
+                self.get_job_class(job_name)
+
+    def loaded_jobs(self) -> List[str]:
+        """Names of the job types whose code has been imported"""
+        return [name for name, spec in self._jobs.items() if spec.job_class is not None]
+
+    def get_job_info(self, job_name: str) -> Optional[Dict[str, Any]]:
+        """Get a job's details by name"""
+        spec = self._jobs.get(job_name)
+        if spec is None:
+            return None
+        # Entry-point jobs without a manifest entry only describe themselves once imported
+        if not spec.described:
+            self._load(spec)
         return {
-            name: {
-                "name": job_class.get_name(),
-                "price": str(job_class.get_price())
-            }
-            for name, job_class in self._jobs.items()
+            "name": job_name,
+            "price": str(spec.price),
+            "price_unit": spec.price_unit,
+            "max_units": spec.max_units,
+            "cache_ttl": spec.cache_ttl,
+            "max_staleness": spec.max_staleness,
+            "confirmations": spec.confirmations
         }
 
+    def list_jobs(self) -> Dict[str, Dict]:
+        """List all available jobs with their details"""
+        return {name: self.get_job_info(name) for name in self._jobs}
+
 
 # Global registry instance
 job_registry = JobRegistry()
@@ -0,0 +1,131 @@
+"""
+Short-TTL cache of recorded job output for idempotent job types
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from .base import Job, JobOutput
+from config import RESULT_CACHE_MAX_BYTES
+
+
+def _size(output: JobOutput) -> int:
+    """Approximate memory held by one recorded output"""
+    return len(output) if isinstance(output, str) else len(json.dumps(output))
+
+
+class ResultCache:
+    """
+    Records the complete output of successful executions, keyed by job
+    type and normalized params, so a client that opts in with 'cache'
+    can be served a replay instead of a fresh execution. Entries expire
+    after their job type's max_staleness. Recorded output is bounded by
+    max_bytes, evicting least recently used entries first.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # Larger results are streamed but not recorded
+        self.max_entry_bytes = max_bytes // 16
+        # key -> (recorded_at, expires_at, outputs, size)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, float, List[JobOutput], int]]" = OrderedDict()
+        self.bytes = 0
+        self.evictions = 0
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    @staticmethod
+    def _key(job: Job) -> Tuple[str, str]:
+        return job.get_name(), json.dumps(job.normalized_params(), sort_keys=True, default=str)
+
+    def replay(self, job: Job) -> Optional[AsyncIterator[JobOutput]]:
+        """
+        Return a replay of a recorded result fresh enough for the job's
+        client, or None if it didn't opt in or nothing usable is recorded
+        """
+        max_age = job.accepted_age()
+        if max_age is None:
+            return None
+
+        name = job.get_name()
+        key = self._key(job)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            recorded_at, expires_at, outputs, _ = entry
+            if now >= expires_at:
+                self._remove(key)
+            elif now - recorded_at <= max_age:
+                self._entries.move_to_end(key)
+                self._hits[name] = self._hits.get(name, 0) + 1
+                return self._replay(job, now - recorded_at, outputs)
+
+        self._misses[name] = self._misses.get(name, 0) + 1
+        return None
+
+    async def _replay(self, job: Job, age: float, outputs: List[JobOutput]) -> AsyncIterator[JobOutput]:
+        if job.output_format == "text":
+            yield f"(cached result from {age:.1f}s ago)\n"
+        else:
+            yield {"type": "cached", "age_s": round(age, 3)}
+        for output in outputs:
+            yield output
+
+    async def record(self, job: Job, outputs: AsyncIterator[JobOutput]) -> AsyncIterator[JobOutput]:
+        """Pass a live execution's output through, recording it unless the job reports a failure"""
+        recorded: Optional[List[JobOutput]] = [] if job.cache_ttl else None
+        size = 0
+
+        async for output in outputs:
+            if recorded is not None:
+                size += _size(output)
+                if size > self.max_entry_bytes or job.is_failure(output):
+                    recorded = None
+                else:
+                    recorded.append(output)
+            yield output
+
+        if recorded is not None:
+            self._store(self._key(job), recorded, size, job.max_staleness)
+
+    def _store(self, key: Tuple[str, str], outputs: List[JobOutput], size: int, lifetime: float):
+        if key in self._entries:
+            self._remove(key)
+        now = time.monotonic()
+        self._entries[key] = (now, now + lifetime, outputs, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: Tuple[str, str]):
+        self.bytes -= self._entries.pop(key)[3]
+
+    def clear(self):
+        """Drop all recorded results"""
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict:
+        """Size, evictions and per-job-type hit/miss counters"""
+        by_type = {}
+        for name in sorted(set(self._hits) | set(self._misses)):
+            hits = self._hits.get(name, 0)
+            misses = self._misses.get(name, 0)
+            by_type[name] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 4),
+            }
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "by_type": by_type,
+        }
+
+
+# Global cache instance
+result_cache = ResultCache()
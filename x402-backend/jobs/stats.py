@@ -0,0 +1,165 @@
+"""
+Constant-memory running statistics for streamed probe results
+"""
+import math
+from typing import Optional, List, Dict, Any
+
+
+class RunningStats:
+    """Min, max, mean and mean deviation updated one sample at a time (Welford)"""
+
+    def __init__(self):
+        self.count = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value: float):
+        """Add a sample"""
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def mdev(self) -> float:
+        """Population standard deviation, as reported by ping's 'mdev'"""
+        if self.count == 0:
+            return 0.0
+        return math.sqrt(self._m2 / self.count)
+
+
+class P2Quantile:
+    """
+    Streaming quantile estimator using the P-square algorithm
+    (Jain & Chlamtac, 1985). Keeps five markers regardless of sample count.
+    """
+
+    def __init__(self, quantile: float):
+        self.quantile = quantile
+        self.count = 0
+        self._initial: List[float] = []
+        self._heights: List[float] = []
+        self._positions: List[int] = []
+        self._desired: List[float] = []
+        self._increments = [0.0, quantile / 2, quantile, (1 + quantile) / 2, 1.0]
+
+    def add(self, value: float):
+        """Add a sample"""
+        self.count += 1
+
+        if self.count <= 5:
+            self._initial.append(value)
+            if self.count == 5:
+                self._heights = sorted(self._initial)
+                self._positions = [1, 2, 3, 4, 5]
+                q = self.quantile
+                self._desired = [1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]
+            return
+
+        heights = self._heights
+        positions = self._positions
+
+        # Find the cell containing the new sample, extending the extremes
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = 0
+            while k < 3 and value >= heights[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # Adjust the three middle markers if they drifted from their desired positions
+        for i in range(1, 4):
+            d = self._desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or \
+                    (d <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not heights[i - 1] < candidate < heights[i + 1]:
+                    candidate = self._linear(i, step)
+                heights[i] = candidate
+                positions[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (h[i + 1] - h[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (h[i] - h[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i: int, d: int) -> float:
+        h, n = self._heights, self._positions
+        return h[i] + d * (h[i + d] - h[i]) / (n[i + d] - n[i])
+
+    @property
+    def value(self) -> Optional[float]:
+        """Current quantile estimate (exact for fewer than five samples)"""
+        if self.count == 0:
+            return None
+        if self.count < 5:
+            ordered = sorted(self._initial)
+            index = min(len(ordered) - 1, max(0, math.ceil(self.quantile * len(ordered)) - 1))
+            return ordered[index]
+        return self._heights[2]
+
+
+class ProbeStats:
+    """Loss and round-trip-time statistics for a series of probes"""
+
+    def __init__(self):
+        self.transmitted = 0
+        self.received = 0
+        self.rtt = RunningStats()
+        self.p50 = P2Quantile(0.5)
+        self.p95 = P2Quantile(0.95)
+
+    def add_reply(self, rtt_ms: float):
+        """Record a probe that got a reply"""
+        self.transmitted += 1
+        self.received += 1
+        self.rtt.add(rtt_ms)
+        self.p50.add(rtt_ms)
+        self.p95.add(rtt_ms)
+
+    def add_loss(self):
+        """Record a probe that got no reply"""
+        self.transmitted += 1
+
+    @property
+    def loss_pct(self) -> float:
+        """Packet loss in percent"""
+        if self.transmitted == 0:
+            return 0.0
+        return 100.0 * (self.transmitted - self.received) / self.transmitted
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summary suitable for a JSON event"""
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value, 3) if value is not None else None
+
+        has_rtt = self.rtt.count > 0
+        return {
+            "transmitted": self.transmitted,
+            "received": self.received,
+            "loss_pct": round(self.loss_pct, 2),
+            "rtt_min_ms": ms(self.rtt.min),
+            "rtt_avg_ms": ms(self.rtt.mean) if has_rtt else None,
+            "rtt_max_ms": ms(self.rtt.max),
+            "rtt_mdev_ms": ms(self.rtt.mdev) if has_rtt else None,
+            "rtt_p50_ms": ms(self.p50.value),
+            "rtt_p95_ms": ms(self.p95.value),
+        }
@@ -0,0 +1,65 @@
+"""
+TCP connect probe job implementation
+"""
+import asyncio
+import time
+from typing import Dict, Any
+from decimal import Decimal
+from .ping import is_valid_host
+from .probe import ProbeJob, elapsed_ms
+from config import TCP_PROBE_PRICE_U
+
+
+class TcpProbeJob(ProbeJob):
+    """Time DNS resolution and TCP handshakes to a host:port (works where ICMP is filtered)"""
+
+    summary_field = "connect_ms"
+
+    @classmethod
+    def get_name(cls) -> str:
+        return "tcp_probe"
+
+    @classmethod
+    def get_price(cls) -> Decimal:
+        return TCP_PROBE_PRICE_U
+
+    def validate_params(self) -> tuple[bool, str]:
+        """Validate TCP probe parameters"""
+        host = self.params.get("host")
+        port = self.params.get("port")
+
+        if not host or not isinstance(host, str):
+            return False, "Missing 'host' parameter"
+
+        if not is_valid_host(host):
+            return False, f"Invalid host: {host}"
+
+        if not isinstance(port, int) or port < 1 or port > 65535:
+            return False, "Port must be between 1 and 65535"
+
+        return self.validate_probe_params()
+
+    def target(self) -> str:
+        return f"{self.params['host']}:{self.params['port']}"
+
+    async def attempt(self, seq: int) -> Dict[str, Any]:
+        """Resolve the host and open (then close) one TCP connection"""
+        host = self.params["host"]
+        port = self.params["port"]
+
+        started = time.perf_counter()
+        addr = await self.resolve(host)
+        dns_ms = elapsed_ms(started)
+
+        started = time.perf_counter()
+        _, writer = await asyncio.open_connection(addr, port)
+        connect_ms = elapsed_ms(started)
+        writer.close()
+
+        return {"addr": addr, "dns_ms": dns_ms, "connect_ms": connect_ms}
+
+    def format_attempt(self, result: Dict[str, Any]) -> str:
+        return (
+            f"seq={result['seq']} {result['addr']}:{self.params['port']} "
+            f"dns={result['dns_ms']:.3f} ms connect={result['connect_ms']:.3f} ms\n"
+        )
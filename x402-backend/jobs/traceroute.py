@@ -0,0 +1,229 @@
+"""
+Traceroute / MTR job implementation
+"""
+import asyncio
+import re
+import time
+from typing import AsyncIterator, Dict, Any, Optional, List
+from decimal import Decimal
+from .base import Job, JobOutput
+from .ping import REPLY_PATTERN, is_valid_host
+from .stats import ProbeStats
+from .dns_cache import dns_cache
+from .process import JobProcess
+from config import (
+    TRACEROUTE_PRICE_U,
+    MAX_TRACE_HOPS,
+    MAX_MTR_CYCLES,
+    PING_TIMEOUT,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_MAX_STALENESS
+)
+
+# "From 10.0.0.1 icmp_seq=1 Time to live exceeded" (iputils)
+# "92 bytes from 10.0.0.1: Time to live exceeded" (BSD)
+TTL_EXCEEDED_PATTERN = re.compile(r'from\s+(?P<addr>[^\s:]+).*?time to live exceeded', re.IGNORECASE)
+
+
+def parse_hop_line(line: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a line of `ping -t` output into the hop that answered: its
+    address, whether it is the destination, and the RTT ping measured
+    (None for TTL-exceeded replies, which ping does not time).
+    Returns None for any other line.
+    """
+    match = TTL_EXCEEDED_PATTERN.search(line)
+    if match:
+        return {"addr": match.group("addr"), "rtt_ms": None, "reached": False}
+
+    match = REPLY_PATTERN.search(line)
+    if match:
+        return {"addr": match.group("addr"), "rtt_ms": float(match.group("rtt")), "reached": True}
+
+    return None
+
+
+
+class TracerouteJob(Job):
+    """
+    Trace the path to a host by sending TTL-limited probes for every hop
+    at once, so a trace takes about one probe timeout instead of
+    hops x timeout. In 'mtr' mode the probing repeats for several cycles
+    and per-hop loss and latency statistics are updated as replies arrive.
+    """
+
+    price_unit = "cycle"
+    max_units = MAX_MTR_CYCLES
+    cache_ttl = RESULT_CACHE_TTL
+    max_staleness = RESULT_CACHE_MAX_STALENESS
+    text_failure = re.compile(r"^Error executing", re.MULTILINE)
+    confirmations = 3
+
+    @classmethod
+    def get_name(cls) -> str:
+        return "traceroute"
+
+    @classmethod
+    def get_price(cls) -> Decimal:
+        return TRACEROUTE_PRICE_U
+
+    def units(self) -> int:
+        """Each probing cycle is charged"""
+        return self._cycles()
+
+    def _mode(self) -> str:
+        return self.params.get("mode", "trace")
+
+    def _cycles(self) -> int:
+        return self.params.get("cycles", 5) if self._mode() == "mtr" else 1
+
+    def validate_params(self) -> tuple[bool, str]:
+        """Validate traceroute parameters"""
+        host = self.params.get("host")
+        max_hops = self.params.get("max_hops", MAX_TRACE_HOPS)
+        cycles = self.params.get("cycles", 5)
+
+        if not host or not isinstance(host, str):
+            return False, "Missing 'host' parameter"
+
+        if not is_valid_host(host):
+            return False, f"Invalid host: {host}"
+
+        if not isinstance(max_hops, int) or max_hops < 1 or max_hops > MAX_TRACE_HOPS:
+            return False, f"max_hops must be between 1 and {MAX_TRACE_HOPS}"
+
+        if self._mode() not in ("trace", "mtr"):
+            return False, "Mode must be 'trace' or 'mtr'"
+
+        if self._mode() == "mtr" and (not isinstance(cycles, int) or cycles < 1 or cycles > MAX_MTR_CYCLES):
+            return False, f"Cycles must be between 1 and {MAX_MTR_CYCLES}"
+
+        return self.validate_format()
+
+    def time_limit(self) -> float:
+        """Each cycle waits at most one probe timeout, and cycles start a second apart"""
+        return self._cycles() * (PING_TIMEOUT + 1) + PING_TIMEOUT
+
+    async def _probe(self, address: str, ttl: int) -> Dict[str, Any]:
+        """
+        Send one TTL-limited probe and report which hop answered. rtt_ms is
+        ping's own measurement and only set when the destination answers;
+        probe_ms is how long the probe took to come back, including ping's
+        start-up, and is the only timing for intermediate hops.
+        """
+        result = {"ttl": ttl, "addr": None, "rtt_ms": None, "probe_ms": None, "reached": False}
+        cmd = ["ping", "-c", "1", "-n", "-t", str(ttl), "-W", str(PING_TIMEOUT), address]
+
+        async with await JobProcess.start(*cmd) as process:
+            started = time.perf_counter()
+            async for decoded_line in process.lines():
+                hop = parse_hop_line(decoded_line)
+                if hop:
+                    result.update(hop)
+                    result["probe_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                    break
+
+        return result
+
+    async def _probe_all(self, address: str, hops: int) -> AsyncIterator[Dict[str, Any]]:
+        """Probe hops 1..hops in parallel and yield each result as it arrives"""
+        tasks = [asyncio.create_task(self._probe(address, ttl)) for ttl in range(1, hops + 1)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def execute(self) -> AsyncIterator[JobOutput]:
+        """Run the trace (or MTR cycles) and stream hop results"""
+        host = self.params.get("host")
+        max_hops = self.params.get("max_hops", MAX_TRACE_HOPS)
+        cycles = self._cycles()
+        mtr = self._mode() == "mtr"
+        text = self.output_format == "text"
+
+        hop_stats: Dict[int, ProbeStats] = {}
+        hop_addrs: Dict[int, Optional[str]] = {}
+        # TTL at which the destination answered; later hops are the destination again
+        reached_ttl: Optional[int] = None
+
+        if text:
+            yield f"{'MTR' if mtr else 'Traceroute'} to {host}, {max_hops} hops max\n"
+
+        try:
+            # Resolve once so the parallel probes don't each query the resolver
+            address = (await dns_cache.resolve(host))[0]
+
+            for cycle in range(1, cycles + 1):
+                hops = reached_ttl or max_hops
+                cycle_start = time.monotonic()
+
+                async for result in self._probe_all(address, hops):
+                    ttl = result["ttl"]
+                    if reached_ttl is not None and ttl > reached_ttl:
+                        continue
+                    if result["reached"]:
+                        reached_ttl = ttl if reached_ttl is None else min(reached_ttl, ttl)
+
+                    # Intermediate hops only have probe durations
+                    stats = hop_stats.setdefault(ttl, ProbeStats())
+                    if result["addr"] is None:
+                        stats.add_loss()
+                    else:
+                        stats.add_reply(result["rtt_ms"] if result["rtt_ms"] is not None else result["probe_ms"])
+                        hop_addrs[ttl] = result["addr"]
+
+                    if text:
+                        yield self._format_hop(result)
+                    else:
+                        event = {"type": "hop", "host": host, **result}
+                        if mtr:
+                            event["cycle"] = cycle
+                            event["stats"] = stats.to_dict()
+                        yield event
+
+                # MTR sends one probe per hop per second
+                if cycle < cycles:
+                    await asyncio.sleep(max(0.0, 1.0 - (time.monotonic() - cycle_start)))
+
+        except Exception as e:
+            if text:
+                yield f"\nError executing traceroute: {str(e)}\n"
+            else:
+                yield {"type": "error", "host": host, "message": f"Error executing traceroute: {str(e)}"}
+
+        path = [
+            {"ttl": ttl, "addr": hop_addrs.get(ttl), "timing": "rtt" if ttl == reached_ttl else "probe",
+             **hop_stats[ttl].to_dict()}
+            for ttl in sorted(hop_stats)
+            if reached_ttl is None or ttl <= reached_ttl
+        ]
+
+        if text:
+            yield self._format_path(path, reached_ttl is not None)
+        else:
+            yield {"type": "path", "host": host, "reached": reached_ttl is not None, "hops": path}
+
+    def _format_hop(self, result: Dict[str, Any]) -> str:
+        if result["addr"] is None:
+            return f"{result['ttl']:>2}  *\n"
+        if result["rtt_ms"] is None:
+            return f"{result['ttl']:>2}  {result['addr']}  {result['probe_ms']:.3f} ms (probe)\n"
+        return f"{result['ttl']:>2}  {result['addr']}  {result['rtt_ms']:.3f} ms\n"
+
+    def _format_path(self, path: List[Dict[str, Any]], reached: bool) -> str:
+        def ms(value):
+            return f"{value:.1f}" if value is not None else "-"
+
+        lines = [f"\n{'HOP':>3}  {'ADDRESS':<40} {'LOSS%':>6} {'AVG':>8} {'BEST':>8} {'WORST':>8}"]
+        for hop in path:
+            lines.append(
+                f"{hop['ttl']:>3}  {hop['addr'] or '???':<40} {hop['loss_pct']:>6.1f} "
+                f"{ms(hop['rtt_avg_ms']):>8} {ms(hop['rtt_min_ms']):>8} {ms(hop['rtt_max_ms']):>8}"
+            )
+        if any(hop["timing"] == "probe" and hop["addr"] for hop in path):
+            lines.append("Intermediate hop times are probe durations; ping does not time TTL-exceeded replies")
+        lines.append("Destination reached\n" if reached else "Destination not reached\n")
+        return "\n".join(lines)
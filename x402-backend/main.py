@@ -1,24 +1,54 @@
 """
 x402 PoC - FastAPI Backend
 """
+import hmac
+import time
 import uuid
 import asyncio
+from decimal import Decimal
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
-from fastapi import FastAPI, HTTPException, Request
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 
 from config import (
     HOST, PORT, CORS_ORIGINS, PAYMENT_TIMEOUT_SECONDS,
-    PAYMENT_RECIPIENT_ADDRESS, TOKEN_ADDRESS
+    PAYMENT_RECIPIENT_ADDRESS, TOKEN_ADDRESS, TOKEN_DECIMALS, CHAIN_ID, PAYMENT_CHAINS, JOB_RUNNER, DISPATCH_QUEUE, WORKER_TOKEN,
+    PRELOAD_JOBS, SETTLEMENT_PRIVATE_KEY, MAX_BATCH_JOBS, SPECULATIVE_WITHHOLD, CONFIRMATION_OVERRIDES,
+    SESSION_DEPOSIT_CONFIRMATIONS, PAYMENT_DETECTION, ADMIN_TOKEN, LOOP_MONITOR, PROFILE_INTERVAL, PROFILE_MAX_SECONDS
 )
 from jobs.registry import job_registry
-from payments.base_token import PaymentVerifier
-from payments.x402_auth import verify_payment_signature, parse_x_payment_header
+from jobs.base import Job, job_executions
+from jobs.result_cache import result_cache
+from jobs.pool import connection_pool
+from jobs.dns_cache import dns_cache
+from runner.pool import worker_pool
+from dispatch.queue import create_queue
+from dispatch.relay import Dispatcher
+from payments.base_token import MultiChainVerifier
+from payments.confirmations import Policy, parse_policy, reorg_tracker
+from payments.ledger import authorization_ledger, payment_ledger
+from payments.log_stream import LogStream
+from payments.merkle import MerkleTree
+from payments.pricing import pricing_engine
+from payments.sessions import session_store, SessionError, InsufficientBalance
+from payments.speculative import speculative_payments
+from payments.settlement import settlement_engine, Web3SettlementChain
+from payments.x402_auth import (
+    verify_payment_signature, verify_batch_signature, verify_spending_cap, verify_deposit_claim,
+    parse_x_payment_header, payment_chain_id, payment_authorization_key, batch_authorization_key,
+    authorization_expiry
+)
 from streaming.sse import create_sse_response
+from telemetry.metrics import metrics, job_requests, signature_verify_seconds, payment_wait_seconds, expired_jobs
+from telemetry.tracing import SpanContext, tracer
+from telemetry.profiling import loop_monitor, profiler
+from telemetry.logs import get_logger, log_pipeline
+
+log = get_logger("main")
 
 
 # Pydantic models
@@ -29,14 +59,138 @@ class JobRequest(BaseModel):
     job_id: Optional[str] = None  # Client-provided job ID for x402
 
 
+class BatchJob(BaseModel):
+    job_type: str
+    params: Dict
+    job_id: str  # Client-provided: it is part of the signed Merkle leaf
+
+
+class BatchJobRequest(BaseModel):
+    jobs: List[BatchJob]
+    wallet_address: str
+
+
 class PaymentConfirmation(BaseModel):
     job_id: str
-    tx_hash: str
+    tx_hash: Optional[str] = None
+    raw_tx: Optional[str] = None  # Signed transfer, broadcast by the server
+    chain_id: Optional[int] = None  # Chain the transfer is on (all payment chains are checked if unset)
+    speculative: bool = False  # Start the job before the transfer is mined, if allowed
+
+
+class DepositClaim(BaseModel):
+    recipient: str
+    token: str
+    amount: str  # wei transferred to the recipient
+    nonce: str  # From /api/sessions/nonce
+    timestamp: int
+    validUntil: int
+    chainId: Optional[int] = None  # Chain the transfer is on; defaults to CHAIN_ID
+    signature: str
+
+
+class SpendingCap(BaseModel):
+    recipient: str
+    token: str
+    cap: str  # wei
+    nonce: str
+    timestamp: int
+    validUntil: int
+    chainId: Optional[int] = None  # Defaults to CHAIN_ID
+    signature: str
+
+
+class WorkerLease(BaseModel):
+    worker_id: str
+
+
+class WorkerOutput(BaseModel):
+    worker_id: str
+    outputs: List[Any]
+
+
+class WorkerCompletion(BaseModel):
+    worker_id: str
+    error: Optional[str] = None
 
 
 # In-memory storage for pending jobs
 pending_jobs: Dict[str, Dict] = {}
-payment_verifier: Optional[PaymentVerifier] = None
+payment_verifier: Optional[MultiChainVerifier] = None
+# Chain ID -> its payment log subscription (PAYMENT_DETECTION=subscribe)
+log_streams: Dict[int, LogStream] = {}
+dispatcher: Optional[Dispatcher] = Dispatcher(create_queue(DISPATCH_QUEUE)) if JOB_RUNNER == "remote" else None
+
+# Metrics series used on every request, bound once
+request_outcomes = {
+    outcome: job_requests.labels(outcome)
+    for outcome in ("payment_required", "authorized", "unauthorized", "invalid")
+}
+signature_timings = {
+    kind: signature_verify_seconds.labels(kind) for kind in ("payment", "batch", "spending_cap", "deposit_claim")
+}
+payment_waits = {outcome: payment_wait_seconds.labels(outcome) for outcome in ("verified", "not_found")}
+metrics.gauge("x402_pending_jobs", "Jobs quoted or paid but not yet cleaned up", function=lambda: len(pending_jobs))
+metrics.gauge(
+    "x402_running_jobs", "Jobs executing in this process, its worker pool or on leased remote workers",
+    function=lambda: job_executions.running
+)
+metrics.gauge("x402_sse_connections", "Open job output streams", function=lambda: job_executions.streams)
+
+
+def collect_session_spend(record: Dict[str, Any]):
+    """Queue what a spending-cap session spent for settlement (deposits are already paid)"""
+    if record["funding"] == "cap":
+        settlement_engine.submit(
+            f"session-{record['session_id']}-{uuid.uuid4().hex[:8]}",
+            record["wallet"], int(record["amount_wei"]), record["chain_id"], record
+        )
+
+
+def payment_chains() -> List[Dict[str, Any]]:
+    """Chains payments are accepted on, with the U token's address on each"""
+    return [
+        {"chain_id": chain_id, "network": chain["network"], "token_address": chain["token"]}
+        for chain_id, chain in PAYMENT_CHAINS.items()
+    ]
+
+
+def confirmation_policy(job_type: str) -> Policy:
+    """Confirmations a job type's on-chain payment needs (CONFIRMATIONS overrides the job's own)"""
+    return parse_policy(CONFIRMATION_OVERRIDES.get(job_type, job_registry.get_job_info(job_type)["confirmations"]))
+
+
+def revoke_if_reorged(job_id: str, tx_hash: str):
+    """Callback for a payment's reorg watch: a job whose payment left the chain is unpaid again"""
+    def revoke(payment: "asyncio.Future[bool]"):
+        job_info = pending_jobs.get(job_id)
+        if payment.result() or job_info is None or job_info.get("tx_hash") != tx_hash:
+            return
+        job_info["paid"] = False
+        job_info["reorged_tx_hash"] = job_info.pop("tx_hash")
+        log.warning("job_payment_reorged", job_id=job_id, tx_hash=tx_hash)
+    return revoke
+
+
+def close_if_reorged(session):
+    """Callback for a deposit's reorg watch: a session whose deposit left the chain is closed"""
+    def close(deposit: "asyncio.Future[bool]"):
+        if not deposit.result():
+            session_store.close(session)
+            log.warning("session_deposit_reorged", session_id=session.session_id, tx_hash=session.reference)
+    return close
+
+
+def trace_parent(request: Request, job_info: Optional[Dict] = None) -> Optional[SpanContext]:
+    """Trace a request belongs to: the client's traceparent, else the one its job was requested in"""
+    return tracer.extract(request.headers.get("traceparent")) or (job_info or {}).get("trace")
+
+
+def job_runner():
+    """Where jobs execute: worker pool, remote dispatcher or in-process (None)"""
+    if JOB_RUNNER == "pool":
+        return worker_pool
+    return dispatcher
 
 
 @asynccontextmanager
@@ -45,22 +199,89 @@ async def lifespan(app: FastAPI):
     global payment_verifier
 
     # Startup
-    print("Starting x402 PoC server...")
-    payment_verifier = PaymentVerifier()
+    log.info("server_starting")
+    payment_verifier = MultiChainVerifier()
 
-    if not payment_verifier.is_connected():
-        print("WARNING: Not connected to Base Sepolia network!")
-    else:
-        print("Connected to Base Sepolia network")
+    for network, connected in payment_verifier.connected_chains().items():
+        if not connected:
+            log.warning("chain_not_connected", network=network)
+        else:
+            log.info("chain_connected", network=network)
+
+    # Stream payment logs over websockets; polling stays as the fallback
+    if PAYMENT_DETECTION == "subscribe":
+        for chain_id, verifier in payment_verifier.verifiers.items():
+            chain = PAYMENT_CHAINS[chain_id]
+            log_streams[chain_id] = verifier.source = LogStream(chain["ws"], chain["token"], verifier)
+    log_stream_tasks = [asyncio.create_task(stream.run()) for stream in log_streams.values()]
+
+    # Re-check accepted payments until finalized, in case a reorg removes them
+    reorg_tracker.sources = {
+        chain_id: verifier.source for chain_id, verifier in payment_verifier.verifiers.items()
+    }
+    reorg_task = asyncio.create_task(reorg_tracker.run())
+
+    # Import frequently used job types up front; the rest load on first request
+    job_registry.preload(PRELOAD_JOBS)
+
+    # Precompute price tables for every job type
+    pricing_engine.prepare()
+
+    # Prewarm job worker processes
+    if JOB_RUNNER == "pool":
+        worker_pool.start()
+        log.info("job_workers_started", workers=worker_pool.size)
 
     # Start background cleanup task
     cleanup_task = asyncio.create_task(cleanup_expired_jobs())
 
+    # Re-dispatch jobs from worker nodes that stopped heartbeating
+    reaper_task = asyncio.create_task(dispatcher.reap_expired_leases()) if dispatcher else None
+
+    # Collect signed payments on-chain in periodic batches
+    if SETTLEMENT_PRIVATE_KEY:
+        settlement_engine.chains = {
+            chain_id: Web3SettlementChain(SETTLEMENT_PRIVATE_KEY, chain_id) for chain_id in PAYMENT_CHAINS
+        }
+        log.info("settlement_enabled", spender=settlement_engine.spender)
+    else:
+        log.warning("settlement_disabled", reason="SETTLEMENT_PRIVATE_KEY not set; signed payments are not collected")
+    settlement_task = asyncio.create_task(settlement_engine.run())
+
+    # Settle prepaid session spend periodically
+    session_store.on_settle = collect_session_spend
+    session_task = asyncio.create_task(session_store.run_settlement())
+
+    # Export finished trace spans in the background
+    trace_task = asyncio.create_task(tracer.run())
+
+    # Watch for callbacks that block the event loop (also toggled at /api/admin/loop-monitor)
+    if LOOP_MONITOR:
+        loop_monitor.start()
+
     yield
 
     # Shutdown
-    print("Shutting down x402 PoC server...")
+    log.info("server_stopping")
     cleanup_task.cancel()
+    reorg_task.cancel()
+    for task in log_stream_tasks:
+        task.cancel()
+    session_task.cancel()
+    session_store.settle()
+    settlement_task.cancel()
+    if settlement_engine.chains:
+        # Send what is queued; its outcome is not tracked past shutdown
+        await settlement_engine.settle_batch()
+    if reaper_task:
+        reaper_task.cancel()
+    connection_pool.close()
+    if JOB_RUNNER == "pool":
+        worker_pool.stop()
+    trace_task.cancel()
+    await tracer.flush()
+    loop_monitor.stop()
+    log_pipeline.stop()
 
 
 # Create FastAPI app
@@ -87,120 +308,375 @@ async def root():
     return {
         "service": "x402 PoC",
         "status": "running",
-        "network": "Base Sepolia",
+        "network": PAYMENT_CHAINS[CHAIN_ID]["network"],
+        "networks": payment_verifier.connected_chains() if payment_verifier else {},
         "connected": payment_verifier.is_connected() if payment_verifier else False
     }
 
 
 @app.get("/api/jobs")
 async def list_jobs():
-    """List all available job types and their prices"""
+    """List all available job types, their prices and pricing schedules"""
+    jobs = job_registry.list_jobs()
+    for name, info in jobs.items():
+        info["pricing"] = pricing_engine.schedule(name)
+        info["confirmations"] = confirmation_policy(name)
     return {
-        "jobs": job_registry.list_jobs(),
+        "jobs": jobs,
         "token_address": TOKEN_ADDRESS,
-        "recipient_address": PAYMENT_RECIPIENT_ADDRESS
+        "recipient_address": PAYMENT_RECIPIENT_ADDRESS,
+        "chains": payment_chains(),
+        # x402 signature payers approve this address to collect their payments
+        "settlement_spender": settlement_engine.spender
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+async def stats():
+    """Shared job infrastructure statistics"""
+    stats = {
+        "jobs": job_executions.stats(),
+        "loaded_job_types": job_registry.loaded_jobs(),
+        "sessions": session_store.stats(),
+        "speculative": speculative_payments.stats(),
+        "payment_ledger": payment_ledger.stats(),
+        "authorization_ledger": authorization_ledger.stats(),
+        "reorgs": reorg_tracker.stats(),
+        "log_streams": {str(chain_id): stream.stats() for chain_id, stream in log_streams.items()},
+        "tracing": tracer.stats(),
+        "loop_monitor": loop_monitor.stats(),
+        "logging": log_pipeline.stats(),
+        "settlement": settlement_engine.stats(),
+        "result_cache": result_cache.stats(),
+        "dns_cache": dns_cache.stats(),
+        "connection_pool": connection_pool.stats()
+    }
+    if JOB_RUNNER == "pool":
+        stats["worker_pool"] = worker_pool.stats()
+    return stats
+
+
+def build_job(job_type: str, params: Dict, job_id: str) -> Job:
+    """Create a job and validate its parameters"""
+    job_class = job_registry.get_job_class(job_type)
+    if not job_class:
+        raise HTTPException(status_code=400, detail=f"Unknown job type: {job_type}")
+
+    job = job_class(job_id=job_id, params=params)
+
+    is_valid, error_msg = job.validate_params()
+    if is_valid:
+        is_valid, error_msg = job.validate_cache_params()
+    if is_valid:
+        is_valid, error_msg = job.validate_time_limit()
+    if not is_valid:
+        raise HTTPException(status_code=400, detail=error_msg)
+    return job
+
+
+def job_already_paid(job_id: str) -> bool:
+    """Whether a job ID is paid for: still tracked as paid, or with its authorization being settled"""
+    existing = pending_jobs.get(job_id)
+    return bool(existing and existing["paid"]) or settlement_engine.job_status(job_id) is not None
+
+
+def quote_job(job: Job) -> Tuple[Decimal, int]:
+    """
+    Price a job: a quote already given for its job ID (in a 402 response)
+    holds until it expires, even if surge pricing has moved since
+    """
+    quoted = pending_jobs.get(job.job_id)
+    if (quoted and not quoted["paid"] and datetime.now(timezone.utc) <= quoted["expiry"]
+            and quoted["job"].get_name() == job.get_name() and quoted["job"].params == job.params):
+        return quoted["price"], quoted["amount_wei"]
+    return pricing_engine.quote(job)
+
+
 @app.post("/api/jobs/request")
 async def request_job(job_request: JobRequest, request: Request):
     """
     Request a job execution
 
+    - With X-SESSION header: Debit the prepaid session and authorize immediately
     - With X-PAYMENT header: Verify signature and authorize immediately
     - Without X-PAYMENT: Return 402 Payment Required with payment details
     """
-    # Validate job type
-    job_class = job_registry.get_job_class(job_request.job_type)
-    if not job_class:
-        raise HTTPException(status_code=400, detail=f"Unknown job type: {job_request.job_type}")
-
     # Get or generate job ID
     # For x402, client provides job_id; for traditional flow, we generate it
     job_id = job_request.job_id or str(uuid.uuid4())
 
-    # Create job instance for validation
-    job = job_class(job_id=job_id, params=job_request.params)
-
-    # Validate parameters
-    is_valid, error_msg = job.validate_params()
-    if not is_valid:
-        raise HTTPException(status_code=400, detail=error_msg)
-
-    # Get price
-    price = job_class.get_price()
-    amount_wei = str(int(price * 10**18))  # Convert to wei
-
-    # Check for X-PAYMENT header (x402 signature-based payment)
-    x_payment = request.headers.get("X-PAYMENT") or request.headers.get("x-payment")
-
-    if x_payment:
-        # Parse payment data
-        payment_data = parse_x_payment_header(x_payment)
-        if not payment_data:
-            raise HTTPException(status_code=400, detail="Invalid X-PAYMENT header format")
+    with tracer.span("request_job", job_id=job_id, parent=trace_parent(request, pending_jobs.get(job_id)),
+                     job_type=job_request.job_type) as span:
+        # Authorizing a paid job again would swap in a different job (or
+        # run it again) while only the first authorization is collected
+        if job_already_paid(job_id):
+            raise HTTPException(status_code=409, detail=f"Job {job_id} is already paid")
+
+        job = build_job(job_request.job_type, job_request.params, job_id)
+        price, amount_wei = quote_job(job)
+
+        # Check for X-SESSION header (prepaid session balance)
+        session_token = request.headers.get("X-SESSION")
+
+        if session_token:
+            try:
+                session = session_store.debit(session_token, amount_wei)
+            except InsufficientBalance as e:
+                request_outcomes["payment_required"].inc()
+                raise HTTPException(status_code=402, detail=str(e))
+            except SessionError as e:
+                request_outcomes["unauthorized"].inc()
+                raise HTTPException(status_code=401, detail=str(e))
 
-        # Verify signature
-        is_valid, signer_address, error_msg = verify_payment_signature(
-            payment_data,
-            job_id,
-            amount_wei
-        )
-
-        if is_valid:
-            # Signature valid - authorize immediately
             expiry = datetime.now(timezone.utc) + timedelta(seconds=PAYMENT_TIMEOUT_SECONDS)
             pending_jobs[job_id] = {
                 "job": job,
-                "wallet_address": signer_address,
+                "wallet_address": session.wallet,
                 "price": price,
+                "amount_wei": amount_wei,
                 "expiry": expiry,
-                "paid": True,  # Mark as paid via signature
-                "payment_method": "x402_signature"
+                "paid": True,
+                "payment_method": "session",
+                "session_id": session.session_id,
+                "trace": span.context
             }
 
+            request_outcomes["authorized"].inc()
             return {
                 "status": "authorized",
                 "job_id": job_id,
-                "message": "Payment authorized via x402 signature",
-                "signer": signer_address
+                "message": "Payment authorized from prepaid session",
+                "charged_wei": str(amount_wei),
+                "balance_wei": str(session.balance_wei)
             }
-        else:
-            # Signature invalid
-            raise HTTPException(status_code=401, detail=f"Payment authorization failed: {error_msg}")
-
-    # No X-PAYMENT header - traditional flow
-    # Store pending job
-    expiry = datetime.now(timezone.utc) + timedelta(seconds=PAYMENT_TIMEOUT_SECONDS)
-    pending_jobs[job_id] = {
-        "job": job,
-        "wallet_address": job_request.wallet_address,
-        "price": price,
-        "expiry": expiry,
-        "paid": False
-    }
 
-    # Return 402 Payment Required
-    return JSONResponse(
-        status_code=402,
-        content={
-            "job_id": job_id,
-            "message": "Payment Required",
-            "payment": {
-                "amount": str(price),
-                "token_address": TOKEN_ADDRESS,
-                "recipient_address": PAYMENT_RECIPIENT_ADDRESS,
-                "chain_id": 84532,
-                "network": "Base Sepolia"
-            },
-            "expires_at": expiry.isoformat(),
-            "timeout_seconds": PAYMENT_TIMEOUT_SECONDS
+        # Check for X-PAYMENT header (x402 signature-based payment)
+        x_payment = request.headers.get("X-PAYMENT") or request.headers.get("x-payment")
+
+        if x_payment:
+            # Parse payment data
+            payment_data = parse_x_payment_header(x_payment)
+            if not payment_data:
+                request_outcomes["invalid"].inc()
+                raise HTTPException(status_code=400, detail="Invalid X-PAYMENT header format")
+
+            # Verify signature
+            started = time.perf_counter()
+            with tracer.span("verify_payment_signature"):
+                is_valid, signer_address, error_msg = verify_payment_signature(
+                    payment_data,
+                    job_id,
+                    str(amount_wei)
+                )
+            signature_timings["payment"].observe(time.perf_counter() - started)
+
+            if is_valid:
+                # A copy of a used authorization doesn't authorize again
+                authorization = payment_authorization_key(payment_data)
+                if not authorization_ledger.use(authorization, authorization_expiry(payment_data)):
+                    request_outcomes["unauthorized"].inc()
+                    raise HTTPException(status_code=409, detail="Payment authorization already used")
+
+                # Signature valid - authorize immediately
+                expiry = datetime.now(timezone.utc) + timedelta(seconds=PAYMENT_TIMEOUT_SECONDS)
+                pending_jobs[job_id] = {
+                    "job": job,
+                    "wallet_address": signer_address,
+                    "price": price,
+                    "amount_wei": amount_wei,
+                    "expiry": expiry,
+                    "paid": True,  # Mark as paid via signature
+                    "payment_method": "x402_signature",
+                    "trace": span.context
+                }
+                settlement_engine.submit(
+                    authorization, signer_address, amount_wei, payment_chain_id(payment_data), payment_data,
+                    job_id=job_id
+                )
+
+                request_outcomes["authorized"].inc()
+                return {
+                    "status": "authorized",
+                    "job_id": job_id,
+                    "message": "Payment authorized via x402 signature",
+                    "signer": signer_address
+                }
+            else:
+                # Signature invalid
+                request_outcomes["unauthorized"].inc()
+                raise HTTPException(status_code=401, detail=f"Payment authorization failed: {error_msg}")
+
+        # No X-PAYMENT header - traditional flow
+        # Store pending job
+        expiry = datetime.now(timezone.utc) + timedelta(seconds=PAYMENT_TIMEOUT_SECONDS)
+        pending_jobs[job_id] = {
+            "job": job,
+            "wallet_address": job_request.wallet_address,
+            "price": price,
+            "amount_wei": amount_wei,
+            "expiry": expiry,
+            "paid": False,
+            "trace": span.context
         }
-    )
+
+        # Return 402 Payment Required
+        request_outcomes["payment_required"].inc()
+        return JSONResponse(
+            status_code=402,
+            content={
+                "job_id": job_id,
+                "message": "Payment Required",
+                "payment": {
+                    "amount": str(price),
+                    "amount_wei": str(amount_wei),
+                    "token_address": TOKEN_ADDRESS,
+                    "recipient_address": PAYMENT_RECIPIENT_ADDRESS,
+                    "chain_id": CHAIN_ID,
+                    "network": PAYMENT_CHAINS[CHAIN_ID]["network"],
+                    # Payment is accepted on any of these
+                    "chains": payment_chains()
+                },
+                "expires_at": expiry.isoformat(),
+                "timeout_seconds": PAYMENT_TIMEOUT_SECONDS
+            }
+        )
+
+
+@app.post("/api/jobs/request-batch")
+async def request_job_batch(batch_request: BatchJobRequest, request: Request):
+    """
+    Request many jobs under one payment authorization
+
+    - With X-PAYMENT header: Verify one batch signature over the Merkle root
+      of the jobs' (job ID, amount) pairs and authorize every job
+    - Without X-PAYMENT: Return 402 with each job's quote and the batch total
+    """
+    count = len(batch_request.jobs)
+    if not 0 < count <= MAX_BATCH_JOBS:
+        raise HTTPException(status_code=400, detail=f"A batch holds 1 to {MAX_BATCH_JOBS} jobs")
+    if len({item.job_id for item in batch_request.jobs}) != count:
+        raise HTTPException(status_code=400, detail="Duplicate job IDs in batch")
+
+    with tracer.span("request_job_batch", parent=trace_parent(request), jobs=count) as span:
+        jobs = []
+        quotes = []
+        for item in batch_request.jobs:
+            if job_already_paid(item.job_id):
+                raise HTTPException(status_code=409, detail=f"Job {item.job_id} is already paid")
+            job = build_job(item.job_type, item.params, item.job_id)
+            jobs.append(job)
+            quotes.append(quote_job(job))
+
+        # Leaves are in request order, so the client builds the same tree from its quotes
+        tree = MerkleTree.for_jobs([(job.job_id, amount_wei) for job, (_, amount_wei) in zip(jobs, quotes)])
+        jobs_root = "0x" + tree.root.hex()
+        total = sum(price for price, _ in quotes)
+        total_wei = sum(amount_wei for _, amount_wei in quotes)
+        expiry = datetime.now(timezone.utc) + timedelta(seconds=PAYMENT_TIMEOUT_SECONDS)
+
+        x_payment = request.headers.get("X-PAYMENT") or request.headers.get("x-payment")
+
+        if x_payment:
+            payment_data = parse_x_payment_header(x_payment)
+            if not payment_data:
+                request_outcomes["invalid"].inc(count)
+                raise HTTPException(status_code=400, detail="Invalid X-PAYMENT header format")
+
+            started = time.perf_counter()
+            with tracer.span("verify_batch_signature"):
+                is_valid, signer_address, error_msg = verify_batch_signature(
+                    payment_data, jobs_root, str(total_wei), count
+                )
+            signature_timings["batch"].observe(time.perf_counter() - started)
+            if not is_valid:
+                request_outcomes["unauthorized"].inc(count)
+                raise HTTPException(status_code=401, detail=f"Batch authorization failed: {error_msg}")
+
+            # A replayed batch authorization doesn't authorize its jobs again
+            authorization = batch_authorization_key(payment_data)
+            if not authorization_ledger.use(authorization, authorization_expiry(payment_data)):
+                request_outcomes["unauthorized"].inc(count)
+                raise HTTPException(status_code=409, detail="Batch authorization already used")
+
+            authorized = []
+            for index, (job, (price, amount_wei)) in enumerate(zip(jobs, quotes)):
+                # The batch signature plus this proof shows this one job was paid for
+                proof = ["0x" + node.hex() for node in tree.proof(index)]
+                pending_jobs[job.job_id] = {
+                    "job": job,
+                    "wallet_address": signer_address,
+                    "price": price,
+                    "amount_wei": amount_wei,
+                    "expiry": expiry,
+                    "paid": True,
+                    "payment_method": "x402_batch",
+                    "jobs_root": jobs_root,
+                    "proof": proof,
+                    "trace": span.context
+                }
+                # One settlement per job, each carrying its own proof
+                settlement_engine.submit(
+                    f"{authorization}:{job.job_id}", signer_address, amount_wei, payment_chain_id(payment_data),
+                    {"batch": payment_data, "proof": proof}, job_id=job.job_id
+                )
+                authorized.append({"job_id": job.job_id, "amount_wei": str(amount_wei), "proof": proof})
+
+            request_outcomes["authorized"].inc(count)
+            return {
+                "status": "authorized",
+                "message": f"{count} jobs authorized via x402 batch signature",
+                "signer": signer_address,
+                "jobs_root": jobs_root,
+                "jobs": authorized
+            }
+
+        # No X-PAYMENT header - quote the batch
+        for job, (price, amount_wei) in zip(jobs, quotes):
+            pending_jobs[job.job_id] = {
+                "job": job,
+                "wallet_address": batch_request.wallet_address,
+                "price": price,
+                "amount_wei": amount_wei,
+                "expiry": expiry,
+                "paid": False,
+                "trace": span.context
+            }
+
+        request_outcomes["payment_required"].inc(count)
+        return JSONResponse(
+            status_code=402,
+            content={
+                "message": "Payment Required",
+                "jobs": [
+                    {"job_id": job.job_id, "amount": str(price), "amount_wei": str(amount_wei)}
+                    for job, (price, amount_wei) in zip(jobs, quotes)
+                ],
+                "payment": {
+                    "amount": str(total),
+                    "amount_wei": str(total_wei),
+                    "job_count": count,
+                    "jobs_root": jobs_root,
+                    "token_address": TOKEN_ADDRESS,
+                    "recipient_address": PAYMENT_RECIPIENT_ADDRESS,
+                    "chain_id": CHAIN_ID,
+                    "network": PAYMENT_CHAINS[CHAIN_ID]["network"],
+                    # Payment is accepted on any of these
+                    "chains": payment_chains()
+                },
+                "expires_at": expiry.isoformat(),
+                "timeout_seconds": PAYMENT_TIMEOUT_SECONDS
+            }
+        )
 
 
 @app.post("/api/jobs/verify-payment")
-async def verify_payment(confirmation: PaymentConfirmation):
+async def verify_payment(confirmation: PaymentConfirmation, request: Request):
     """
     Verify payment and return execution URL
     """
@@ -212,45 +688,89 @@ async def verify_payment(confirmation: PaymentConfirmation):
 
     job_info = pending_jobs[job_id]
 
-    # Check if expired
-    if datetime.now(timezone.utc) > job_info["expiry"]:
-        del pending_jobs[job_id]
-        raise HTTPException(status_code=408, detail="Payment window expired")
-
-    # Check if already paid
-    if job_info["paid"]:
-        return {
-            "status": "already_paid",
-            "execution_url": f"/api/jobs/execute/{job_id}"
-        }
+    with tracer.span("verify_payment", job_id=job_id, parent=trace_parent(request, job_info)):
+        # Check if expired
+        if datetime.now(timezone.utc) > job_info["expiry"]:
+            del pending_jobs[job_id]
+            raise HTTPException(status_code=408, detail="Payment window expired")
 
-    # Verify payment on blockchain (30 second check per attempt)
-    success, tx_hash = await payment_verifier.verify_payment(
-        from_address=job_info["wallet_address"],
-        expected_amount=job_info["price"],
-        timeout=30  # Longer timeout for blockchain confirmation
-    )
+        # Check if already paid
+        if job_info["paid"]:
+            return {
+                "status": "already_paid",
+                "execution_url": f"/api/jobs/execute/{job_id}"
+            }
 
-    if success:
-        job_info["paid"] = True
-        job_info["tx_hash"] = tx_hash
-        return {
-            "status": "verified",
-            "tx_hash": tx_hash,
-            "execution_url": f"/api/jobs/execute/{job_id}"
-        }
-    else:
-        return JSONResponse(
-            status_code=402,
-            content={
+        # Start low-price jobs as soon as the transfer is seen, if the client asks
+        speculation_refused = None
+        if confirmation.speculative:
+            speculation_refused = speculative_payments.refusal(job_info["wallet_address"], job_info["amount_wei"])
+            if not speculation_refused:
+                is_valid, tx_hash, speculation_refused = await payment_verifier.inspect_transfer(
+                    job_info["wallet_address"], job_info["price"],
+                    tx_hash=confirmation.tx_hash, raw_tx=confirmation.raw_tx, chain_id=confirmation.chain_id
+                )
+                if is_valid:
+                    payment, speculation_refused = speculative_payments.start(
+                        job_id, job_info["wallet_address"], job_info["amount_wei"], tx_hash,
+                        payment_verifier.wait_for_receipt, payment_verifier.chain_of(tx_hash)
+                    )
+                if is_valid and not speculation_refused:
+                    if payment is None:
+                        raise HTTPException(status_code=409, detail="Transaction already paid for something else")
+                    job_info["paid"] = True
+                    job_info["payment_method"] = "speculative"
+                    job_info["tx_hash"] = tx_hash
+                    job_info["chain_id"] = payment_verifier.chain_of(tx_hash)
+                    job_info["payment"] = payment
+                    return {
+                        "status": "speculative",
+                        "tx_hash": tx_hash,
+                        "chain_id": job_info["chain_id"],
+                        "execution_url": f"/api/jobs/execute/{job_id}"
+                    }
+            # Otherwise fall back to waiting for the transfer to be mined
+
+        # Verify payment on every payment chain (30 second check per attempt),
+        # waiting for as many confirmations as the job type needs
+        confirmations = confirmation_policy(job_info["job"].get_name())
+        started = time.perf_counter()
+        success, tx_hash, chain_id = await payment_verifier.verify_payment(
+            from_address=job_info["wallet_address"],
+            expected_amount=job_info["price"],
+            timeout=30,  # Longer timeout for blockchain confirmation
+            confirmations=confirmations,
+            purpose=job_id  # A transfer that paid for anything else is skipped
+        )
+        payment_waits["verified" if success else "not_found"].observe(time.perf_counter() - started)
+
+        if success:
+            job_info["paid"] = True
+            job_info["tx_hash"] = tx_hash
+            job_info["chain_id"] = chain_id
+            # Output stops if a reorg removes the payment while the job runs
+            job_info["payment"] = reorg_tracker.watch(chain_id, tx_hash)
+            job_info["payment"].add_done_callback(revoke_if_reorged(job_id, tx_hash))
+            return {
+                "status": "verified",
+                "tx_hash": tx_hash,
+                "chain_id": chain_id,
+                "confirmations": confirmations,
+                "execution_url": f"/api/jobs/execute/{job_id}"
+            }
+        else:
+            content = {
                 "status": "payment_not_found",
-                "message": "Payment not yet detected on blockchain"
+                "message": "Payment not yet detected on blockchain (or not yet confirmed)",
+                "confirmations": confirmations
             }
-        )
+            if speculation_refused:
+                content["speculation_refused"] = speculation_refused
+            return JSONResponse(status_code=402, content=content)
 
 
 @app.get("/api/jobs/execute/{job_id}")
-async def execute_job(job_id: str):
+async def execute_job(job_id: str, request: Request):
     """
     Execute a paid job and stream results via SSE
     """
@@ -260,42 +780,258 @@ async def execute_job(job_id: str):
 
     job_info = pending_jobs[job_id]
 
-    # Check if expired
-    if datetime.now(timezone.utc) > job_info["expiry"]:
-        del pending_jobs[job_id]
-        raise HTTPException(status_code=408, detail="Job expired")
+    with tracer.span("execute_job", job_id=job_id, parent=trace_parent(request, job_info)) as span:
+        # Check if expired
+        if datetime.now(timezone.utc) > job_info["expiry"]:
+            del pending_jobs[job_id]
+            raise HTTPException(status_code=408, detail="Job expired")
+
+        # Check if paid
+        if not job_info["paid"]:
+            raise HTTPException(status_code=402, detail="Payment required")
+
+        # Get the job
+        job = job_info["job"]
 
-    # Check if paid
-    if not job_info["paid"]:
-        raise HTTPException(status_code=402, detail="Payment required")
+        # Clean up after execution starts (job can only be executed once)
+        asyncio.create_task(cleanup_job(job_id, delay=60))
 
-    # Get the job
-    job = job_info["job"]
+        # Stream execution via SSE
+        return create_sse_response(
+            job, runner=job_runner(), payment=job_info.get("payment"),
+            withhold=SPECULATIVE_WITHHOLD and job_info.get("payment_method") == "speculative",
+            trace=span.context
+        )
+
+
+@app.post("/api/sessions/nonce")
+async def session_nonce():
+    """A one-time nonce to sign in a deposit claim"""
+    nonce, expires_at = session_store.issue_nonce()
+    return {"nonce": nonce, "expires_at": int(expires_at)}
+
+
+@app.post("/api/sessions/deposit")
+async def open_deposit_session(deposit: DepositClaim):
+    """
+    Open a prepaid session funded by an on-chain transfer of `amount` wei
+    to the recipient. The depositor proves the transfer is theirs with an
+    EIP-712 DepositClaim over a nonce from /api/sessions/nonce. The chain
+    is scanned once here instead of per job.
+    """
+    claim_data = deposit.model_dump()
+    started = time.perf_counter()
+    is_valid, signer_address, error_msg = verify_deposit_claim(claim_data)
+    signature_timings["deposit_claim"].observe(time.perf_counter() - started)
+    if not is_valid:
+        raise HTTPException(status_code=401, detail=f"Deposit claim rejected: {error_msg}")
+    if not session_store.nonce_valid(deposit.nonce):
+        raise HTTPException(status_code=401, detail="Deposit claim rejected: unknown, used or expired nonce")
+
+    success, tx_hash, chain_id = await payment_verifier.verify_payment(
+        from_address=signer_address,
+        expected_amount=Decimal(int(deposit.amount)) / 10**TOKEN_DECIMALS,
+        timeout=30,
+        confirmations=parse_policy(SESSION_DEPOSIT_CONFIRMATIONS),
+        purpose=f"session-deposit-{deposit.nonce}",
+        chain_id=payment_chain_id(claim_data)
+    )
+    if not success:
+        return JSONResponse(
+            status_code=402,
+            content={
+                "status": "payment_not_found",
+                "message": "Deposit not yet detected on blockchain"
+            }
+        )
+
+    # Concurrent requests with one claim: only the first opens a session
+    if not session_store.use_nonce(deposit.nonce):
+        raise HTTPException(status_code=409, detail="Deposit claim already used")
+    try:
+        session, token = session_store.open(
+            signer_address, int(deposit.amount), "deposit", tx_hash, chain_id=chain_id
+        )
+    except SessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # A session whose deposit is reorganized out is closed
+    reorg_tracker.watch(chain_id, tx_hash).add_done_callback(close_if_reorged(session))
+
+    return {"session_token": token, "tx_hash": tx_hash, **session.to_dict()}
+
+
+@app.post("/api/sessions/cap")
+async def open_cap_session(cap: SpendingCap):
+    """
+    Open a prepaid session from an EIP-712 spending cap: one signature
+    allows up to `cap` wei of jobs until `validUntil`
+    """
+    cap_data = cap.model_dump()
+    started = time.perf_counter()
+    is_valid, signer_address, error_msg = verify_spending_cap(cap_data)
+    signature_timings["spending_cap"].observe(time.perf_counter() - started)
+    if not is_valid:
+        raise HTTPException(status_code=401, detail=f"Spending cap rejected: {error_msg}")
+
+    # The cap is collected later with transferFrom, so the payer must be able to cover it now
+    chain_id = payment_chain_id(cap_data)
+    try:
+        funding_error = await payment_verifier.funding_error(
+            chain_id, signer_address, int(cap.cap), settlement_engine.spender
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Could not check the payer's balance: {e}")
+    if funding_error:
+        raise HTTPException(status_code=402, detail=f"Spending cap rejected: {funding_error}")
+
+    try:
+        session, token = session_store.open(
+            signer_address, int(cap.cap), "cap", cap.nonce,
+            valid_until=cap.validUntil, authorization=cap_data, chain_id=chain_id
+        )
+    except SessionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {"session_token": token, **session.to_dict()}
+
+
+def require_session(request: Request):
+    """Return the session named by the X-SESSION header"""
+    token = request.headers.get("X-SESSION")
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing X-SESSION header")
+    try:
+        return session_store.authenticate(token)
+    except SessionError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+
+@app.get("/api/sessions/current")
+async def session_status(request: Request):
+    """Balance and spend of the caller's session"""
+    return require_session(request).to_dict()
 
-    # Clean up after execution starts (job can only be executed once)
-    asyncio.create_task(cleanup_job(job_id, delay=60))
 
-    # Stream execution via SSE
-    return create_sse_response(job)
+@app.post("/api/sessions/close")
+async def close_session(request: Request):
+    """Close the caller's session and settle its spend"""
+    session = require_session(request)
+    session_store.close(session)
+    return session.to_dict()
 
 
 @app.get("/api/jobs/status/{job_id}")
 async def job_status(job_id: str):
-    """Check status of a job"""
-    if job_id not in pending_jobs:
-        return {"status": "not_found"}
-
-    job_info = pending_jobs[job_id]
+    """Check status of a job (and of collecting its x402 signature payment)"""
+    settlement = settlement_engine.job_status(job_id)
+    job_info = pending_jobs.get(job_id)
+
+    if job_info is None:
+        status = {"status": "not_found"}
+    elif datetime.now(timezone.utc) > job_info["expiry"]:
+        status = {"status": "expired"}
+    else:
+        status = {
+            "status": "pending" if not job_info["paid"] else "paid",
+            "paid": job_info["paid"],
+            "expires_at": job_info["expiry"].isoformat(),
+            "price": str(job_info["price"])
+        }
+        if job_info.get("payment_method") == "x402_batch":
+            status["jobs_root"] = job_info["jobs_root"]
+            status["proof"] = job_info["proof"]
+
+    # Settlement outlives the job entry, which is removed soon after execution
+    if settlement:
+        status["settlement"] = settlement
+    return status
+
+
+def require_worker(request: Request):
+    """Authenticate a worker node and return the dispatch queue"""
+    if not dispatcher or not WORKER_TOKEN:
+        raise HTTPException(status_code=403, detail="Worker endpoints disabled")
+    token = request.headers.get("X-WORKER-TOKEN", "")
+    if not hmac.compare_digest(token, WORKER_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid worker token")
+    return dispatcher.queue
+
+
+@app.post("/api/workers/lease")
+async def worker_lease(lease: WorkerLease, request: Request):
+    """Hand the oldest queued job to a worker node (204 if none)"""
+    queue = require_worker(request)
+    task = await queue.lease(lease.worker_id)
+    if task is None:
+        return Response(status_code=204)
+    return task
+
+
+@app.post("/api/workers/tasks/{task_id}/heartbeat")
+async def worker_heartbeat(task_id: str, lease: WorkerLease, request: Request):
+    """Extend a worker's lease on a job"""
+    queue = require_worker(request)
+    return {"ok": await queue.heartbeat(task_id, lease.worker_id)}
+
+
+@app.post("/api/workers/tasks/{task_id}/output")
+async def worker_output(task_id: str, output: WorkerOutput, request: Request):
+    """Append job output reported by a worker"""
+    queue = require_worker(request)
+    return {"ok": await queue.append_output(task_id, output.worker_id, output.outputs)}
+
+
+@app.post("/api/workers/tasks/{task_id}/complete")
+async def worker_complete(task_id: str, completion: WorkerCompletion, request: Request):
+    """Mark a job finished by a worker"""
+    queue = require_worker(request)
+    return {"ok": await queue.complete(task_id, completion.worker_id, completion.error)}
+
+
+def require_admin(request: Request):
+    """Authenticate an operator for the diagnostics endpoints"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints disabled")
+    token = request.headers.get("X-ADMIN-TOKEN", "")
+    if not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/api/admin/loop-monitor")
+async def loop_monitor_status(request: Request):
+    """Event-loop lag, and the stacks of recent stalls"""
+    require_admin(request)
+    return {**loop_monitor.stats(), "recent_stalls": list(loop_monitor.recent_stalls)}
+
+
+@app.post("/api/admin/loop-monitor")
+async def toggle_loop_monitor(enabled: bool, request: Request):
+    """Start or stop the event-loop lag monitor"""
+    require_admin(request)
+    if enabled:
+        loop_monitor.start()
+    else:
+        loop_monitor.stop()
+    return loop_monitor.stats()
 
-    if datetime.now(timezone.utc) > job_info["expiry"]:
-        return {"status": "expired"}
 
-    return {
-        "status": "pending" if not job_info["paid"] else "paid",
-        "paid": job_info["paid"],
-        "expires_at": job_info["expiry"].isoformat(),
-        "price": str(job_info["price"])
-    }
+@app.post("/api/admin/profile", response_class=PlainTextResponse)
+async def take_profile(request: Request, seconds: float = 10, interval: float = PROFILE_INTERVAL):
+    """
+    Sample every thread's stack for `seconds` and return the folded stacks
+    (for flamegraph.pl, speedscope and similar tools)
+    """
+    require_admin(request)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be between 0 and {PROFILE_MAX_SECONDS}")
+    if not 0.001 <= interval <= 1:
+        raise HTTPException(status_code=400, detail="interval must be between 0.001 and 1 seconds")
+    try:
+        folded = await profiler.profile(seconds, interval)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(folded)
 
 
 async def cleanup_job(job_id: str, delay: int = 60):
@@ -317,8 +1053,9 @@ async def cleanup_expired_jobs():
         ]
         for job_id in expired:
             del pending_jobs[job_id]
+        expired_jobs.inc(len(expired))
         if expired:
-            print(f"Cleaned up {len(expired)} expired jobs")
+            log.info("expired_jobs_removed", count=len(expired))
 
 
 # Background cleanup task is now started in lifespan
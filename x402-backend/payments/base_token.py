@@ -1,21 +1,27 @@
 """
-ERC20 token payment verification for Base network
+ERC20 token payment verification on the U token's chains
 """
 import asyncio
 import time
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from web3 import Web3
-from web3.exceptions import BlockNotFound
+from web3.exceptions import TransactionNotFound
 from decimal import Decimal
+from payments.confirmations import BlockSource, Policy, wait_for_payment
+from payments.ledger import PaymentLedger, payment_ledger
+from telemetry.metrics import rpc_request_seconds, rpc_errors
+from telemetry.tracing import tracer
+from telemetry.logs import get_logger
 from config import (
-    BASE_SEPOLIA_RPC,
-    TOKEN_ADDRESS,
     TOKEN_DECIMALS,
     PAYMENT_RECIPIENT_ADDRESS,
+    PAYMENT_CHAINS,
     CHAIN_ID
 )
 
-# ERC20 ABI (minimal - just Transfer event and balanceOf)
+log = get_logger("payments.base_token")
+
+# ERC20 ABI (minimal - Transfer event, balanceOf and what settlement uses)
 ERC20_ABI = [
     {
         "anonymous": False,
@@ -40,26 +46,129 @@ ERC20_ABI = [
         "name": "decimals",
         "outputs": [{"name": "", "type": "uint8"}],
         "type": "function"
+    },
+    {
+        "constant": False,
+        "inputs": [{"name": "_to", "type": "address"}, {"name": "_value", "type": "uint256"}],
+        "name": "transfer",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function"
+    },
+    {
+        "constant": True,
+        "inputs": [{"name": "_owner", "type": "address"}, {"name": "_spender", "type": "address"}],
+        "name": "allowance",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": False,
+        "inputs": [
+            {"name": "_from", "type": "address"},
+            {"name": "_to", "type": "address"},
+            {"name": "_value", "type": "uint256"}
+        ],
+        "name": "transferFrom",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function"
     }
 ]
 
 
-class PaymentVerifier:
-    """Verifies ERC20 token payments on Base network"""
+def rpc_metrics(chain_id: int):
+    """
+    web3 middleware recording each RPC request's latency, and its failures,
+    per method; within a traced payment, each request is also a span
+    """
+    chain = str(chain_id)
+    # Per method: span name, latency series and error series, bound once
+    bound: Dict[str, Tuple[str, Any, Any]] = {}
+
+    def middleware(make_request, w3):
+        def record(method, params):
+            series = bound.get(method)
+            if series is None:
+                series = bound[method] = (
+                    f"rpc {method}", rpc_request_seconds.labels(chain, method), rpc_errors.labels(chain, method)
+                )
+            span_name, seconds, errors = series
+
+            started = time.perf_counter()
+            with tracer.child(span_name, chain=chain_id) as span:
+                try:
+                    response = make_request(method, params)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    seconds.observe(time.perf_counter() - started)
+                if "error" in response:
+                    errors.inc()
+                    span.set_attribute("error", str(response["error"]))
+            return response
+        return record
 
-    def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider(BASE_SEPOLIA_RPC))
+    return middleware
+
+
+class PaymentVerifier(BlockSource):
+    """Verifies ERC20 token payments on one chain"""
+
+    def __init__(self, chain_id: int = CHAIN_ID, rpc_url: Optional[str] = None):
+        chain = PAYMENT_CHAINS[chain_id]
+        self.chain_id = chain_id
+        self.network = chain["network"]
+        # rpc_url overrides the chain's configured RPC, e.g. for a local node
+        self.w3 = Web3(Web3.HTTPProvider(rpc_url or chain["rpc"]))
+        self.w3.middleware_onion.add(rpc_metrics(chain_id), name="metrics")
         self.token_contract = self.w3.eth.contract(
-            address=Web3.to_checksum_address(TOKEN_ADDRESS),
+            address=Web3.to_checksum_address(chain["token"]),
             abi=ERC20_ABI
         )
         self.recipient = Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS)
+        # Where payments are looked for: this verifier's own polling, or a log
+        # subscription that falls back to it
+        self.source: BlockSource = self
+
+    def _transfers(self, from_address: str, from_block: int, to_block: int) -> List[Tuple[str, int]]:
+        transfer_filter = self.token_contract.events.Transfer.create_filter(
+            fromBlock=from_block,
+            toBlock=to_block,
+            argument_filters={
+                'from': from_address,
+                'to': self.recipient
+            }
+        )
+        return [(event['transactionHash'].hex(), event['args']['value']) for event in transfer_filter.get_all_entries()]
+
+    def _receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        try:
+            receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+        return {"status": receipt["status"], "blockNumber": receipt["blockNumber"], "blockHash": receipt["blockHash"].hex()}
+
+    # BlockSource: RPC calls run in threads so that chains can be watched concurrently
+
+    async def head(self) -> int:
+        return await asyncio.to_thread(lambda: self.w3.eth.block_number)
+
+    async def tagged_block(self, tag: str) -> int:
+        return (await asyncio.to_thread(self.w3.eth.get_block, tag))["number"]
+
+    async def receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._receipt, tx_hash)
+
+    async def transfers(self, from_address: str, from_block: int, to_block: int) -> List[Tuple[str, int]]:
+        return await asyncio.to_thread(self._transfers, Web3.to_checksum_address(from_address), from_block, to_block)
 
     async def verify_payment(
         self,
         from_address: str,
         expected_amount: Decimal,
-        timeout: int = 300
+        timeout: int = 300,
+        confirmations: Policy = 0,
+        claim: Optional[Callable[[str], bool]] = None
     ) -> tuple[bool, Optional[str]]:
         """
         Verify that a payment was made from the given address.
@@ -68,65 +177,125 @@ class PaymentVerifier:
             from_address: Address of the payer
             expected_amount: Expected amount in U tokens
             timeout: Maximum time to wait for payment (seconds)
+            confirmations: Confirmation policy the transfer must meet
+            claim: Claims a confirmed transfer; transfers it refuses are skipped
 
         Returns:
             (success, transaction_hash)
         """
-        from_address = Web3.to_checksum_address(from_address)
-        expected_wei = self._to_token_wei(expected_amount)
+        with tracer.span("PaymentVerifier.verify_payment", chain=self.chain_id) as span:
+            tx_hash = await wait_for_payment(
+                self.source, from_address, self._to_token_wei(expected_amount), confirmations, timeout,
+                claim=claim
+            )
+            span.set_attribute("tx_hash", tx_hash or "")
+        if tx_hash is None:
+            return False, None
+        log.info("payment_verified", network=self.network, tx_hash=tx_hash)
+        return True, tx_hash
+
+    async def inspect_transfer(
+        self,
+        from_address: str,
+        expected_amount: Decimal,
+        tx_hash: Optional[str] = None,
+        raw_tx: Optional[str] = None
+    ) -> tuple[bool, Optional[str], Optional[str]]:
+        """
+        Check a payment that is not mined yet: a pending transaction (or a
+        signed raw one, which is broadcast first) from the payer calling
+        transfer(recipient, amount) on the token, funded by their balance.
+
+        Returns:
+            (is_valid, transaction_hash, error_message)
+        """
+        return await asyncio.to_thread(
+            self._inspect_transfer, Web3.to_checksum_address(from_address),
+            self._to_token_wei(expected_amount), tx_hash, raw_tx
+        )
+
+    def _inspect_transfer(
+        self,
+        from_address: str,
+        expected_wei: int,
+        tx_hash: Optional[str],
+        raw_tx: Optional[str]
+    ) -> tuple[bool, Optional[str], Optional[str]]:
+        send_error = None
+        if raw_tx:
+            tx_hash = Web3.keccak(hexstr=raw_tx).hex()
+            try:
+                self.w3.eth.send_raw_transaction(raw_tx)
+            except Exception as e:
+                # Possibly already broadcast by the payer; the lookup decides
+                send_error = e
+        if not tx_hash:
+            return False, None, "Missing tx_hash or raw_tx"
+
+        try:
+            tx = self.w3.eth.get_transaction(tx_hash)
+        except TransactionNotFound:
+            return False, tx_hash, f"Transaction not found{f': {send_error}' if send_error else ''}"
+        except Exception as e:
+            return False, tx_hash, f"Error fetching transaction: {e}"
+
+        if tx["blockNumber"] is not None:
+            # Mined transfers are found (and claimed) by the payment scan instead
+            return False, tx_hash, "Transaction is already mined"
+        if tx["from"] != from_address:
+            return False, tx_hash, "Transaction is not from the payer"
+        if tx["to"] != self.token_contract.address:
+            return False, tx_hash, "Transaction is not a token transfer"
+        try:
+            function, args = self.token_contract.decode_function_input(tx["input"])
+        except ValueError:
+            return False, tx_hash, "Transaction is not a token transfer"
+        if function.fn_name != "transfer" or args["_to"] != self.recipient:
+            return False, tx_hash, "Transaction does not pay the recipient"
+        if args["_value"] < expected_wei:
+            return False, tx_hash, "Transfer amount is below the price"
+        if self.token_contract.functions.balanceOf(from_address).call() < args["_value"]:
+            return False, tx_hash, "Payer balance does not cover the transfer"
 
-        start_time = time.time()
-        current_block = self.w3.eth.block_number
-        # Look back 20 blocks to catch fast transactions
-        start_block = max(0, current_block - 20)
-        last_checked_block = start_block - 1
+        return True, tx_hash, None
 
-        while time.time() - start_time < timeout:
+    async def wait_for_receipt(self, tx_hash: str, timeout: float) -> Optional[bool]:
+        """
+        Wait for a transaction to be mined
+
+        Returns:
+            True if it succeeded, False if it reverted, None if it was not mined within timeout
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
             try:
-                # Get latest block
-                current_block = self.w3.eth.block_number
-
-                if current_block > last_checked_block:
-                    # Check for Transfer events from last_checked_block to current
-                    from_block = max(start_block, last_checked_block + 1)
-
-                    transfer_filter = self.token_contract.events.Transfer.create_filter(
-                        from_block=from_block,
-                        to_block=current_block,
-                        argument_filters={
-                            'from': from_address,
-                            'to': self.recipient
-                        }
-                    )
-
-                    events = transfer_filter.get_all_entries()
-
-                    for event in events:
-                        # Check if the amount matches
-                        if event['args']['value'] >= expected_wei:
-                            tx_hash = event['transactionHash'].hex()
-                            print(f"Payment verified: {tx_hash}")
-                            return True, tx_hash
-
-                    last_checked_block = current_block
-
-                # Wait before next check
-                await asyncio.sleep(2)
-
-            except BlockNotFound:
-                await asyncio.sleep(2)
-                continue
+                receipt = await asyncio.to_thread(self.w3.eth.get_transaction_receipt, tx_hash)
+                return receipt["status"] == 1
+            except TransactionNotFound:
+                pass
             except Exception as e:
-                print(f"Error checking payment: {e}")
-                await asyncio.sleep(2)
-                continue
+                log.warning("receipt_check_failed", network=self.network, tx_hash=tx_hash, error=str(e))
+            await asyncio.sleep(2)
+        return None
 
-        return False, None
+    async def funding_error(self, owner: str, amount_wei: int, spender: Optional[str] = None) -> Optional[str]:
+        """Why the owner's balance (or allowance for spender) can't cover amount_wei, or None if it can"""
+        owner = Web3.to_checksum_address(owner)
+        balance = await asyncio.to_thread(self.token_contract.functions.balanceOf(owner).call)
+        if balance < amount_wei:
+            return f"Balance {balance} wei does not cover {amount_wei} wei"
+        if spender:
+            allowance = await asyncio.to_thread(
+                self.token_contract.functions.allowance(owner, Web3.to_checksum_address(spender)).call
+            )
+            if allowance < amount_wei:
+                return f"Allowance {allowance} wei for {spender} does not cover {amount_wei} wei"
+        return None
 
     async def check_balance(self, address: str) -> Decimal:
         """Check token balance for an address"""
         address = Web3.to_checksum_address(address)
-        balance_wei = self.token_contract.functions.balanceOf(address).call()
+        balance_wei = await asyncio.to_thread(self.token_contract.functions.balanceOf(address).call)
         return self._from_token_wei(balance_wei)
 
     def _to_token_wei(self, amount: Decimal) -> int:
@@ -143,3 +312,134 @@ class PaymentVerifier:
             return self.w3.is_connected()
         except:
             return False
+
+
+class MultiChainVerifier:
+    """
+    Verifies payments on every chain in PAYMENT_CHAINS at once, so a payer
+    can pay on whichever chain is faster or cheaper for them. Each check
+    runs on all chains concurrently and the first confirmed match wins.
+    """
+
+    def __init__(self, chain_ids: Optional[List[int]] = None, ledger: PaymentLedger = payment_ledger):
+        self.verifiers: Dict[int, PaymentVerifier] = {
+            chain_id: PaymentVerifier(chain_id) for chain_id in (chain_ids or PAYMENT_CHAINS)
+        }
+        # Where accepted transfers are claimed, so none pays twice
+        self.ledger = ledger
+        # Chain each speculatively inspected transaction was found on
+        self._tx_chains: Dict[str, int] = {}
+
+    async def verify_payment(
+        self,
+        from_address: str,
+        expected_amount: Decimal,
+        timeout: int = 300,
+        confirmations: Policy = 0,
+        purpose: Optional[str] = None,
+        chain_id: Optional[int] = None
+    ) -> tuple[bool, Optional[str], Optional[int]]:
+        """
+        Verify that a payment was made from the given address on any chain
+        (or only on chain_id). With a purpose (e.g. the job ID), the transfer
+        is claimed for it in the ledger, and a transfer that already paid
+        for something else is not accepted.
+
+        Returns:
+            (success, transaction_hash, chain_id)
+        """
+        if chain_id is not None and chain_id not in self.verifiers:
+            return False, None, None
+        tasks = {
+            asyncio.create_task(verifier.verify_payment(
+                from_address, expected_amount, timeout, confirmations, claim=self._claimer(chain, purpose)
+            )): chain
+            for chain, verifier in self.verifiers.items()
+            if chain_id is None or chain == chain_id
+        }
+        pending = set(tasks)
+        found: List[Tuple[str, int]] = []
+        try:
+            while pending and not found:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        success, tx_hash = task.result()
+                        if success:
+                            found.append((tx_hash, tasks[task]))
+            if not found:
+                return False, None, None
+            # Payments found on two chains at once: keep the first, free the other's claim
+            for tx_hash, chain in found[1:]:
+                if purpose is not None:
+                    self.ledger.release(chain, tx_hash, purpose)
+            tx_hash, chain = found[0]
+            return True, tx_hash, chain
+        finally:
+            # Stop watching the other chains
+            for task in pending:
+                task.cancel()
+
+    async def inspect_transfer(
+        self,
+        from_address: str,
+        expected_amount: Decimal,
+        tx_hash: Optional[str] = None,
+        raw_tx: Optional[str] = None,
+        chain_id: Optional[int] = None
+    ) -> tuple[bool, Optional[str], Optional[str]]:
+        """
+        Check an unmined payment on `chain_id`, or on every chain at once
+        (only the chain the transaction is for will know it)
+
+        Returns:
+            (is_valid, transaction_hash, error_message)
+        """
+        if chain_id is not None and chain_id not in self.verifiers:
+            return False, tx_hash, f"Unsupported chain: {chain_id}"
+        chain_ids = [chain_id] if chain_id is not None else list(self.verifiers)
+        results = await asyncio.gather(*(
+            self.verifiers[chain].inspect_transfer(from_address, expected_amount, tx_hash, raw_tx)
+            for chain in chain_ids
+        ))
+
+        for chain, (is_valid, found_hash, _) in zip(chain_ids, results):
+            if is_valid:
+                self._tx_chains[found_hash] = chain
+                return True, found_hash, None
+
+        # Report why the transaction was refused where it was found, if anywhere
+        errors = [error for _, _, error in results if not error.startswith("Transaction not found")]
+        return False, results[0][1], errors[0] if errors else results[0][2]
+
+    def _claimer(self, chain_id: int, purpose: Optional[str]) -> Optional[Callable[[str], bool]]:
+        if purpose is None:
+            return None
+        return lambda tx_hash: self.ledger.claim(chain_id, tx_hash, purpose)
+
+    async def funding_error(self, chain_id: int, owner: str, amount_wei: int,
+                            spender: Optional[str] = None) -> Optional[str]:
+        """Why the owner can't fund amount_wei on chain_id, or None if they can (see PaymentVerifier)"""
+        if chain_id not in self.verifiers:
+            return f"Unsupported chain: {chain_id}"
+        return await self.verifiers[chain_id].funding_error(owner, amount_wei, spender)
+
+    async def wait_for_receipt(self, tx_hash: str, timeout: float) -> Optional[bool]:
+        """Wait for an inspected transaction to be mined on its chain (see PaymentVerifier)"""
+        chain_id = self._tx_chains.get(tx_hash, CHAIN_ID)
+        try:
+            return await self.verifiers[chain_id].wait_for_receipt(tx_hash, timeout)
+        finally:
+            self._tx_chains.pop(tx_hash, None)
+
+    def chain_of(self, tx_hash: str) -> Optional[int]:
+        """Chain an inspected transaction is waiting on"""
+        return self._tx_chains.get(tx_hash)
+
+    def connected_chains(self) -> Dict[str, bool]:
+        """Connection state per network"""
+        return {verifier.network: verifier.is_connected() for verifier in self.verifiers.values()}
+
+    def is_connected(self) -> bool:
+        """Check if connected to at least one payment chain"""
+        return any(verifier.is_connected() for verifier in self.verifiers.values())
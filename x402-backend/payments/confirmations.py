@@ -0,0 +1,221 @@
+"""
+Confirmation policies and reorg tracking for on-chain payments
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from telemetry.logs import get_logger
+from config import REORG_CHECK_SECONDS
+
+log = get_logger("payments.confirmations")
+
+# Block tags a policy can name instead of a depth
+SAFE = "safe"
+FINALIZED = "finalized"
+
+# A block depth (0 accepts a transfer as soon as it is mined, N waits for
+# N more blocks on top of it) or SAFE / FINALIZED
+Policy = Union[int, str]
+
+# Consecutive checks a watched payment may be missing from the chain before
+# it counts as reorganized out (one miss can be a lagging RPC node)
+REORG_MISSES = 2
+
+
+def parse_policy(value: Union[int, str]) -> Policy:
+    """Validate a policy, e.g. from the environment ("3", "safe")"""
+    if isinstance(value, str) and value.strip().lower() in (SAFE, FINALIZED):
+        return value.strip().lower()
+    depth = int(value)
+    if depth < 0:
+        raise ValueError("Confirmation depth must be 0 or more")
+    return depth
+
+
+class BlockSource(ABC):
+    """Chain reads that payment detection and confirmation tracking need"""
+
+    @abstractmethod
+    async def head(self) -> int:
+        """Latest block number"""
+        pass
+
+    @abstractmethod
+    async def tagged_block(self, tag: str) -> int:
+        """Number of the SAFE or FINALIZED block"""
+        pass
+
+    @abstractmethod
+    async def receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        """{"status", "blockNumber", "blockHash"} of a transaction on the canonical chain, None if it isn't on it"""
+        pass
+
+    @abstractmethod
+    async def transfers(self, from_address: str, from_block: int, to_block: int) -> List[Tuple[str, int]]:
+        """(tx hash, value in wei) of token transfers from the payer to the recipient in a block range"""
+        pass
+
+    async def wait_for_update(self, timeout: float):
+        """Wait up to timeout for the chain to change; sources that are told about changes return early"""
+        await asyncio.sleep(timeout)
+
+
+async def confirmed_through(source: BlockSource, policy: Policy, head: int) -> int:
+    """Highest block whose transfers meet the policy"""
+    if isinstance(policy, str):
+        return await source.tagged_block(policy)
+    return head - policy
+
+
+async def wait_for_payment(source: BlockSource, from_address: str, expected_wei: int, policy: Policy = 0,
+                           timeout: float = 300, poll_interval: float = 2,
+                           claim: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+    """
+    Wait for a transfer of at least expected_wei from the payer that meets
+    the confirmation policy; returns its tx hash, or None on timeout.
+
+    A matching transfer is re-read from the chain on every poll while it
+    gains confirmations. If a reorg removes it, scanning starts over, so a
+    transfer re-mined in another block is still found. With `claim`, a
+    confirmed transfer is only returned if claim(tx_hash) accepts it; one
+    that already paid for something else is skipped.
+    """
+    deadline = time.monotonic() + timeout
+    start_block: Optional[int] = None
+    last_checked_block = 0
+    candidate: Optional[str] = None
+    refused: set = set()
+
+    while time.monotonic() < deadline:
+        try:
+            head = await source.head()
+            if start_block is None:
+                # Look back 20 blocks (plus the confirmation wait) to catch fast transactions
+                start_block = max(0, min(head, await confirmed_through(source, policy, head)) - 20)
+                last_checked_block = start_block - 1
+
+            if candidate is None and head > last_checked_block:
+                for tx_hash, value in await source.transfers(from_address, last_checked_block + 1, head):
+                    if value >= expected_wei and tx_hash not in refused:
+                        candidate = tx_hash
+                        break
+                last_checked_block = head
+
+            if candidate is not None:
+                receipt = await source.receipt(candidate)
+                if receipt is None or receipt["status"] != 1:
+                    log.warning("payment_left_chain", tx_hash=candidate)
+                    candidate = None
+                    last_checked_block = start_block - 1
+                elif receipt["blockNumber"] <= await confirmed_through(source, policy, head):
+                    if claim is None or claim(candidate):
+                        return candidate
+                    # Already paid for something else: look for another transfer
+                    refused.add(candidate)
+                    candidate = None
+                    last_checked_block = start_block - 1
+                    continue
+
+        except Exception as e:
+            log.warning("payment_check_failed", error=str(e))
+
+        await source.wait_for_update(poll_interval)
+
+    return None
+
+
+class WatchedPayment:
+    """An accepted payment watched until its block is finalized"""
+
+    def __init__(self, chain_id: int, tx_hash: str, future: "asyncio.Future[bool]"):
+        self.chain_id = chain_id
+        self.tx_hash = tx_hash
+        self.future = future
+        self.block_hash: Optional[str] = None
+        self.misses = 0
+
+
+class ReorgTracker:
+    """
+    Watches accepted payments until their blocks are finalized.
+
+    Each watch returns a future that resolves True once the payment's
+    block is finalized, or False if a reorg removes the payment from the
+    chain. A payment re-mined in a different block stays valid.
+    """
+
+    def __init__(self, sources: Optional[Dict[int, BlockSource]] = None):
+        # Chain ID -> where its payments are checked
+        self.sources: Dict[int, BlockSource] = sources or {}
+        self._watched: List[WatchedPayment] = []
+        self.finalized = 0
+        self.reorged = 0
+        self.remined = 0
+
+    def watch(self, chain_id: int, tx_hash: str) -> "asyncio.Future[bool]":
+        """Start watching an accepted payment"""
+        future = asyncio.get_running_loop().create_future()
+        if chain_id not in self.sources:
+            # Nothing to check it against
+            future.set_result(True)
+            return future
+        self._watched.append(WatchedPayment(chain_id, tx_hash, future))
+        return future
+
+    async def check(self):
+        """Check every watched payment once"""
+        by_chain: Dict[int, List[WatchedPayment]] = {}
+        for payment in self._watched:
+            by_chain.setdefault(payment.chain_id, []).append(payment)
+        results = await asyncio.gather(
+            *(self._check_chain(chain_id, payments) for chain_id, payments in by_chain.items()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                log.warning("reorg_check_failed", error=str(result))
+        self._watched = [payment for payment in self._watched if not payment.future.done()]
+
+    async def _check_chain(self, chain_id: int, payments: List[WatchedPayment]):
+        source = self.sources[chain_id]
+        finalized = await source.tagged_block(FINALIZED)
+        for payment in payments:
+            if payment.future.done():
+                continue
+            receipt = await source.receipt(payment.tx_hash)
+            if receipt is None or receipt["status"] != 1:
+                payment.misses += 1
+                if payment.misses >= REORG_MISSES:
+                    self.reorged += 1
+                    log.warning("payment_reorged", chain_id=chain_id, tx_hash=payment.tx_hash)
+                    payment.future.set_result(False)
+                continue
+
+            payment.misses = 0
+            if payment.block_hash and receipt["blockHash"] != payment.block_hash:
+                self.remined += 1
+            payment.block_hash = receipt["blockHash"]
+            if receipt["blockNumber"] <= finalized:
+                self.finalized += 1
+                payment.future.set_result(True)
+
+    async def run(self, interval: float = REORG_CHECK_SECONDS):
+        """Background task: check watched payments periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            if self._watched:
+                await self.check()
+
+    def stats(self) -> Dict[str, int]:
+        """Reorg tracking counters"""
+        return {
+            "watched": len(self._watched),
+            "finalized": self.finalized,
+            "reorged": self.reorged,
+            "remined": self.remined,
+        }
+
+
+# Global reorg tracker (its sources are the payment verifiers, set at startup)
+reorg_tracker = ReorgTracker()
@@ -0,0 +1,102 @@
+"""
+Transfers that have already paid for something, so that one on-chain
+transfer can't pay twice (for two jobs, or for a job and a session deposit),
+and signed authorizations that have already been used
+"""
+import heapq
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from config import PAYMENT_CLAIM_TTL_SECONDS
+
+
+class PaymentLedger:
+    """
+    Claims on transfers by chain and tx hash. Every path that accepts a
+    transfer as payment claims it here first. A transfer claimed for one
+    purpose (a job ID, a session deposit) is refused for any other.
+
+    Claims are kept for `ttl` seconds, long after a transfer is out of
+    reach of the payment scan, and pruned oldest first as new ones arrive.
+    """
+
+    def __init__(self, ttl: float = PAYMENT_CLAIM_TTL_SECONDS):
+        self.ttl = ttl
+        # (chain ID, tx hash) -> (claimed at, purpose), oldest first
+        self._claims: "OrderedDict[Tuple[int, str], Tuple[float, str]]" = OrderedDict()
+        self.refused = 0
+
+    def claim(self, chain_id: int, tx_hash: str, purpose: str) -> bool:
+        """Claim a transfer for purpose; False if it already paid for something else"""
+        now = time.monotonic()
+        self._prune(now)
+        key = (chain_id, tx_hash.lower())
+        claim = self._claims.get(key)
+        if claim is None:
+            self._claims[key] = (now, purpose)
+            return True
+        if claim[1] == purpose:
+            return True
+        self.refused += 1
+        return False
+
+    def release(self, chain_id: int, tx_hash: str, purpose: str):
+        """Drop purpose's claim on a transfer it ended up not using"""
+        key = (chain_id, tx_hash.lower())
+        claim = self._claims.get(key)
+        if claim is not None and claim[1] == purpose:
+            del self._claims[key]
+
+    def claimed_by(self, chain_id: int, tx_hash: str) -> Optional[str]:
+        """What a transfer paid for, if it is claimed"""
+        claim = self._claims.get((chain_id, tx_hash.lower()))
+        return claim[1] if claim else None
+
+    def _prune(self, now: float):
+        while self._claims:
+            key, (claimed_at, _) = next(iter(self._claims.items()))
+            if now - claimed_at < self.ttl:
+                break
+            del self._claims[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Ledger counters"""
+        return {"claims": len(self._claims), "refused": self.refused}
+
+
+class AuthorizationLedger:
+    """
+    Signed x402 authorizations (by message hash) that have authorized jobs,
+    so a replayed X-PAYMENT header can't authorize them again. Each is kept
+    until it expires; past that, signature verification refuses it anyway.
+    """
+
+    def __init__(self):
+        # key -> expiry (unix time), with a heap of (expiry, key) to prune in order
+        self._used: Dict[str, float] = {}
+        self._expiries: List[Tuple[float, str]] = []
+        self.refused = 0
+
+    def use(self, key: str, expires_at: float) -> bool:
+        """Record an authorization as used; False if it already was"""
+        self._prune(time.time())
+        if key in self._used:
+            self.refused += 1
+            return False
+        self._used[key] = expires_at
+        heapq.heappush(self._expiries, (expires_at, key))
+        return True
+
+    def _prune(self, now: float):
+        while self._expiries and self._expiries[0][0] < now:
+            _, key = heapq.heappop(self._expiries)
+            del self._used[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Ledger counters"""
+        return {"used": len(self._used), "refused": self.refused}
+
+
+# Global payment ledger instances
+payment_ledger = PaymentLedger()
+authorization_ledger = AuthorizationLedger()
@@ -0,0 +1,238 @@
+"""
+Push-mode payment detection: Transfer logs to the recipient streamed over
+a websocket eth_subscribe, instead of polled
+"""
+import asyncio
+import itertools
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from web3 import Web3
+
+from payments.confirmations import BlockSource
+from telemetry.logs import get_logger
+from config import (
+    PAYMENT_RECIPIENT_ADDRESS,
+    LOG_STREAM_BACKFILL_BLOCKS,
+    LOG_STREAM_REFETCH_BLOCKS,
+    LOG_STREAM_RECONNECT_SECONDS
+)
+
+log = get_logger("payments.log_stream")
+
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").hex()
+
+# Longest wait between reconnect attempts
+MAX_RECONNECT_SECONDS = 30
+
+
+def address_topic(address: str) -> str:
+    """An address as an indexed event topic"""
+    return "0x" + address.lower()[2:].rjust(64, "0")
+
+
+class LogStream(BlockSource):
+    """
+    Keeps an index of the token's Transfer logs to the recipient, fed by one
+    eth_subscribe("logs") per connection, plus the head from "newHeads".
+
+    Reads are served from the index while the subscription is live and
+    covers the blocks asked about; anything else (and everything while
+    disconnected) goes to `fallback`, the polling RPC source. After a
+    reconnect the stream resubscribes and backfills the blocks it missed
+    with eth_getLogs, re-fetching the last few it had, since a reorg may
+    have replaced them meanwhile. wait_for_update() returns as soon as a
+    new block or log arrives, so waiting payments see a transfer when the
+    node does.
+    """
+
+    def __init__(self, ws_url: str, token_address: str, fallback: BlockSource,
+                 recipient: str = PAYMENT_RECIPIENT_ADDRESS,
+                 reconnect_seconds: float = LOG_STREAM_RECONNECT_SECONDS):
+        self.ws_url = ws_url
+        self.token_address = Web3.to_checksum_address(token_address)
+        self.recipient = recipient
+        self.fallback = fallback
+        self.reconnect_seconds = reconnect_seconds
+        self.live = False
+        self._head = 0
+        # First block the index has every log for (None until first connected)
+        self._covered_from: Optional[int] = None
+        # tx hash -> (payer, value, block number, block hash)
+        self._logs: Dict[str, Tuple[str, int, int, str]] = {}
+        # Transactions whose log a reorg removed
+        self._removed: set = set()
+        self._updated = asyncio.Event()
+        self._ids = itertools.count(1)
+        self._calls: Dict[int, asyncio.Future] = {}
+        self.connects = 0
+        self.notifications = 0
+        self.backfilled = 0
+
+    # BlockSource
+
+    async def head(self) -> int:
+        if self.live:
+            return self._head
+        return await self.fallback.head()
+
+    async def tagged_block(self, tag: str) -> int:
+        return await self.fallback.tagged_block(tag)
+
+    async def receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        if self.live:
+            # Only successful transfers emit logs, so a logged one has status 1
+            if tx_hash in self._logs:
+                _, _, number, block_hash = self._logs[tx_hash]
+                return {"status": 1, "blockNumber": number, "blockHash": block_hash}
+            if tx_hash in self._removed:
+                return None
+        return await self.fallback.receipt(tx_hash)
+
+    async def transfers(self, from_address: str, from_block: int, to_block: int) -> List[Tuple[str, int]]:
+        if not self.live or self._covered_from is None or from_block < self._covered_from:
+            return await self.fallback.transfers(from_address, from_block, to_block)
+        payer = from_address.lower()
+        return [
+            (tx_hash, value) for tx_hash, (source, value, number, _) in self._logs.items()
+            if source == payer and from_block <= number <= to_block
+        ]
+
+    async def wait_for_update(self, timeout: float):
+        updated = self._updated
+        try:
+            await asyncio.wait_for(updated.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    # Subscription
+
+    async def run(self):
+        """Background task: stay subscribed, reconnecting with backoff"""
+        delay = self.reconnect_seconds
+        async with aiohttp.ClientSession() as session:
+            while True:
+                try:
+                    async with session.ws_connect(self.ws_url, heartbeat=30) as ws:
+                        delay = self.reconnect_seconds
+                        await self._follow(ws)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.warning("log_subscription_failed", url=self.ws_url, error=str(e))
+                self.live = False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_SECONDS)
+
+    async def _follow(self, ws: aiohttp.ClientWebSocketResponse):
+        reader = asyncio.create_task(self._read(ws))
+        try:
+            # Subscribe first, so nothing mined during the backfill is missed
+            await self._call(ws, "eth_subscribe", ["newHeads"])
+            await self._call(ws, "eth_subscribe", ["logs", {
+                "address": self.token_address,
+                "topics": [TRANSFER_TOPIC, None, address_topic(self.recipient)],
+            }])
+            head = int(await self._call(ws, "eth_blockNumber", []), 16)
+            await self._backfill(ws, head)
+            self._head = max(self._head, head)
+            self.connects += 1
+            self.live = True
+            self._wake()
+            await reader
+        finally:
+            reader.cancel()
+
+    async def _backfill(self, ws: aiohttp.ClientWebSocketResponse, head: int):
+        if self._covered_from is None or head - self._head > LOG_STREAM_BACKFILL_BLOCKS:
+            # First connection, or too long a gap: start a fresh index
+            from_block = max(0, head - LOG_STREAM_BACKFILL_BLOCKS)
+            self._logs.clear()
+            self._covered_from = from_block
+        else:
+            from_block = max(self._covered_from, self._head - LOG_STREAM_REFETCH_BLOCKS)
+        logs = await self._call(ws, "eth_getLogs", [{
+            "fromBlock": hex(from_block),
+            "toBlock": hex(head),
+            "address": self.token_address,
+            "topics": [TRANSFER_TOPIC, None, address_topic(self.recipient)],
+        }])
+        # What is no longer in the re-fetched blocks was reorganized away
+        for tx_hash, (_, _, number, _) in list(self._logs.items()):
+            if from_block <= number <= head:
+                del self._logs[tx_hash]
+                self._removed.add(tx_hash)
+        for log in logs:
+            self._index(log)
+        self.backfilled += len(logs)
+
+    async def _read(self, ws: aiohttp.ClientWebSocketResponse):
+        try:
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.TEXT:
+                    break
+                data = json.loads(message.data)
+                if "id" in data:
+                    future = self._calls.pop(data["id"], None)
+                    if future and not future.done():
+                        if "error" in data:
+                            future.set_exception(RuntimeError(data["error"].get("message", "RPC error")))
+                        else:
+                            future.set_result(data.get("result"))
+                elif data.get("method") == "eth_subscription":
+                    self.notifications += 1
+                    result = data["params"]["result"]
+                    if "topics" in result:
+                        self._index(result)
+                    else:
+                        # A new head; after a reorg it can be lower than before
+                        self._head = int(result["number"], 16)
+                    self._wake()
+        finally:
+            self.live = False
+            for future in self._calls.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("subscription connection closed"))
+            self._calls.clear()
+        raise ConnectionError("subscription connection closed")
+
+    async def _call(self, ws: aiohttp.ClientWebSocketResponse, method: str, params: List[Any]) -> Any:
+        call_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = future
+        await ws.send_str(json.dumps({"jsonrpc": "2.0", "id": call_id, "method": method, "params": params}))
+        return await asyncio.wait_for(future, 30)
+
+    def _index(self, log: Dict[str, Any]):
+        tx_hash = log["transactionHash"]
+        if log.get("removed"):
+            self._logs.pop(tx_hash, None)
+            self._removed.add(tx_hash)
+            return
+        number = int(log["blockNumber"], 16)
+        payer = "0x" + log["topics"][1][-40:]
+        self._logs[tx_hash] = (payer.lower(), int(log["data"], 16), number, log["blockHash"])
+        self._removed.discard(tx_hash)
+        # A log can arrive before the header of its block
+        self._head = max(self._head, number)
+        # Forget blocks too old for any payment lookback
+        if len(self._logs) > 10000:
+            self._covered_from = max(self._covered_from or 0, self._head - LOG_STREAM_BACKFILL_BLOCKS)
+            for old, (_, _, old_number, _) in list(self._logs.items()):
+                if old_number < self._covered_from:
+                    del self._logs[old]
+
+    def _wake(self):
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        """Subscription counters"""
+        return {
+            "live": self.live,
+            "connects": self.connects,
+            "notifications": self.notifications,
+            "backfilled": self.backfilled,
+            "indexed": len(self._logs),
+        }
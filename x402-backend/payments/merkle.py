@@ -0,0 +1,61 @@
+"""
+Merkle trees over (job ID, amount) pairs for batch payment authorization
+"""
+from typing import List, Sequence, Tuple
+from eth_abi import encode
+from eth_utils import keccak
+
+
+def job_leaf(job_id: str, amount_wei: int) -> bytes:
+    """
+    Leaf for one job: keccak256(keccak256(abi.encode(jobId, amount))).
+    Hashing twice keeps a leaf from ever equalling an inner node.
+    """
+    return keccak(keccak(encode(["string", "uint256"], [job_id, amount_wei])))
+
+
+def _hash_pair(a: bytes, b: bytes) -> bytes:
+    # Sorted pairs, so a proof needs no left/right flags
+    return keccak(a + b) if a < b else keccak(b + a)
+
+
+class MerkleTree:
+    """Binary Merkle tree; an unpaired node at the end of a level moves up unchanged"""
+
+    def __init__(self, leaves: Sequence[bytes]):
+        if not leaves:
+            raise ValueError("A Merkle tree needs at least one leaf")
+        self.levels: List[List[bytes]] = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                parents.append(level[-1])
+            self.levels.append(parents)
+
+    @classmethod
+    def for_jobs(cls, jobs: Sequence[Tuple[str, int]]) -> "MerkleTree":
+        """Tree over (job_id, amount_wei) pairs, in order"""
+        return cls([job_leaf(job_id, amount_wei) for job_id, amount_wei in jobs])
+
+    @property
+    def root(self) -> bytes:
+        return self.levels[-1][0]
+
+    def proof(self, index: int) -> List[bytes]:
+        """Sibling hashes from leaf `index` up to the root"""
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                proof.append(level[sibling])
+            index //= 2
+        return proof
+
+
+def verify_proof(leaf: bytes, proof: Sequence[bytes], root: bytes) -> bool:
+    """Check that `leaf` is in the tree with the given root"""
+    node = leaf
+    for sibling in proof:
+        node = _hash_pair(node, sibling)
+    return node == root
@@ -0,0 +1,141 @@
+"""
+Parameter-aware job pricing with precomputed wei tables
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from jobs.base import Job, job_executions
+from jobs.registry import JobRegistry, job_registry
+from config import TOKEN_DECIMALS, PRICE_TIERS, SURGE_CAPACITY, SURGE_LEVELS
+
+# Surge levels as (load threshold, multiplier); level 0 is the base price
+SurgeLevels = List[Tuple[float, Decimal]]
+
+
+def _plain(amount: Decimal) -> Decimal:
+    """Drop trailing zeros without switching to exponent notation (0.0100 -> 0.01, 1E+1 -> 10)"""
+    return Decimal(format(amount.normalize(), "f"))
+
+
+class PriceTable:
+    """
+    Every possible price of one job type: for each surge level, the
+    amount and the wei amount of 0..max_units units, with graduated tiers
+    applied. Built once, so quoting is two list lookups.
+    """
+
+    def __init__(self, unit_price: Decimal, price_unit: str, max_units: int,
+                 tiers: List[Tuple[int, Decimal]], surge_levels: SurgeLevels):
+        self.unit_price = unit_price
+        self.price_unit = price_unit
+        self.max_units = max_units
+        self.tiers = sorted(tiers)
+
+        base = [Decimal(0)]
+        for unit in range(1, max_units + 1):
+            base.append(base[-1] + unit_price * self._multiplier(unit))
+
+        multipliers = [Decimal(1)] + [multiplier for _, multiplier in surge_levels]
+        self.amounts: List[List[Decimal]] = [
+            [_plain(amount * multiplier) for amount in base] for multiplier in multipliers
+        ]
+        self.wei: List[List[int]] = [
+            [int((amount * 10**TOKEN_DECIMALS).to_integral_value(ROUND_HALF_UP)) for amount in amounts]
+            for amounts in self.amounts
+        ]
+
+    def _multiplier(self, unit: int) -> Decimal:
+        """Tier multiplier for the unit-th unit (1-based)"""
+        multiplier = Decimal(1)
+        for first_unit, tier_multiplier in self.tiers:
+            if unit >= first_unit:
+                multiplier = tier_multiplier
+        return multiplier
+
+    def schedule(self) -> Dict[str, Any]:
+        """Published form of the base (no surge) prices"""
+        tiers = [{"first_unit": 1, "unit_price": str(self.unit_price)}]
+        tiers += [
+            {"first_unit": first_unit, "unit_price": str(_plain(self.unit_price * multiplier))}
+            for first_unit, multiplier in self.tiers
+        ]
+        return {
+            "unit_price": str(self.unit_price),
+            "price_unit": self.price_unit,
+            "max_units": self.max_units,
+            "tiers": tiers,
+        }
+
+
+class PricingEngine:
+    """
+    Quotes jobs from their validated params and the current load.
+
+    A job's price is its number of units (Job.units()), charged per unit
+    with graduated volume tiers (PRICE_TIERS) and multiplied by the surge
+    level reached by current load. Current load is open job streams over
+    SURGE_CAPACITY (SURGE_LEVELS). All prices are precomputed per job type.
+    """
+
+    def __init__(self, registry: JobRegistry = job_registry,
+                 tiers: Dict[str, List[Tuple[int, Decimal]]] = PRICE_TIERS,
+                 surge_levels: SurgeLevels = SURGE_LEVELS, capacity: int = SURGE_CAPACITY,
+                 load: Optional[Callable[[], int]] = None):
+        self.registry = registry
+        self.tiers = tiers
+        self.surge_levels = sorted(surge_levels)
+        self.capacity = capacity
+        self._load = load or (lambda: job_executions.streams)
+        # Load (in streams) at which each surge level starts
+        self._thresholds = [threshold * capacity for threshold, _ in self.surge_levels]
+        self._tables: Dict[str, PriceTable] = {}
+
+    def prepare(self):
+        """Build the tables for every registered job type (at startup, off the request path)"""
+        for name in self.registry.list_jobs():
+            self._table(name)
+
+    def _table(self, name: str) -> PriceTable:
+        table = self._tables.get(name)
+        if table is None:
+            info = self.registry.get_job_info(name)
+            table = PriceTable(
+                Decimal(info["price"]), info["price_unit"], info["max_units"],
+                self.tiers.get(name, []), self.surge_levels
+            )
+            self._tables[name] = table
+        return table
+
+    def surge_level(self) -> int:
+        """Index of the surge level current load has reached (0 = no surge)"""
+        load = self._load()
+        level = 0
+        for threshold in self._thresholds:
+            if load < threshold:
+                break
+            level += 1
+        return level
+
+    def quote(self, job: Job) -> Tuple[Decimal, int]:
+        """Return (amount in U, amount in wei) for a validated job at current load"""
+        table = self._table(job.get_name())
+        units = job.units()
+        if not 0 < units <= table.max_units:
+            raise ValueError(f"{units} {table.price_unit}s is outside 1..{table.max_units}")
+        level = self.surge_level()
+        return table.amounts[level][units], table.wei[level][units]
+
+    def schedule(self, name: str) -> Dict[str, Any]:
+        """Pricing schedule for a job type, including surge levels and the current one"""
+        level = self.surge_level()
+        return {
+            **self._table(name).schedule(),
+            "surge": [
+                {"load": threshold, "multiplier": str(multiplier)}
+                for threshold, multiplier in self.surge_levels
+            ],
+            "current_multiplier": str(self.surge_levels[level - 1][1]) if level else "1",
+        }
+
+
+# Global pricing engine (tables are built by prepare() at startup)
+pricing_engine = PricingEngine()
@@ -0,0 +1,224 @@
+"""
+Prepaid sessions: one verified deposit or signed spending cap funds an
+off-chain balance that later jobs debit with a cheap HMAC session token
+"""
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from telemetry.logs import get_logger
+from config import CHAIN_ID, SESSION_SECRET, SESSION_TTL_SECONDS, SESSION_SETTLE_SECONDS, SESSION_NONCE_TTL_SECONDS
+
+log = get_logger("payments.sessions")
+
+# Settlement records kept for inspection
+MAX_SETTLEMENT_HISTORY = 1000
+
+# Deposit claim nonces outstanding at once (the oldest are dropped first)
+MAX_PENDING_NONCES = 10000
+
+
+class SessionError(Exception):
+    """Raised for forged, unknown, expired or closed session tokens"""
+
+
+class InsufficientBalance(SessionError):
+    """Raised when a session's balance does not cover a job"""
+
+
+class Session:
+    """One prepaid session and its off-chain balance (all amounts in wei)"""
+
+    def __init__(self, session_id: str, wallet: str, funded_wei: int, funding: str,
+                 reference: str, expires_at: float, authorization: Optional[Dict[str, Any]] = None,
+                 chain_id: int = CHAIN_ID):
+        self.session_id = session_id
+        self.wallet = wallet
+        self.funded_wei = funded_wei
+        self.balance_wei = funded_wei
+        # Spent but not yet settled
+        self.unsettled_wei = 0
+        self.settled_wei = 0
+        self.jobs = 0
+        # "deposit" (on-chain transfer, reference is its tx hash) or
+        # "cap" (signed spending cap, reference is its nonce)
+        self.funding = funding
+        self.reference = reference
+        # The signed cap, which settlement needs to collect the spend
+        self.authorization = authorization
+        # Chain the funding was verified on, and where its spend settles
+        self.chain_id = chain_id
+        self.expires_at = expires_at
+        self.closed = False
+
+    @property
+    def active(self) -> bool:
+        return not self.closed and time.time() < self.expires_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "wallet": self.wallet,
+            "funding": self.funding,
+            "chain_id": self.chain_id,
+            "funded_wei": str(self.funded_wei),
+            "balance_wei": str(self.balance_wei),
+            "unsettled_wei": str(self.unsettled_wei),
+            "settled_wei": str(self.settled_wei),
+            "jobs": self.jobs,
+            "expires_at": int(self.expires_at),
+            "active": self.active,
+        }
+
+
+class SessionStore:
+    """
+    Holds open sessions and authorizes jobs against them.
+
+    A session token is "<session_id>.<HMAC-SHA256(secret, session_id)>",
+    so checking one is a hash and a dict lookup: no signature recovery
+    and no chain access. Spend accumulates per session and is settled
+    in batches every SESSION_SETTLE_SECONDS, and when a session closes.
+    """
+
+    def __init__(self, secret: str = SESSION_SECRET, ttl: int = SESSION_TTL_SECONDS,
+                 nonce_ttl: int = SESSION_NONCE_TTL_SECONDS):
+        # Without a configured secret, tokens (like sessions) last until restart
+        self._secret = secret.encode() if secret else secrets.token_bytes(32)
+        self.ttl = ttl
+        self.nonce_ttl = nonce_ttl
+        self._sessions: Dict[str, Session] = {}
+        # Deposit tx hashes and cap nonces that already funded a session
+        self._used_references: set = set()
+        # Deposit claim nonce -> when it expires, oldest first
+        self._nonces: "OrderedDict[str, float]" = OrderedDict()
+        self.settlements: deque = deque(maxlen=MAX_SETTLEMENT_HISTORY)
+        # Called with each settlement record, to collect the spend on-chain
+        self.on_settle: Optional[Callable[[Dict[str, Any]], None]] = None
+        self.debits = 0
+        self.rejected = 0
+
+    def _sign(self, session_id: str) -> str:
+        return hmac.new(self._secret, session_id.encode(), hashlib.sha256).hexdigest()
+
+    def issue_nonce(self) -> Tuple[str, float]:
+        """A one-time nonce for a deposit claim, and when it expires"""
+        now = time.time()
+        while self._nonces and (
+            next(iter(self._nonces.values())) <= now or len(self._nonces) >= MAX_PENDING_NONCES
+        ):
+            self._nonces.popitem(last=False)
+        nonce = secrets.token_hex(16)
+        self._nonces[nonce] = now + self.nonce_ttl
+        return nonce, self._nonces[nonce]
+
+    def nonce_valid(self, nonce: str) -> bool:
+        """Whether a nonce was issued here and is neither used nor expired"""
+        return self._nonces.get(nonce, 0) > time.time()
+
+    def use_nonce(self, nonce: str) -> bool:
+        """Use up a nonce; False if it is unknown, used or expired"""
+        return self._nonces.pop(nonce, 0) > time.time()
+
+    def open(self, wallet: str, funded_wei: int, funding: str, reference: str,
+             valid_until: Optional[float] = None, authorization: Optional[Dict[str, Any]] = None,
+             chain_id: int = CHAIN_ID) -> Tuple[Session, str]:
+        """Open a funded session; returns it with its token"""
+        key = (funding, reference.lower())
+        if key in self._used_references:
+            raise SessionError(f"This {funding} already funded a session")
+        self._used_references.add(key)
+
+        expires_at = time.time() + self.ttl
+        if valid_until is not None:
+            expires_at = min(expires_at, valid_until)
+
+        session_id = uuid.uuid4().hex
+        session = Session(session_id, wallet, funded_wei, funding, reference, expires_at, authorization, chain_id)
+        self._sessions[session_id] = session
+        return session, f"{session_id}.{self._sign(session_id)}"
+
+    def authenticate(self, token: str) -> Session:
+        """Return the active session a token belongs to"""
+        session_id, _, mac = token.partition(".")
+        if not hmac.compare_digest(mac.encode(), self._sign(session_id).encode()):
+            self.rejected += 1
+            raise SessionError("Invalid session token")
+
+        session = self._sessions.get(session_id)
+        if session is None or not session.active:
+            self.rejected += 1
+            raise SessionError("Session expired or closed")
+        return session
+
+    def debit(self, token: str, amount_wei: int) -> Session:
+        """Charge a job to the token's session"""
+        session = self.authenticate(token)
+        if amount_wei > session.balance_wei:
+            self.rejected += 1
+            raise InsufficientBalance(
+                f"Session balance {session.balance_wei} wei does not cover {amount_wei} wei"
+            )
+        session.balance_wei -= amount_wei
+        session.unsettled_wei += amount_wei
+        session.jobs += 1
+        self.debits += 1
+        return session
+
+    def close(self, session: Session):
+        """Close a session, settling what it spent"""
+        session.closed = True
+        self._settle(session)
+
+    def _settle(self, session: Session) -> Optional[Dict[str, Any]]:
+        if not session.unsettled_wei:
+            return None
+        record = {
+            "session_id": session.session_id,
+            "wallet": session.wallet,
+            "funding": session.funding,
+            "reference": session.reference,
+            "chain_id": session.chain_id,
+            "amount_wei": str(session.unsettled_wei),
+            "settled_at": int(time.time()),
+        }
+        session.settled_wei += session.unsettled_wei
+        session.unsettled_wei = 0
+        self.settlements.append(record)
+        if self.on_settle:
+            self.on_settle(record)
+        return record
+
+    def settle(self) -> List[Dict[str, Any]]:
+        """Settle all unsettled spend and forget finished sessions"""
+        records = [record for record in map(self._settle, list(self._sessions.values())) if record]
+        for session_id, session in list(self._sessions.items()):
+            if not session.active:
+                del self._sessions[session_id]
+        return records
+
+    async def run_settlement(self, interval: float = SESSION_SETTLE_SECONDS):
+        """Background task: settle session spend periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            records = self.settle()
+            if records:
+                total = sum(int(record["amount_wei"]) for record in records)
+                log.info("sessions_settled", amount_wei=total, sessions=len(records))
+
+    def stats(self) -> Dict[str, int]:
+        """Session counters"""
+        return {
+            "open": sum(1 for session in self._sessions.values() if session.active),
+            "debits": self.debits,
+            "rejected": self.rejected,
+            "settlements": len(self.settlements),
+        }
+
+
+# Global session store instance
+session_store = SessionStore()
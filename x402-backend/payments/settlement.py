@@ -0,0 +1,369 @@
+"""
+Batched on-chain settlement of verified payment authorizations
+"""
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple, Union
+from eth_account import Account
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from payments.base_token import ERC20_ABI, rpc_metrics
+from telemetry.logs import get_logger
+from config import (
+    CHAIN_ID,
+    PAYMENT_CHAINS,
+    PAYMENT_RECIPIENT_ADDRESS,
+    SETTLEMENT_INTERVAL_SECONDS,
+    SETTLEMENT_BATCH_SIZE,
+    SETTLEMENT_MAX_ATTEMPTS,
+    SETTLEMENT_RETRY_SECONDS,
+    SETTLEMENT_CONFIRM_SECONDS
+)
+
+log = get_logger("payments.settlement")
+
+# Settlement states
+PENDING = "pending"  # waiting for the next batch (or its retry)
+SUBMITTED = "submitted"  # transfer sent, waiting to be mined
+SETTLED = "settled"
+FAILED = "failed"  # gave up after max_attempts
+UNCONFIRMED = "unconfirmed"  # sent but never mined; not resent, so nothing is collected twice
+
+# Finished settlements kept for status lookups, at most this many for at most this long
+MAX_SETTLEMENT_HISTORY = 10000
+MAX_SETTLEMENT_AGE = 3600
+
+# (payer, amount in wei)
+Transfer = Tuple[str, int]
+
+
+class SettlementChain(ABC):
+    """Where settlement transfers go on one chain: each one collects from a payer to the recipient"""
+
+    # Address payers approve
+    spender: str
+
+    @abstractmethod
+    async def send_transfers(self, transfers: List[Transfer]) -> List[Union[str, Exception]]:
+        """Send one transfer per (payer, amount); returns each one's tx hash or the error sending it"""
+        pass
+
+    @abstractmethod
+    async def receipts(self, tx_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Receipts ({"status", "blockNumber"}) of the mined transactions among tx_hashes"""
+        pass
+
+
+class Web3SettlementChain(SettlementChain):
+    """
+    Collects with ERC20 transferFrom, sent by the settlement account that
+    payers approve. A batch's transfers use consecutive nonces and are sent
+    back to back, so they are mined together.
+    """
+
+    def __init__(self, private_key: str, chain_id: int = CHAIN_ID):
+        chain = PAYMENT_CHAINS[chain_id]
+        self.chain_id = chain_id
+        self.w3 = Web3(Web3.HTTPProvider(chain["rpc"]))
+        self.w3.middleware_onion.add(rpc_metrics(chain_id), name="metrics")
+        self.account = Account.from_key(private_key)
+        self.spender = self.account.address
+        self.token_contract = self.w3.eth.contract(
+            address=Web3.to_checksum_address(chain["token"]),
+            abi=ERC20_ABI
+        )
+        self.recipient = Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS)
+
+    def _send(self, transfers: List[Transfer]) -> List[Union[str, Exception]]:
+        nonce = self.w3.eth.get_transaction_count(self.account.address, "pending")
+        results: List[Union[str, Exception]] = []
+        for payer, amount_wei in transfers:
+            try:
+                tx = self.token_contract.functions.transferFrom(
+                    Web3.to_checksum_address(payer), self.recipient, amount_wei
+                ).build_transaction({"from": self.account.address, "nonce": nonce, "chainId": self.chain_id})
+                signed = self.account.sign_transaction(tx)
+                results.append(self.w3.eth.send_raw_transaction(signed.rawTransaction).hex())
+                nonce += 1
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def send_transfers(self, transfers: List[Transfer]) -> List[Union[str, Exception]]:
+        return await asyncio.to_thread(self._send, transfers)
+
+    def _receipts(self, tx_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        found = {}
+        for tx_hash in tx_hashes:
+            try:
+                receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            found[tx_hash] = {"status": receipt["status"], "blockNumber": receipt["blockNumber"]}
+        return found
+
+    async def receipts(self, tx_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.to_thread(self._receipts, tx_hashes)
+
+
+class Settlement:
+    """One verified authorization being collected"""
+
+    def __init__(self, key: str, payer: str, amount_wei: int, chain_id: int = CHAIN_ID,
+                 authorization: Optional[Dict[str, Any]] = None, job_id: Optional[str] = None):
+        self.key = key
+        self.job_id = job_id
+        self.payer = payer
+        self.amount_wei = amount_wei
+        self.chain_id = chain_id
+        # The signed authorization, kept as evidence of what the payer agreed to
+        self.authorization = authorization
+        self.status = PENDING
+        self.attempts = 0
+        self.next_attempt = 0.0
+        self.tx_hash: Optional[str] = None
+        self.submitted_at = 0.0
+        self.block_number: Optional[int] = None
+        self.error: Optional[str] = None
+        self.finished_at = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "key": self.key,
+            "payer": self.payer,
+            "amount_wei": str(self.amount_wei),
+            "chain_id": self.chain_id,
+            "attempts": self.attempts,
+            "tx_hash": self.tx_hash,
+            "block_number": self.block_number,
+            "error": self.error,
+        }
+
+
+class SettlementEngine:
+    """
+    Collects verified payment authorizations and settles them in batches.
+
+    Each batch takes up to batch_size due authorizations, sums them per
+    payer and chain and sends one transfer per payer, so N jobs from one
+    wallet cost one transaction. A transfer that can't be sent or reverts is retried
+    with exponential backoff, up to max_attempts. A transfer that was sent
+    but is not mined within confirm_seconds is marked unconfirmed rather
+    than resent, so a payer is never charged twice.
+    """
+
+    def __init__(self, chains: Optional[Dict[int, SettlementChain]] = None,
+                 batch_size: int = SETTLEMENT_BATCH_SIZE, max_attempts: int = SETTLEMENT_MAX_ATTEMPTS,
+                 retry_seconds: float = SETTLEMENT_RETRY_SECONDS, confirm_seconds: float = SETTLEMENT_CONFIRM_SECONDS,
+                 history_seconds: float = MAX_SETTLEMENT_AGE):
+        # Chain ID -> where to settle; authorizations for other chains are dropped
+        self.chains: Dict[int, SettlementChain] = chains or {}
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.confirm_seconds = confirm_seconds
+        self.history_seconds = history_seconds
+        self._records: Dict[str, Settlement] = {}
+        # job ID -> key of the settlement that pays for it
+        self._jobs: Dict[str, str] = {}
+        self._pending: Dict[str, Settlement] = {}
+        # tx hash -> the settlements it collects (all on one chain)
+        self._submitted: Dict[str, List[Settlement]] = {}
+        self._finished: deque = deque(maxlen=MAX_SETTLEMENT_HISTORY)
+        self.batches = 0
+        self.transfers = 0
+        self.counts = {SETTLED: 0, FAILED: 0, UNCONFIRMED: 0}
+        # Authorizations not queued because nothing could settle them
+        self.dropped = 0
+
+    @property
+    def spender(self) -> Optional[str]:
+        """Address payers approve (the same settlement account on every chain)"""
+        for chain in self.chains.values():
+            return chain.spender
+        return None
+
+    def submit(self, key: str, payer: str, amount_wei: int, chain_id: int = CHAIN_ID,
+               authorization: Optional[Dict[str, Any]] = None, job_id: Optional[str] = None) -> bool:
+        """
+        Queue a verified authorization for the next batch. key identifies
+        the signed authorization itself, so submitting the same one again
+        is a no-op while a job ID can be paid by a later authorization.
+        With settlement off, or no settlement account on its chain, it is
+        dropped instead (returns False), so nothing piles up.
+        """
+        if chain_id not in self.chains:
+            self.dropped += 1
+            if self.chains:
+                log.warning("settlement_dropped", key=key, chain_id=chain_id, reason="chain not configured")
+            return False
+        if key in self._records:
+            return True
+        settlement = Settlement(key, payer, amount_wei, chain_id, authorization, job_id)
+        self._records[key] = settlement
+        self._pending[key] = settlement
+        if job_id is not None:
+            self._jobs[job_id] = key
+        return True
+
+    def status(self, key: str) -> Optional[Dict[str, Any]]:
+        """Settlement state of an authorization, if it is known"""
+        settlement = self._records.get(key)
+        return settlement.to_dict() if settlement else None
+
+    def job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Settlement state of the latest authorization paying for a job, if it is known"""
+        key = self._jobs.get(job_id)
+        return self.status(key) if key is not None else None
+
+    async def settle_batch(self) -> int:
+        """Check sent transfers, then send the next batch; returns how many authorizations settled"""
+        settled = await self._check_submitted()
+        self._evict()
+
+        now = time.monotonic()
+        due = [
+            settlement for settlement in self._pending.values()
+            if settlement.next_attempt <= now and settlement.chain_id in self.chains
+        ]
+        due = due[:self.batch_size]
+        if not due:
+            return settled
+
+        by_payer: Dict[Tuple[int, str], List[Settlement]] = {}
+        for settlement in due:
+            del self._pending[settlement.key]
+            by_payer.setdefault((settlement.chain_id, settlement.payer.lower()), []).append(settlement)
+        self.batches += 1
+
+        # Chains are independent: send to all of them at once
+        by_chain: Dict[int, List[List[Settlement]]] = {}
+        for (chain_id, _), group in by_payer.items():
+            by_chain.setdefault(chain_id, []).append(group)
+        await asyncio.gather(*(self._send(chain_id, groups, now) for chain_id, groups in by_chain.items()))
+
+        return settled
+
+    async def _send(self, chain_id: int, groups: List[List[Settlement]], now: float):
+        transfers = [(group[0].payer, sum(settlement.amount_wei for settlement in group)) for group in groups]
+        try:
+            results = await self.chains[chain_id].send_transfers(transfers)
+        except Exception as e:
+            results = [e] * len(groups)
+
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                self._retry(group, f"Transfer not sent: {result}")
+                continue
+            self.transfers += 1
+            for settlement in group:
+                settlement.status = SUBMITTED
+                settlement.tx_hash = result
+                settlement.submitted_at = now
+            self._submitted[result] = group
+
+    async def _check_submitted(self) -> int:
+        if not self._submitted:
+            return 0
+
+        by_chain: Dict[int, List[str]] = {}
+        for tx_hash, group in self._submitted.items():
+            by_chain.setdefault(group[0].chain_id, []).append(tx_hash)
+        receipts: Dict[str, Dict[str, Any]] = {}
+        for result in await asyncio.gather(
+            *(self.chains[chain_id].receipts(tx_hashes) for chain_id, tx_hashes in by_chain.items()),
+            return_exceptions=True
+        ):
+            if isinstance(result, Exception):
+                log.warning("settlement_receipt_check_failed", error=str(result))
+            else:
+                receipts.update(result)
+
+        settled = 0
+        now = time.monotonic()
+        for tx_hash, group in list(self._submitted.items()):
+            receipt = receipts.get(tx_hash)
+            if receipt is None:
+                if now - group[0].submitted_at > self.confirm_seconds:
+                    del self._submitted[tx_hash]
+                    for settlement in group:
+                        self._finish(settlement, UNCONFIRMED, f"Not mined within {self.confirm_seconds}s")
+                continue
+
+            del self._submitted[tx_hash]
+            if receipt["status"] == 1:
+                for settlement in group:
+                    settlement.block_number = receipt["blockNumber"]
+                    self._finish(settlement, SETTLED)
+                settled += len(group)
+            else:
+                self._retry(group, "Transfer reverted (allowance or balance too low?)")
+        return settled
+
+    def _retry(self, group: List[Settlement], error: str):
+        for settlement in group:
+            settlement.attempts += 1
+            settlement.error = error
+            settlement.tx_hash = None
+            if settlement.attempts >= self.max_attempts:
+                self._finish(settlement, FAILED, error)
+            else:
+                settlement.status = PENDING
+                settlement.next_attempt = time.monotonic() + self.retry_seconds * 2 ** (settlement.attempts - 1)
+                self._pending[settlement.key] = settlement
+
+    def _finish(self, settlement: Settlement, status: str, error: Optional[str] = None):
+        settlement.status = status
+        settlement.error = error
+        settlement.finished_at = time.monotonic()
+        self.counts[status] += 1
+        if len(self._finished) == self._finished.maxlen:
+            self._forget(self._finished[0])
+        self._finished.append(settlement)
+
+    def _evict(self):
+        """Forget finished settlements older than history_seconds"""
+        cutoff = time.monotonic() - self.history_seconds
+        while self._finished and self._finished[0].finished_at < cutoff:
+            self._forget(self._finished.popleft())
+
+    def _forget(self, settlement: Settlement):
+        self._records.pop(settlement.key, None)
+        if settlement.job_id is not None and self._jobs.get(settlement.job_id) == settlement.key:
+            del self._jobs[settlement.job_id]
+
+    async def run(self, interval: float = SETTLEMENT_INTERVAL_SECONDS):
+        """Background task: settle a batch periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.chains:
+                continue
+            try:
+                settled = await self.settle_batch()
+            except Exception as e:
+                log.error("settlement_failed", error=str(e))
+                continue
+            if settled:
+                log.info("payments_settled", authorizations=settled)
+
+    def stats(self) -> Dict[str, Any]:
+        """Settlement counters"""
+        return {
+            "chains": sorted(self.chains),
+            "pending": len(self._pending),
+            "submitted": sum(len(group) for group in self._submitted.values()),
+            "settled": self.counts[SETTLED],
+            "failed": self.counts[FAILED],
+            "unconfirmed": self.counts[UNCONFIRMED],
+            "batches": self.batches,
+            "transfers": self.transfers,
+            "dropped": self.dropped,
+            "records": len(self._records),
+        }
+
+
+# Global settlement engine (its chains are set at startup when SETTLEMENT_PRIVATE_KEY is configured)
+settlement_engine = SettlementEngine()
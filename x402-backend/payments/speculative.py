@@ -0,0 +1,139 @@
+"""
+Risk accounting for jobs started before their payment is mined
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from payments.ledger import PaymentLedger, payment_ledger
+from telemetry.logs import get_logger
+from config import (
+    CHAIN_ID,
+    TOKEN_DECIMALS,
+    SPECULATIVE_MAX_PRICE_U,
+    SPECULATIVE_WALLET_LIMIT_U,
+    SPECULATIVE_CONFIRM_SECONDS,
+    SPECULATIVE_FLAG_SECONDS
+)
+
+log = get_logger("payments.speculative")
+
+
+def _to_wei(amount) -> int:
+    return int(amount * 10**TOKEN_DECIMALS)
+
+
+class SpeculativePayments:
+    """
+    Lets low-price jobs start as soon as their payment transaction is seen,
+    instead of after it is mined.
+
+    Only jobs up to max_price_wei qualify, and each wallet may have at most
+    wallet_limit_wei of unconfirmed payments outstanding. That bounds what a
+    payer can get without paying. A payment that reverts or isn't mined
+    within confirm_seconds flags its wallet, which can then only pay with
+    confirmed transfers for flag_seconds.
+    """
+
+    def __init__(self, max_price_wei: int = _to_wei(SPECULATIVE_MAX_PRICE_U),
+                 wallet_limit_wei: int = _to_wei(SPECULATIVE_WALLET_LIMIT_U),
+                 confirm_seconds: float = SPECULATIVE_CONFIRM_SECONDS, ledger: PaymentLedger = payment_ledger,
+                 flag_seconds: float = SPECULATIVE_FLAG_SECONDS):
+        self.max_price_wei = max_price_wei
+        self.wallet_limit_wei = wallet_limit_wei
+        self.confirm_seconds = confirm_seconds
+        self.flag_seconds = flag_seconds
+        # wallet -> unconfirmed wei outstanding
+        self._exposure: Dict[str, int] = {}
+        # wallet -> why it was flagged, oldest flag first
+        self._flagged: Dict[str, Dict[str, Any]] = {}
+        # Where the transactions paying for jobs are claimed
+        self.ledger = ledger
+        self.started = 0
+        self.confirmed = 0
+        self.failed = 0
+
+    def refusal(self, wallet: str, amount_wei: int) -> Optional[str]:
+        """Why a job can't start speculatively, or None if it can"""
+        wallet = wallet.lower()
+        if amount_wei > self.max_price_wei:
+            return "Job price is above the speculative limit"
+        self._prune(time.time())
+        if wallet in self._flagged:
+            return "Wallet has an unconfirmed payment on record"
+        if self._exposure.get(wallet, 0) + amount_wei > self.wallet_limit_wei:
+            return "Wallet's unconfirmed payments are at their limit"
+        return None
+
+    def start(self, job_id: str, wallet: str, amount_wei: int, tx_hash: str,
+              wait_for_receipt: Callable[[str, float], Awaitable[Optional[bool]]],
+              chain_id: int = CHAIN_ID) -> Tuple[Optional[asyncio.Task], Optional[str]]:
+        """
+        Admit a job paid by an unconfirmed transaction. wait_for_receipt(tx_hash,
+        timeout) resolves True once the payment is mined, False if it reverted
+        and None if it wasn't mined in time. Returns a task resolving to whether
+        the payment confirmed and None, or None and the refusal if the job can no
+        longer start speculatively, or (None, None) if the transaction already
+        paid for something.
+        """
+        # Callers check refusal() before inspecting the transfer; other jobs for
+        # the wallet may have started or failed since, so check again
+        refused = self.refusal(wallet, amount_wei)
+        if refused:
+            return None, refused
+        if not self.ledger.claim(chain_id, tx_hash, job_id):
+            return None, None
+
+        wallet = wallet.lower()
+        self._exposure[wallet] = self._exposure.get(wallet, 0) + amount_wei
+        self.started += 1
+        return asyncio.create_task(self._confirm(job_id, wallet, amount_wei, tx_hash, wait_for_receipt)), None
+
+    async def _confirm(self, job_id: str, wallet: str, amount_wei: int, tx_hash: str,
+                       wait_for_receipt: Callable[[str, float], Awaitable[Optional[bool]]]) -> bool:
+        try:
+            confirmed = await wait_for_receipt(tx_hash, self.confirm_seconds)
+        except Exception:
+            confirmed = None
+        finally:
+            self._exposure[wallet] -= amount_wei
+            if not self._exposure[wallet]:
+                del self._exposure[wallet]
+
+        if confirmed:
+            self.confirmed += 1
+            return True
+
+        self.failed += 1
+        now = time.time()
+        self._prune(now)
+        # Re-flagging moves the wallet to the back, keeping the oldest flag first
+        self._flagged.pop(wallet, None)
+        self._flagged[wallet] = {
+            "job_id": job_id,
+            "tx_hash": tx_hash,
+            "reason": "reverted" if confirmed is False else f"not mined within {self.confirm_seconds}s",
+            "flagged_at": now,
+        }
+        log.warning("wallet_flagged", wallet=wallet, tx_hash=tx_hash, job_id=job_id, reason=self._flagged[wallet]["reason"])
+        return False
+
+    def _prune(self, now: float):
+        while self._flagged:
+            wallet, flag = next(iter(self._flagged.items()))
+            if now - flag["flagged_at"] < self.flag_seconds:
+                break
+            del self._flagged[wallet]
+
+    def stats(self) -> Dict[str, Any]:
+        """Speculative payment counters"""
+        return {
+            "started": self.started,
+            "confirmed": self.confirmed,
+            "failed": self.failed,
+            "outstanding_wei": str(sum(self._exposure.values())),
+            "flagged_wallets": len(self._flagged),
+        }
+
+
+# Global speculative payment tracker
+speculative_payments = SpeculativePayments()
@@ -4,22 +4,61 @@ x402 Payment Authorization using EIP-712 Signatures
 import json
 from typing import Optional, Dict, Any
 from datetime import datetime, timezone
-from eth_account.messages import encode_defunct, encode_typed_data
+from eth_account.messages import SignableMessage, encode_defunct, encode_typed_data
 from eth_account import Account
 from web3 import Web3
 
-from config import CHAIN_ID, TOKEN_ADDRESS, PAYMENT_RECIPIENT_ADDRESS
+from config import CHAIN_ID, PAYMENT_CHAINS, PAYMENT_RECIPIENT_ADDRESS
 
+# A signed authorization is accepted for this long after its timestamp (5 minutes)
+MAX_SIGNATURE_AGE = 300
 
-def get_payment_domain() -> Dict[str, Any]:
-    """Get EIP-712 domain for payment authorization"""
+EIP712_DOMAIN_TYPE = [
+    {"name": "name", "type": "string"},
+    {"name": "version", "type": "string"},
+    {"name": "chainId", "type": "uint256"},
+]
+
+
+def get_payment_domain(chain_id: int = CHAIN_ID) -> Dict[str, Any]:
+    """Get EIP-712 domain for payment authorization on a chain"""
     return {
         "name": "x402 Payment",
         "version": "1",
-        "chainId": CHAIN_ID,
+        "chainId": chain_id,
     }
 
 
+def payment_chain_id(data: Dict[str, Any]) -> int:
+    """Chain an authorization pays on (its domain's chainId); the default chain if it has none"""
+    return int(data.get("chainId") or CHAIN_ID)
+
+
+def _check_chain(data: Dict[str, Any]) -> Optional[str]:
+    """Error if the authorization's chain isn't accepted or its token isn't U on that chain"""
+    chain_id = payment_chain_id(data)
+    if chain_id not in PAYMENT_CHAINS:
+        return f"Unsupported chain: {chain_id}"
+    if Web3.to_checksum_address(data["token"]) != Web3.to_checksum_address(PAYMENT_CHAINS[chain_id]["token"]):
+        return "Token address mismatch"
+    return None
+
+
+def authorization_expiry(data: Dict[str, Any]) -> int:
+    """Unix time after which a signed authorization is refused anyway (too old or expired)"""
+    return min(int(data["validUntil"]), int(data["timestamp"]) + MAX_SIGNATURE_AGE)
+
+
+def _message_key(encoded_message: SignableMessage) -> str:
+    """
+    EIP-191 hash of a typed-data message: identical for every copy of one
+    authorization, whatever its signature bytes
+    """
+    return Web3.to_hex(Web3.keccak(
+        b"\x19" + encoded_message.version + encoded_message.header + encoded_message.body
+    ))
+
+
 PAYMENT_AUTHORIZATION_TYPES = {
     "PaymentAuthorization": [
         {"name": "recipient", "type": "address"},
@@ -72,22 +111,202 @@ def verify_payment_signature(
         if Web3.to_checksum_address(payment_data["recipient"]) != Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS):
             return False, None, f"Recipient mismatch"
 
-        # Verify token address matches
-        if Web3.to_checksum_address(payment_data["token"]) != Web3.to_checksum_address(TOKEN_ADDRESS):
-            return False, None, f"Token address mismatch"
+        # Verify chain and token address match
+        chain_error = _check_chain(payment_data)
+        if chain_error:
+            return False, None, chain_error
 
         # Verify timestamp is not too old (within 5 minutes)
         now = int(datetime.now(timezone.utc).timestamp())
-        timestamp = int(payment_data["timestamp"])
-        if now - timestamp > 300:  # 5 minutes
+        if now - int(payment_data["timestamp"]) > MAX_SIGNATURE_AGE:
             return False, None, f"Signature too old"
 
         # Verify not expired
-        valid_until = int(payment_data["validUntil"])
-        if now > valid_until:
+        if now > int(payment_data["validUntil"]):
             return False, None, f"Signature expired"
 
-        # Create EIP-712 typed data
+        # Encode and recover signer
+        encoded_message = _payment_message(payment_data)
+        signer_address = Account.recover_message(encoded_message, signature=signature)
+
+        return True, signer_address, None
+
+    except Exception as e:
+        return False, None, f"Signature verification failed: {str(e)}"
+
+
+def _payment_message(payment_data: Dict[str, Any]) -> SignableMessage:
+    """The EIP-712 message a payment authorization signs"""
+    return encode_typed_data(full_message={
+        "types": {"EIP712Domain": EIP712_DOMAIN_TYPE, **PAYMENT_AUTHORIZATION_TYPES},
+        "primaryType": "PaymentAuthorization",
+        "domain": get_payment_domain(payment_chain_id(payment_data)),
+        "message": {
+            "recipient": Web3.to_checksum_address(payment_data["recipient"]),
+            "token": Web3.to_checksum_address(payment_data["token"]),
+            "amount": str(payment_data["amount"]),
+            "jobId": payment_data["jobId"],
+            "timestamp": int(payment_data["timestamp"]),
+            "validUntil": int(payment_data["validUntil"]),
+        }
+    })
+
+
+def payment_authorization_key(payment_data: Dict[str, Any]) -> str:
+    """Identifies one verified payment authorization (for replay checks and settlement)"""
+    return _message_key(_payment_message(payment_data))
+
+
+BATCH_AUTHORIZATION_TYPES = {
+    "BatchAuthorization": [
+        {"name": "recipient", "type": "address"},
+        {"name": "token", "type": "address"},
+        {"name": "totalAmount", "type": "uint256"},
+        {"name": "jobCount", "type": "uint256"},
+        {"name": "jobsRoot", "type": "bytes32"},
+        {"name": "timestamp", "type": "uint256"},
+        {"name": "validUntil", "type": "uint256"},
+    ]
+}
+
+
+def verify_batch_signature(
+    batch_data: Dict[str, Any],
+    expected_root: str,
+    expected_total: str,
+    expected_count: int
+) -> tuple[bool, Optional[str], Optional[str]]:
+    """
+    Verify an EIP-712 batch authorization: one signature over the Merkle
+    root of (jobId, amount) leaves pays for every job in the batch
+
+    Args:
+        batch_data: Batch authorization fields with signature from X-PAYMENT header
+        expected_root: Merkle root (0x hex) of the batch's jobs and quoted amounts
+        expected_total: Total of the quoted amounts in wei
+        expected_count: Number of jobs in the batch
+
+    Returns:
+        (is_valid, signer_address, error_message)
+    """
+    try:
+        signature = batch_data.get("signature")
+        if not signature:
+            return False, None, "Missing signature"
+
+        required_fields = ["recipient", "token", "totalAmount", "jobCount", "jobsRoot", "timestamp", "validUntil"]
+        for field in required_fields:
+            if field not in batch_data:
+                return False, None, f"Missing field: {field}"
+
+        if batch_data["jobsRoot"].lower() != expected_root.lower():
+            return False, None, "Jobs root mismatch: signed jobs or amounts differ from the quote"
+
+        if str(batch_data["totalAmount"]) != expected_total:
+            return False, None, f"Amount mismatch: got {batch_data['totalAmount']}, expected {expected_total}"
+
+        if int(batch_data["jobCount"]) != expected_count:
+            return False, None, f"Job count mismatch: got {batch_data['jobCount']}, expected {expected_count}"
+
+        if Web3.to_checksum_address(batch_data["recipient"]) != Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS):
+            return False, None, "Recipient mismatch"
+
+        chain_error = _check_chain(batch_data)
+        if chain_error:
+            return False, None, chain_error
+
+        now = int(datetime.now(timezone.utc).timestamp())
+        if now - int(batch_data["timestamp"]) > MAX_SIGNATURE_AGE:
+            return False, None, "Signature too old"
+
+        if now > int(batch_data["validUntil"]):
+            return False, None, "Signature expired"
+
+        # One recovery for the whole batch
+        encoded_message = _batch_message(batch_data)
+        signer_address = Account.recover_message(encoded_message, signature=signature)
+
+        return True, signer_address, None
+
+    except Exception as e:
+        return False, None, f"Batch signature verification failed: {str(e)}"
+
+
+def _batch_message(batch_data: Dict[str, Any]) -> SignableMessage:
+    """The EIP-712 message a batch authorization signs"""
+    return encode_typed_data(full_message={
+        "types": {"EIP712Domain": EIP712_DOMAIN_TYPE, **BATCH_AUTHORIZATION_TYPES},
+        "primaryType": "BatchAuthorization",
+        "domain": get_payment_domain(payment_chain_id(batch_data)),
+        "message": {
+            "recipient": Web3.to_checksum_address(batch_data["recipient"]),
+            "token": Web3.to_checksum_address(batch_data["token"]),
+            "totalAmount": str(batch_data["totalAmount"]),
+            "jobCount": int(batch_data["jobCount"]),
+            "jobsRoot": batch_data["jobsRoot"],
+            "timestamp": int(batch_data["timestamp"]),
+            "validUntil": int(batch_data["validUntil"]),
+        }
+    })
+
+
+def batch_authorization_key(batch_data: Dict[str, Any]) -> str:
+    """Identifies one verified batch authorization (for replay checks and settlement)"""
+    return _message_key(_batch_message(batch_data))
+
+
+SPENDING_CAP_TYPES = {
+    "SpendingCap": [
+        {"name": "recipient", "type": "address"},
+        {"name": "token", "type": "address"},
+        {"name": "cap", "type": "uint256"},
+        {"name": "nonce", "type": "string"},
+        {"name": "timestamp", "type": "uint256"},
+        {"name": "validUntil", "type": "uint256"},
+    ]
+}
+
+
+def verify_spending_cap(cap_data: Dict[str, Any]) -> tuple[bool, Optional[str], Optional[str]]:
+    """
+    Verify an EIP-712 spending cap: the signer allows up to `cap` wei to be
+    charged to a prepaid session until `validUntil`
+
+    Args:
+        cap_data: Spending cap fields with signature
+
+    Returns:
+        (is_valid, signer_address, error_message)
+    """
+    try:
+        signature = cap_data.get("signature")
+        if not signature:
+            return False, None, "Missing signature"
+
+        required_fields = ["recipient", "token", "cap", "nonce", "timestamp", "validUntil"]
+        for field in required_fields:
+            if field not in cap_data:
+                return False, None, f"Missing field: {field}"
+
+        if Web3.to_checksum_address(cap_data["recipient"]) != Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS):
+            return False, None, "Recipient mismatch"
+
+        chain_error = _check_chain(cap_data)
+        if chain_error:
+            return False, None, chain_error
+
+        if int(cap_data["cap"]) <= 0:
+            return False, None, "Cap must be positive"
+
+        now = int(datetime.now(timezone.utc).timestamp())
+        timestamp = int(cap_data["timestamp"])
+        if now - timestamp > MAX_SIGNATURE_AGE:
+            return False, None, "Signature too old"
+
+        valid_until = int(cap_data["validUntil"])
+        if now > valid_until:
+            return False, None, "Signature expired"
+
         message_data = {
             "types": {
                 "EIP712Domain": [
@@ -95,28 +314,110 @@ def verify_payment_signature(
                     {"name": "version", "type": "string"},
                     {"name": "chainId", "type": "uint256"},
                 ],
-                **PAYMENT_AUTHORIZATION_TYPES
+                **SPENDING_CAP_TYPES
             },
-            "primaryType": "PaymentAuthorization",
-            "domain": get_payment_domain(),
+            "primaryType": "SpendingCap",
+            "domain": get_payment_domain(payment_chain_id(cap_data)),
             "message": {
-                "recipient": Web3.to_checksum_address(payment_data["recipient"]),
-                "token": Web3.to_checksum_address(payment_data["token"]),
-                "amount": str(payment_data["amount"]),
-                "jobId": payment_data["jobId"],
+                "recipient": Web3.to_checksum_address(cap_data["recipient"]),
+                "token": Web3.to_checksum_address(cap_data["token"]),
+                "cap": str(cap_data["cap"]),
+                "nonce": cap_data["nonce"],
                 "timestamp": timestamp,
                 "validUntil": valid_until,
             }
         }
 
-        # Encode and recover signer
         encoded_message = encode_typed_data(full_message=message_data)
         signer_address = Account.recover_message(encoded_message, signature=signature)
 
         return True, signer_address, None
 
     except Exception as e:
-        return False, None, f"Signature verification failed: {str(e)}"
+        return False, None, f"Spending cap verification failed: {str(e)}"
+
+
+DEPOSIT_CLAIM_TYPES = {
+    "DepositClaim": [
+        {"name": "recipient", "type": "address"},
+        {"name": "token", "type": "address"},
+        {"name": "amount", "type": "uint256"},
+        {"name": "nonce", "type": "string"},
+        {"name": "timestamp", "type": "uint256"},
+        {"name": "validUntil", "type": "uint256"},
+    ]
+}
+
+
+def verify_deposit_claim(claim_data: Dict[str, Any]) -> tuple[bool, Optional[str], Optional[str]]:
+    """
+    Verify an EIP-712 deposit claim: the signer's transfer of `amount` wei
+    to the recipient funds a prepaid session. The nonce is issued by the
+    server, so a claim can't be made for someone else's transfer.
+
+    Args:
+        claim_data: Deposit claim fields with signature
+
+    Returns:
+        (is_valid, signer_address, error_message)
+    """
+    try:
+        signature = claim_data.get("signature")
+        if not signature:
+            return False, None, "Missing signature"
+
+        required_fields = ["recipient", "token", "amount", "nonce", "timestamp", "validUntil"]
+        for field in required_fields:
+            if field not in claim_data:
+                return False, None, f"Missing field: {field}"
+
+        if Web3.to_checksum_address(claim_data["recipient"]) != Web3.to_checksum_address(PAYMENT_RECIPIENT_ADDRESS):
+            return False, None, "Recipient mismatch"
+
+        chain_error = _check_chain(claim_data)
+        if chain_error:
+            return False, None, chain_error
+
+        if int(claim_data["amount"]) <= 0:
+            return False, None, "Amount must be positive"
+
+        now = int(datetime.now(timezone.utc).timestamp())
+        timestamp = int(claim_data["timestamp"])
+        if now - timestamp > MAX_SIGNATURE_AGE:
+            return False, None, "Signature too old"
+
+        valid_until = int(claim_data["validUntil"])
+        if now > valid_until:
+            return False, None, "Signature expired"
+
+        message_data = {
+            "types": {
+                "EIP712Domain": [
+                    {"name": "name", "type": "string"},
+                    {"name": "version", "type": "string"},
+                    {"name": "chainId", "type": "uint256"},
+                ],
+                **DEPOSIT_CLAIM_TYPES
+            },
+            "primaryType": "DepositClaim",
+            "domain": get_payment_domain(payment_chain_id(claim_data)),
+            "message": {
+                "recipient": Web3.to_checksum_address(claim_data["recipient"]),
+                "token": Web3.to_checksum_address(claim_data["token"]),
+                "amount": str(claim_data["amount"]),
+                "nonce": claim_data["nonce"],
+                "timestamp": timestamp,
+                "validUntil": valid_until,
+            }
+        }
+
+        encoded_message = encode_typed_data(full_message=message_data)
+        signer_address = Account.recover_message(encoded_message, signature=signature)
+
+        return True, signer_address, None
+
+    except Exception as e:
+        return False, None, f"Deposit claim verification failed: {str(e)}"
 
 
 def parse_x_payment_header(x_payment_header: str) -> Optional[Dict[str, Any]]:
@@ -0,0 +1 @@
+# Runner package
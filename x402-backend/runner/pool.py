@@ -0,0 +1,193 @@
+"""
+Prewarmed worker-process pool for job execution
+"""
+import asyncio
+import multiprocessing
+import os
+import signal
+from typing import AsyncIterator, Dict, Optional
+from jobs.base import Job, JobOutput, job_executions
+from config import WORKER_POOL_SIZE, JOB_CPU_SECONDS, JOB_MEMORY_MB, JOB_WALL_SECONDS
+from .worker import worker_main
+
+# Spawned (not forked) so workers don't inherit the API's event loop and sockets
+_context = multiprocessing.get_context("spawn")
+
+
+class WorkerError(Exception):
+    """Raised when a job fails inside a worker or the worker dies"""
+
+
+class Worker:
+    """Handle on one worker process and its pipe"""
+
+    def __init__(self, memory_mb: int):
+        self.conn, child_conn = _context.Pipe(duplex=True)
+        self.process = _context.Process(target=worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+        # Process groups started by the current job
+        self.job_groups: set = set()
+
+    async def recv(self, timeout: Optional[float]):
+        """Receive the next message, waiting at most timeout seconds"""
+        if not self.conn.poll():
+            loop = asyncio.get_running_loop()
+            readable = loop.create_future()
+            fd = self.conn.fileno()
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait_for(readable, timeout)
+            finally:
+                loop.remove_reader(fd)
+        # Raises EOFError if the worker died
+        return self.conn.recv()
+
+    def kill(self):
+        """Kill the worker and anything its job started"""
+        if self.process.pid is not None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                # Not yet in its own group
+                self.process.kill()
+        self.process.join(timeout=1)
+        # Groups reported just before the worker died are still in the pipe
+        try:
+            while self.conn.poll():
+                kind, payload = self.conn.recv()
+                if kind == "process":
+                    self.job_groups.add(payload)
+        except (EOFError, OSError):
+            pass
+        self.conn.close()
+        for pgid in self.job_groups:
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        self.job_groups.clear()
+
+    def stop(self):
+        """Ask the worker to exit after its current job"""
+        try:
+            self.conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class WorkerPool:
+    """
+    Runs Job.execute in a pool of prewarmed worker processes, so jobs
+    don't compete with request handling for the API's event loop and GIL.
+    Each job gets a CPU-time budget (RLIMIT_CPU) and a wall-clock deadline;
+    workers have a capped address space. A worker that dies or overruns
+    is killed together with its process group and the process groups its
+    job reported starting, and replaced.
+    """
+
+    def __init__(self, size: int = WORKER_POOL_SIZE, cpu_seconds: int = JOB_CPU_SECONDS,
+                 memory_mb: int = JOB_MEMORY_MB, wall_seconds: float = JOB_WALL_SECONDS):
+        self.size = size
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.wall_seconds = wall_seconds
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: set = set()
+        self.jobs_run = 0
+        self.workers_replaced = 0
+
+    def start(self):
+        """Spawn the workers"""
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            self._idle.put_nowait(self._spawn())
+
+    def stop(self):
+        """Stop all workers"""
+        for worker in list(self._workers):
+            worker.stop()
+        self._workers.clear()
+
+    def _spawn(self) -> Worker:
+        worker = Worker(self.memory_mb)
+        self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker: Worker) -> Worker:
+        worker.kill()
+        self._workers.discard(worker)
+        self.workers_replaced += 1
+        return self._spawn()
+
+    async def run(self, job: Job) -> AsyncIterator[JobOutput]:
+        """Execute a job in a worker and yield its output"""
+        worker = await self._idle.get()
+        if not worker.process.is_alive():
+            worker = self._replace(worker)
+
+        healthy = False
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wall_seconds
+        # Job.run counts it in the worker's process; count it here for the API's gauge
+        job_executions.running += 1
+
+        try:
+            worker.conn.send(("run", job.get_name(), job.job_id, job.params, self.cpu_seconds))
+            self.jobs_run += 1
+
+            while True:
+                try:
+                    kind, payload = await worker.recv(deadline - loop.time())
+                except asyncio.TimeoutError:
+                    job_executions.timed_out += 1
+                    raise WorkerError(f"Job exceeded its {self.wall_seconds}s time limit")
+                except (EOFError, OSError):
+                    raise WorkerError(self._death_reason(worker))
+
+                if kind == "ready":
+                    worker.ready = True
+                elif kind == "process":
+                    worker.job_groups.add(payload)
+                elif kind == "output":
+                    yield payload
+                elif kind == "done":
+                    healthy = True
+                    worker.job_groups.clear()
+                    return
+                elif kind == "error":
+                    healthy = True
+                    worker.job_groups.clear()
+                    raise WorkerError(payload)
+        except (asyncio.CancelledError, GeneratorExit):
+            job_executions.cancelled += 1
+            raise
+        finally:
+            job_executions.running -= 1
+            # Abandoned, overrunning or dead workers are killed and replaced
+            self._idle.put_nowait(worker if healthy else self._replace(worker))
+
+    def _death_reason(self, worker: Worker) -> str:
+        worker.process.join(timeout=1)
+        if worker.process.exitcode == -signal.SIGXCPU:
+            return f"Job exceeded its {self.cpu_seconds}s CPU limit"
+        return f"Worker exited unexpectedly (exit code {worker.process.exitcode})"
+
+    def stats(self) -> Dict[str, int]:
+        """Pool counters"""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle else 0,
+            "jobs_run": self.jobs_run,
+            "workers_replaced": self.workers_replaced,
+        }
+
+
+# Global pool instance (started by the API when JOB_RUNNER is "pool")
+worker_pool = WorkerPool()
@@ -0,0 +1,83 @@
+"""
+Worker process entry point: runs jobs sent by the pool and streams output back
+"""
+import asyncio
+import math
+import os
+import resource
+from multiprocessing.connection import Connection
+
+
+def _limit_cpu(cpu_seconds: int):
+    """Allow this process cpu_seconds more CPU time; SIGXCPU terminates it past that"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = math.ceil(usage.ru_utime + usage.ru_stime)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = used + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _limit_memory(memory_mb: int):
+    """Cap the worker's address space"""
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = memory_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+async def _run_job(conn: Connection, job_registry, job_name: str, job_id: str, params: dict):
+    job_class = job_registry.get_job_class(job_name)
+    if not job_class:
+        conn.send(("error", f"Unknown job type: {job_name}"))
+        return
+
+    try:
+        job = job_class(job_id=job_id, params=params)
+        async for output in job.run():
+            conn.send(("output", output))
+        conn.send(("done", None))
+    except Exception as e:
+        conn.send(("error", str(e)))
+
+
+def worker_main(conn: Connection, memory_mb: int):
+    """
+    Worker loop. Messages from the pool are ("run", job_name, job_id,
+    params, cpu_seconds) or ("stop",); replies are ("ready", pid),
+    ("process", pgid) for each process group a job starts, ("output", item),
+    ("done", None) and ("error", message).
+    """
+    # Own process group, so the pool can kill the worker together with
+    # any subprocesses its jobs started
+    os.setpgrp()
+    _limit_memory(memory_mb)
+
+    # Prewarm the registry and the PRELOAD_JOBS types; other jobs import on first use
+    from jobs.registry import job_registry
+    from config import PRELOAD_JOBS
+    job_registry.preload(PRELOAD_JOBS)
+
+    # Job processes get their own sessions, outside the worker's group
+    from jobs.process import JobProcess
+    JobProcess.group_listener = lambda pgid: conn.send(("process", pgid))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    conn.send(("ready", os.getpid()))
+
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                break
+
+            _, job_name, job_id, params, cpu_seconds = message
+            _limit_cpu(cpu_seconds)
+            loop.run_until_complete(_run_job(conn, job_registry, job_name, job_id, params))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        loop.close()
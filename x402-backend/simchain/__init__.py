@@ -0,0 +1 @@
+# Simulated chain package
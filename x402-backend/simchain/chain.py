@@ -0,0 +1,204 @@
+"""
+In-memory simulated chain holding one ERC20 token, for exercising
+settlement and payment confirmation without a node
+"""
+import asyncio
+import random
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class ChainError(Exception):
+    """Raised when the simulated node rejects a request (an RPC error)"""
+
+
+class SimulatedChain:
+    """
+    An ERC20 ledger with blocks.
+
+    Transactions wait in a mempool until the next block is mined, either
+    by mine() or, with a block_time, by run(). Reverted transactions are
+    mined with status 0, as on a real chain. fail_sends(n) makes the next
+    n submissions fail before reaching the mempool, as a flaky RPC would.
+
+    reorg(depth) replaces the last `depth` blocks, deterministically: their
+    transactions go back to the mempool (except any dropped) and are mined
+    again by the next mine(). The safe and finalized blocks trail the head
+    by safe_depth and finalized_depth; deeper reorgs are refused.
+
+    script_transfer() queues traffic for a future block. With a seed, block
+    and transaction hashes are the same on every run.
+    """
+
+    def __init__(self, block_time: float = 0, safe_depth: int = 4, finalized_depth: int = 8,
+                 seed: Optional[int] = None):
+        self.block_time = block_time
+        self.safe_depth = safe_depth
+        self.finalized_depth = finalized_depth
+        self._random = random.Random(seed)
+        self.balances: Dict[str, int] = {}
+        self.allowances: Dict[Tuple[str, str], int] = {}
+        self.block_number = 0
+        self.blocks: List[List[str]] = [[]]
+        self.block_hashes: List[str] = [self._new_hash()]
+        # Successful transfers per block: (tx hash, from, to, value)
+        self.logs: List[List[Tuple[str, str, str, int]]] = [[]]
+        # State before each block, for rolling blocks back
+        self._states: List[Tuple[Dict[str, int], Dict[Tuple[str, str], int]]] = []
+        self._transactions: Dict[str, Tuple[str, str, str, Tuple]] = {}
+        self._mempool: List[Tuple[str, str, str, Tuple]] = []
+        # Block number -> transactions sent when it is mined
+        self._scripted: Dict[int, List[Tuple[str, str, str, Tuple]]] = {}
+        self._receipts: Dict[str, Dict[str, Any]] = {}
+        self._failing_sends = 0
+        self.sent = 0
+        self.reorgs = 0
+        # Called with ("block", number) after each block is mined, and with
+        # ("reorg", [(block number, block hash, log), ...]) for the logs a reorg removed
+        self.listeners: List[Callable[[str, Any], None]] = []
+
+    def _new_hash(self) -> str:
+        return "0x" + self._random.getrandbits(256).to_bytes(32, "big").hex()
+
+    @staticmethod
+    def _key(address: str) -> str:
+        return address.lower()
+
+    def mint(self, address: str, amount: int):
+        key = self._key(address)
+        self.balances[key] = self.balances.get(key, 0) + amount
+
+    def approve(self, owner: str, spender: str, amount: int):
+        self.allowances[(self._key(owner), self._key(spender))] = amount
+
+    def balance_of(self, address: str) -> int:
+        return self.balances.get(self._key(address), 0)
+
+    def allowance(self, owner: str, spender: str) -> int:
+        return self.allowances.get((self._key(owner), self._key(spender)), 0)
+
+    def fail_sends(self, count: int):
+        """Reject the next `count` submissions"""
+        self._failing_sends = count
+
+    def send_transaction(self, sender: str, method: str, *args) -> str:
+        """Queue a token call ("transfer" or "transferFrom") from sender; returns its hash"""
+        if self._failing_sends:
+            self._failing_sends -= 1
+            raise ChainError("simulated RPC failure")
+        if method not in ("transfer", "transferFrom"):
+            raise ChainError(f"unsupported method {method}")
+        tx_hash = self._new_hash()
+        self._transactions[tx_hash] = (tx_hash, self._key(sender), method, args)
+        self._mempool.append(self._transactions[tx_hash])
+        self.sent += 1
+        return tx_hash
+
+    def script_transfer(self, block: int, sender: str, to: str, amount: int) -> str:
+        """Have sender transfer amount to `to` in the given future block; returns the tx hash"""
+        if block <= self.block_number:
+            raise ChainError(f"block {block} is already mined")
+        tx_hash = self._new_hash()
+        self._transactions[tx_hash] = (tx_hash, self._key(sender), "transfer", (to, amount))
+        self._scripted.setdefault(block, []).append(self._transactions[tx_hash])
+        return tx_hash
+
+    def transaction(self, tx_hash: str) -> Optional[Tuple[str, str, Tuple]]:
+        """(sender, method, args) of a sent transaction"""
+        if tx_hash not in self._transactions:
+            return None
+        return self._transactions[tx_hash][1:]
+
+    def _apply(self, sender: str, method: str, args: Tuple) -> Optional[Tuple[str, str, int]]:
+        """Apply a token call; returns the (from, to, value) it transferred, or None if it reverted"""
+        if method == "transfer":
+            source, (to, amount) = sender, args
+        else:
+            source, to, amount = args
+            source = self._key(source)
+            allowed = self.allowances.get((source, sender), 0)
+            if allowed < amount:
+                return None
+        if self.balances.get(source, 0) < amount:
+            return None
+        if method == "transferFrom":
+            self.allowances[(source, sender)] = allowed - amount
+        self.balances[source] -= amount
+        self.mint(to, amount)
+        return source, self._key(to), amount
+
+    def mine(self) -> int:
+        """Include every queued transaction in a new block; returns its number"""
+        self._states.append((dict(self.balances), dict(self.allowances)))
+        self.block_number += 1
+        self._mempool.extend(self._scripted.pop(self.block_number, []))
+        block_hash = self._new_hash()
+        included = []
+        logs = []
+        for tx_hash, sender, method, args in self._mempool:
+            transferred = self._apply(sender, method, args)
+            if transferred:
+                logs.append((tx_hash, *transferred))
+            self._receipts[tx_hash] = {
+                "status": 1 if transferred else 0, "blockNumber": self.block_number, "blockHash": block_hash
+            }
+            included.append(tx_hash)
+        self._mempool = []
+        self.blocks.append(included)
+        self.block_hashes.append(block_hash)
+        self.logs.append(logs)
+        self._notify("block", self.block_number)
+        return self.block_number
+
+    def reorg(self, depth: int, drop: Iterable[str] = ()) -> List[str]:
+        """
+        Roll back the last `depth` blocks; their transactions return to the
+        mempool, except those in `drop` (as if replaced by a conflicting
+        transaction). Returns the transactions rolled back.
+        """
+        if depth > self.block_number - self.tagged_block("finalized"):
+            raise ChainError("cannot reorganize finalized blocks")
+        drop = set(drop)
+        rolled_back = []
+        removed_logs = []
+        for _ in range(depth):
+            rolled_back = self.blocks.pop() + rolled_back
+            block_hash = self.block_hashes.pop()
+            removed_logs = [(self.block_number, block_hash, log) for log in self.logs.pop()] + removed_logs
+            self.balances, self.allowances = self._states.pop()
+            self.block_number -= 1
+        for tx_hash in rolled_back:
+            del self._receipts[tx_hash]
+        self._mempool = [self._transactions[tx_hash] for tx_hash in rolled_back if tx_hash not in drop] + self._mempool
+        self.reorgs += 1
+        self._notify("reorg", removed_logs)
+        return rolled_back
+
+    def _notify(self, kind: str, data: Any):
+        for listener in self.listeners:
+            listener(kind, data)
+
+    def tagged_block(self, tag: str) -> int:
+        """Number of the "safe" or "finalized" block"""
+        depth = {"safe": self.safe_depth, "finalized": self.finalized_depth}[tag]
+        return max(0, self.block_number - depth)
+
+    def receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        """Receipt of a mined transaction, None while it is pending"""
+        return self._receipts.get(tx_hash)
+
+    def transfers(self, from_address: str, to_address: str, from_block: int, to_block: int
+                  ) -> List[Tuple[str, int]]:
+        """(tx hash, value) of transfers between two addresses in a block range, like a log filter"""
+        source, to = self._key(from_address), self._key(to_address)
+        return [
+            (tx_hash, value)
+            for logs in self.logs[max(0, from_block):to_block + 1]
+            for tx_hash, log_from, log_to, value in logs
+            if log_from == source and log_to == to
+        ]
+
+    async def run(self):
+        """Background task: mine a block every block_time seconds"""
+        while True:
+            await asyncio.sleep(self.block_time)
+            self.mine()
@@ -0,0 +1,352 @@
+"""
+JSON-RPC node serving the simulated chain, over HTTP and websocket, for
+exercising payment detection and verification without a real node
+"""
+import asyncio
+import itertools
+import json
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import WSMsgType, web
+
+from payments.log_stream import TRANSFER_TOPIC, address_topic
+from config import CHAIN_ID, TOKEN_DECIMALS
+from .chain import SimulatedChain
+
+# eth_call selectors of the token functions the node answers
+BALANCE_OF = "0x70a08231"
+ALLOWANCE = "0xdd62ed3e"
+DECIMALS = "0x313ce567"
+# Selectors of the token calls transactions make
+TRANSFER = "0xa9059cbb"
+TRANSFER_FROM = "0x23b872dd"
+
+
+class RpcError(Exception):
+    """A JSON-RPC error response"""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def _word(value: int) -> str:
+    return "0x" + value.to_bytes(32, "big").hex()
+
+
+def _address_word(address: str) -> str:
+    return address.lower()[2:].rjust(64, "0")
+
+
+def _argument_address(data: str, index: int) -> str:
+    # ABI arguments follow the 4-byte selector, one 32-byte word each
+    start = 10 + 64 * index
+    return "0x" + data[start + 24:start + 64]
+
+
+class SimulatedNode:
+    """
+    Answers the JSON-RPC subset payment verification uses: eth_blockNumber,
+    eth_getBlockByNumber, eth_getTransactionReceipt, eth_getLogs, log
+    filters (eth_newFilter, eth_getFilterLogs, eth_getFilterChanges),
+    eth_call for the token's balanceOf, allowance and decimals, and
+    eth_chainId. Over websocket it also pushes eth_subscribe notifications
+    for "newHeads" and "logs", including removed logs after a reorg.
+
+    The chain's token is `token_address`. Every request waits `latency`
+    seconds, and fails with a JSON-RPC error with probability `error_rate`
+    (drawn from a generator seeded with `seed`, so runs repeat).
+    drop_connections() and refuse_connections make a subscriber lose its
+    connection and miss blocks. `calls` counts requests per method.
+    """
+
+    def __init__(self, chain: SimulatedChain, token_address: str, chain_id: int = CHAIN_ID,
+                 latency: float = 0, error_rate: float = 0, seed: Optional[int] = None):
+        self.chain = chain
+        self.token_address = token_address.lower()
+        self.chain_id = chain_id
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        # While set, new connections are turned away
+        self.refuse_connections = False
+        self._ids = itertools.count(1)
+        # subscription ID -> (connection's send queue, kind, log filter)
+        self._subscriptions: Dict[str, Tuple[asyncio.Queue, str, Dict[str, Any]]] = {}
+        # filter ID -> (log filter, first block not yet returned by eth_getFilterChanges)
+        self._filters: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        self._sockets: List[web.WebSocketResponse] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+        self.http_url: Optional[str] = None
+        self.requests = 0
+        self.errors = 0
+        self.calls: Dict[str, int] = {}
+        chain.listeners.append(self._on_chain_event)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving; returns the websocket URL (JSON-RPC over HTTP is at http_url)"""
+        app = web.Application()
+        app.router.add_get("/", self._handle)
+        app.router.add_post("/", self._handle_http)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"ws://{host}:{port}/"
+        self.http_url = f"http://{host}:{port}/"
+        return self.url
+
+    async def stop(self):
+        await self.drop_connections()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def drop_connections(self):
+        """Close every open connection, as a node restart would"""
+        for ws in list(self._sockets):
+            await ws.close()
+
+    async def _handle_http(self, request: web.Request) -> web.StreamResponse:
+        if self.refuse_connections:
+            return web.Response(status=503)
+        body = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(body, list):
+            return web.json_response([self._respond(call, None) for call in body])
+        return web.json_response(self._respond(body, None))
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        if self.refuse_connections:
+            return web.Response(status=503)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.append(ws)
+        queue: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(self._write(ws, queue))
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    break
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                queue.put_nowait(self._respond(json.loads(message.data), queue))
+        finally:
+            writer.cancel()
+            self._sockets.remove(ws)
+            for subscription, (subscriber, _, _) in list(self._subscriptions.items()):
+                if subscriber is queue:
+                    del self._subscriptions[subscription]
+        return ws
+
+    @staticmethod
+    async def _write(ws: web.WebSocketResponse, queue: asyncio.Queue):
+        # One writer per connection keeps responses and notifications in order
+        while True:
+            await ws.send_str(json.dumps(await queue.get()))
+
+    def _respond(self, request: Dict[str, Any], queue: Optional[asyncio.Queue]) -> Dict[str, Any]:
+        self.requests += 1
+        method = request["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        response: Dict[str, Any] = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            if self.error_rate and self._random.random() < self.error_rate:
+                raise RpcError(-32005, "simulated node error")
+            response["result"] = self._call(method, request.get("params", []), queue)
+        except RpcError as e:
+            self.errors += 1
+            response["error"] = {"code": e.code, "message": str(e)}
+        return response
+
+    def _call(self, method: str, params: List[Any], queue: Optional[asyncio.Queue]) -> Any:
+        if method == "eth_chainId":
+            return hex(self.chain_id)
+        if method == "net_version":
+            return str(self.chain_id)
+        if method == "web3_clientVersion":
+            return "SimulatedNode/1.0"
+        if method == "eth_blockNumber":
+            return hex(self.chain.block_number)
+        if method == "eth_getBlockByNumber":
+            number = self._block_number(params[0])
+            if number > self.chain.block_number:
+                return None
+            return {
+                "number": hex(number),
+                "hash": self.chain.block_hashes[number],
+                "parentHash": self.chain.block_hashes[number - 1] if number else "0x" + "0" * 64,
+                "transactions": list(self.chain.blocks[number]),
+            }
+        if method == "eth_getTransactionByHash":
+            return self._transaction(params[0])
+        if method == "eth_getTransactionReceipt":
+            return self._receipt(params[0])
+        if method == "eth_getLogs":
+            return self._logs(params[0])
+        if method == "eth_newFilter":
+            log_filter = params[0]
+            filter_id = hex(next(self._ids))
+            self._filters[filter_id] = (log_filter, self._block_number(log_filter.get("fromBlock", "latest")))
+            return filter_id
+        if method in ("eth_getFilterLogs", "eth_getFilterChanges"):
+            if params[0] not in self._filters:
+                raise RpcError(-32000, "filter not found")
+            log_filter, next_block = self._filters[params[0]]
+            if method == "eth_getFilterLogs":
+                return self._logs(log_filter)
+            logs = self._logs(dict(log_filter, fromBlock=hex(next_block)))
+            self._filters[params[0]] = (log_filter, self.chain.block_number + 1)
+            return logs
+        if method == "eth_uninstallFilter":
+            return self._filters.pop(params[0], None) is not None
+        if method == "eth_call":
+            return self._eth_call(params[0])
+        if method == "eth_subscribe":
+            if queue is None:
+                raise RpcError(-32601, "subscriptions need a websocket connection")
+            kind = params[0]
+            if kind not in ("newHeads", "logs"):
+                raise RpcError(-32602, f"unsupported subscription {kind}")
+            subscription = hex(next(self._ids))
+            self._subscriptions[subscription] = (queue, kind, params[1] if len(params) > 1 else {})
+            return subscription
+        if method == "eth_unsubscribe":
+            return self._subscriptions.pop(params[0], None) is not None
+        raise RpcError(-32601, f"method {method} not found")
+
+    def _block_number(self, tag: Any) -> int:
+        if tag in ("latest", "pending"):
+            return self.chain.block_number
+        if tag == "earliest":
+            return 0
+        if tag in ("safe", "finalized"):
+            return self.chain.tagged_block(tag)
+        return int(tag, 16) if isinstance(tag, str) else tag
+
+    def _transaction(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        transaction = self.chain.transaction(tx_hash)
+        if transaction is None:
+            return None
+        sender, method, args = transaction
+        if method == "transfer":
+            to, amount = args
+            data = TRANSFER + _address_word(to) + amount.to_bytes(32, "big").hex()
+        else:
+            source, to, amount = args
+            data = TRANSFER_FROM + _address_word(source) + _address_word(to) + amount.to_bytes(32, "big").hex()
+        receipt = self.chain.receipt(tx_hash)
+        return {
+            "hash": tx_hash,
+            "from": sender,
+            "to": self.token_address,
+            "input": data,
+            "value": "0x0",
+            "gas": hex(100000),
+            "nonce": "0x0",
+            "blockNumber": hex(receipt["blockNumber"]) if receipt else None,
+            "blockHash": receipt["blockHash"] if receipt else None,
+        }
+
+    def _receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        receipt = self.chain.receipt(tx_hash)
+        if receipt is None:
+            return None
+        number = receipt["blockNumber"]
+        sender, _, _ = self.chain.transaction(tx_hash)
+        return {
+            "transactionHash": tx_hash,
+            "transactionIndex": hex(self.chain.blocks[number].index(tx_hash)),
+            "blockNumber": hex(number),
+            "blockHash": receipt["blockHash"],
+            "from": sender,
+            "to": self.token_address,
+            "status": hex(receipt["status"]),
+            "gasUsed": hex(50000),
+            "cumulativeGasUsed": hex(50000),
+            "contractAddress": None,
+            "logs": [log for log in self._block_logs(number) if log["transactionHash"] == tx_hash],
+        }
+
+    def _eth_call(self, call: Dict[str, Any]) -> str:
+        if call.get("to", "").lower() != self.token_address:
+            return "0x"
+        data = call.get("data") or call.get("input") or "0x"
+        selector = data[:10]
+        if selector == BALANCE_OF:
+            return _word(self.chain.balance_of(_argument_address(data, 0)))
+        if selector == ALLOWANCE:
+            return _word(self.chain.allowance(_argument_address(data, 0), _argument_address(data, 1)))
+        if selector == DECIMALS:
+            return _word(TOKEN_DECIMALS)
+        raise RpcError(3, "execution reverted")
+
+    def _logs(self, log_filter: Dict[str, Any]) -> List[Dict[str, Any]]:
+        from_block = self._block_number(log_filter.get("fromBlock", "latest"))
+        to_block = min(self._block_number(log_filter.get("toBlock", "latest")), self.chain.block_number)
+        return [
+            log for number in range(from_block, to_block + 1)
+            for log in self._block_logs(number) if self._matches(log, log_filter)
+        ]
+
+    def _log(self, number: int, block_hash: str, log: Tuple[str, str, str, int], index: int = 0,
+             tx_index: int = 0, removed: bool = False) -> Dict[str, Any]:
+        tx_hash, source, to, value = log
+        return {
+            "address": self.token_address,
+            "topics": [TRANSFER_TOPIC, address_topic(source), address_topic(to)],
+            "data": _word(value),
+            "blockNumber": hex(number),
+            "blockHash": block_hash,
+            "transactionHash": tx_hash,
+            "transactionIndex": hex(tx_index),
+            "logIndex": hex(index),
+            "removed": removed,
+        }
+
+    def _block_logs(self, number: int) -> List[Dict[str, Any]]:
+        block_hash, transactions = self.chain.block_hashes[number], self.chain.blocks[number]
+        return [
+            self._log(number, block_hash, log, index, transactions.index(log[0]))
+            for index, log in enumerate(self.chain.logs[number])
+        ]
+
+    def _matches(self, log: Dict[str, Any], log_filter: Dict[str, Any]) -> bool:
+        address = log_filter.get("address")
+        if address:
+            addresses = address if isinstance(address, list) else [address]
+            if log["address"] not in (a.lower() for a in addresses):
+                return False
+        for wanted, topic in zip(log_filter.get("topics") or [], log["topics"]):
+            if wanted is None:
+                continue
+            options = wanted if isinstance(wanted, list) else [wanted]
+            if topic not in (option.lower() for option in options):
+                return False
+        return True
+
+    def _on_chain_event(self, kind: str, data: Any):
+        if kind == "block":
+            number = data
+            header = {"number": hex(number), "hash": self.chain.block_hashes[number]}
+            logs = self._block_logs(number)
+        else:
+            header = None
+            logs = [
+                self._log(number, block_hash, log, removed=True) for number, block_hash, log in data
+            ]
+
+        for subscription, (queue, subscribed, log_filter) in self._subscriptions.items():
+            if subscribed == "newHeads":
+                results = [header] if header else []
+            else:
+                results = [log for log in logs if self._matches(log, log_filter)]
+            for result in results:
+                queue.put_nowait({
+                    "jsonrpc": "2.0",
+                    "method": "eth_subscription",
+                    "params": {"subscription": subscription, "result": result},
+                })
@@ -0,0 +1,27 @@
+"""
+Payment detection against the simulated chain
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from payments.confirmations import BlockSource
+from config import PAYMENT_RECIPIENT_ADDRESS
+from .chain import SimulatedChain
+
+
+class SimulatedBlockSource(BlockSource):
+    """Reads blocks, receipts and transfers to `recipient` from a SimulatedChain"""
+
+    def __init__(self, chain: SimulatedChain, recipient: str = PAYMENT_RECIPIENT_ADDRESS):
+        self.chain = chain
+        self.recipient = recipient
+
+    async def head(self) -> int:
+        return self.chain.block_number
+
+    async def tagged_block(self, tag: str) -> int:
+        return self.chain.tagged_block(tag)
+
+    async def receipt(self, tx_hash: str) -> Optional[Dict[str, Any]]:
+        return self.chain.receipt(tx_hash)
+
+    async def transfers(self, from_address: str, from_block: int, to_block: int) -> List[Tuple[str, int]]:
+        return self.chain.transfers(from_address, self.recipient, from_block, to_block)
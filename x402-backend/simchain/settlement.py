@@ -0,0 +1,35 @@
+"""
+Settlement against the simulated chain
+"""
+from typing import Any, Dict, List, Union
+from payments.settlement import SettlementChain, Transfer
+from config import PAYMENT_RECIPIENT_ADDRESS
+from .chain import ChainError, SimulatedChain
+
+
+class SimulatedSettlementChain(SettlementChain):
+    """Sends settlement transfers as transferFrom calls from `spender` on a SimulatedChain"""
+
+    def __init__(self, chain: SimulatedChain, spender: str, recipient: str = PAYMENT_RECIPIENT_ADDRESS):
+        self.chain = chain
+        self.spender = spender
+        self.recipient = recipient
+
+    async def send_transfers(self, transfers: List[Transfer]) -> List[Union[str, Exception]]:
+        results: List[Union[str, Exception]] = []
+        for payer, amount_wei in transfers:
+            try:
+                results.append(self.chain.send_transaction(
+                    self.spender, "transferFrom", payer, self.recipient, amount_wei
+                ))
+            except ChainError as e:
+                results.append(e)
+        return results
+
+    async def receipts(self, tx_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+        receipts = {}
+        for tx_hash in tx_hashes:
+            receipt = self.chain.receipt(tx_hash)
+            if receipt is not None:
+                receipts[tx_hash] = receipt
+        return receipts
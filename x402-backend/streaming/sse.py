@@ -2,56 +2,132 @@
 Server-Sent Events (SSE) for streaming job results
 """
 import asyncio
-from typing import AsyncIterator
+import json
+import time
+from typing import AsyncIterator, List, Optional
 from sse_starlette.sse import EventSourceResponse
+from jobs.base import JobOutput, job_executions
+from jobs.result_cache import result_cache
+from telemetry.metrics import first_output_seconds
+from telemetry.tracing import SpanContext, tracer
+from config import SPECULATIVE_WITHHOLD
 
 
-async def stream_job_output(job) -> AsyncIterator[dict]:
+async def _gate_on_payment(outputs: AsyncIterator[JobOutput], payment: "asyncio.Future[bool]",
+                           withhold: bool) -> AsyncIterator[JobOutput]:
+    """
+    Pass through the output of a job whose payment is still unconfirmed.
+    Output stops if the payment fails; with `withhold`, nothing is released
+    until it confirms.
+    """
+    held: List[JobOutput] = []
+    async for output in outputs:
+        if payment.done():
+            if not payment.result():
+                raise RuntimeError("Payment failed to confirm; result withheld")
+            for earlier in held:
+                yield earlier
+            held = []
+            yield output
+        elif withhold:
+            held.append(output)
+        else:
+            yield output
+
+    if held:
+        # Shielded: a client going away must not cancel the confirmation
+        if not await asyncio.shield(payment):
+            raise RuntimeError("Payment failed to confirm; result withheld")
+        for output in held:
+            yield output
+
+
+async def stream_job_output(job, runner=None, payment: Optional["asyncio.Future[bool]"] = None,
+                            withhold: bool = SPECULATIVE_WITHHOLD,
+                            trace: Optional[SpanContext] = None) -> AsyncIterator[dict]:
     """
     Stream job execution output as SSE events
 
     Args:
         job: Job instance to execute
+        runner: Optional worker pool to execute the job in (default: in-process)
+        payment: Confirmation of the job's payment, if it may still fail (a speculative
+            payment not yet mined, or a mined one that a reorg could remove)
+        withhold: Hold the output until the payment confirms
+        trace: Trace the stream's span belongs to (the execute request's span)
 
     Yields:
         SSE event dictionaries
     """
-    try:
-        # Send start event
-        yield {
-            "event": "start",
-            "data": f"Job {job.job_id} started"
-        }
-
-        # Stream job output
-        async for output in job.execute():
+    # Open client streams are the load that surge pricing reacts to
+    job_executions.streams += 1
+    started = time.perf_counter()
+    first_output = True
+    with tracer.span("stream_job_output", job_id=job.job_id, parent=trace, job_type=job.get_name()) as span:
+        try:
+            # Send start event
             yield {
-                "event": "output",
-                "data": output
+                "event": "start",
+                "data": f"Job {job.job_id} started"
             }
 
-        # Send completion event
-        yield {
-            "event": "complete",
-            "data": f"Job {job.job_id} completed"
-        }
+            # Replay a recorded result if the client opted in and one is fresh
+            # enough; otherwise execute, recording the output for later clients
+            outputs = result_cache.replay(job)
+            span.set_attribute("cached", outputs is not None)
+            if outputs is None:
+                outputs = result_cache.record(job, runner.run(job) if runner else job.run())
+            if payment is not None:
+                outputs = _gate_on_payment(outputs, payment, withhold)
+
+            # Stream job output: typed events keep their type as the SSE event name
+            async for output in outputs:
+                if first_output:
+                    first_output_seconds.labels(job.get_name()).observe(time.perf_counter() - started)
+                    span.add_event("first_output")
+                    first_output = False
+                if isinstance(output, dict):
+                    yield {
+                        "event": output["type"],
+                        "data": json.dumps(output)
+                    }
+                else:
+                    yield {
+                        "event": "output",
+                        "data": output
+                    }
 
-    except Exception as e:
-        # Send error event
-        yield {
-            "event": "error",
-            "data": str(e)
-        }
+            # Send completion event
+            yield {
+                "event": "complete",
+                "data": f"Job {job.job_id} completed"
+            }
+
+        except Exception as e:
+            span.record_error(e)
+            # Send error event
+            yield {
+                "event": "error",
+                "data": str(e)
+            }
+        finally:
+            job_executions.streams -= 1
 
 
-def create_sse_response(job) -> EventSourceResponse:
+def create_sse_response(job, runner=None, payment: Optional["asyncio.Future[bool]"] = None,
+                        withhold: bool = SPECULATIVE_WITHHOLD,
+                        trace: Optional[SpanContext] = None) -> EventSourceResponse:
     """
     Create an SSE response for job streaming
 
     Args:
         job: Job instance to execute
+        runner: Optional worker pool to execute the job in
+        payment: Confirmation of the job's payment, if it may still fail
+        withhold: Hold the output until the payment confirms
+        trace: Trace the stream's span belongs to
 
     Returns:
         EventSourceResponse for FastAPI
     """
-    return EventSourceResponse(stream_job_output(job))
+    return EventSourceResponse(stream_job_output(job, runner, payment, withhold, trace))
@@ -0,0 +1,128 @@
+"""
+Local stand-in for an OpenTelemetry collector: accepts OTLP/HTTP JSON
+trace exports on POST /v1/traces and keeps the spans, flattened back to
+the backend's span dicts, in memory and optionally in a JSON lines file.
+
+Run from the x402-backend directory, then start the backend with
+TRACE_EXPORT=otlp:http://127.0.0.1:4318:
+
+    python -m telemetry.collector [--port 4318] [--output spans.jsonl]
+"""
+import argparse
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+def _value(value: Dict[str, Any]) -> Any:
+    if "intValue" in value:
+        return int(value["intValue"])
+    for key in ("stringValue", "doubleValue", "boolValue"):
+        if key in value:
+            return value[key]
+    return None
+
+
+def from_otlp(request: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Spans of an OTLP/JSON ExportTraceServiceRequest, as Span.to_dict() would give them"""
+    spans = []
+    for resource_spans in request.get("resourceSpans", []):
+        resource = {item["key"]: _value(item["value"]) for item in resource_spans.get("resource", {}).get("attributes", [])}
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                attributes = {item["key"]: _value(item["value"]) for item in span.get("attributes", [])}
+                start_ns, end_ns = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                spans.append({
+                    "service": resource.get("service.name"),
+                    "name": span["name"],
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "job_id": attributes.pop("job.id", None),
+                    "start_ns": start_ns,
+                    "end_ns": end_ns,
+                    "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                    "status": "error" if span.get("status", {}).get("code") == 2 else "ok",
+                    "attributes": attributes,
+                    "events": [
+                        {"name": event["name"], "time_ns": int(event["timeUnixNano"])}
+                        for event in span.get("events", [])
+                    ],
+                })
+    return spans
+
+
+class Collector:
+    """An OTLP/HTTP JSON trace receiver"""
+
+    def __init__(self, output: Optional[str] = None, verbose: bool = False):
+        self.output = output
+        self.verbose = verbose
+        self.spans: List[Dict[str, Any]] = []
+        self.exports = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start receiving; returns the endpoint to export to"""
+        app = web.Application()
+        app.router.add_post("/v1/traces", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        if request.content_type != "application/json":
+            return web.Response(status=415, text="Only OTLP/JSON is accepted")
+        try:
+            spans = from_otlp(await request.json())
+        except (ValueError, KeyError, TypeError) as e:
+            return web.Response(status=400, text=f"Malformed export: {e}")
+        self.exports += 1
+        self.spans.extend(spans)
+        if self.verbose:
+            for span in spans:
+                print(f"{span['trace_id'][:8]} {span['name']:<32} {span['duration_ms']:>10.3f} ms  job {span['job_id']}")
+        if self.output:
+            with open(self.output, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span) + "\n")
+        return web.json_response({"partialSuccess": {}})
+
+    def trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans received for one trace, in start order"""
+        return sorted((span for span in self.spans if span["trace_id"] == trace_id), key=lambda span: span["start_ns"])
+
+
+async def serve(args):
+    collector = Collector(args.output, verbose=True)
+    await collector.start(args.host, args.port)
+    print(f"Collecting traces at {collector.url}/v1/traces")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await collector.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OTLP/HTTP JSON trace collector stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="Append received spans to this file (JSON lines)")
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Structured logging: each record is one JSON object per line, named by an
+event (e.g. "payment_verified") with its fields.
+
+Logging never blocks the caller. Records go onto a bounded in-memory queue
+and a background thread formats and writes them; if the queue is full,
+the record is dropped and counted. Events can be sampled
+(LOG_SAMPLE_RATES), and warnings and errors are rate limited per event
+(LOG_RATE_LIMIT per LOG_RATE_WINDOW_SECONDS), so a failing loop writes a
+few lines and a count of the rest.
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from random import random
+from typing import Any, Dict, Optional, Tuple
+
+from config import LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATES, LOG_RATE_LIMIT, LOG_RATE_WINDOW_SECONDS
+
+ROOT_LOGGER = "x402"
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if getattr(record, "sample_rate", None) is not None:
+            entry["sample_rate"] = record.sample_rate
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are, without waiting: formatting is
+    left to the writer thread, and a record that doesn't fit is dropped
+    """
+
+    def __init__(self, records: "queue.Queue[logging.LogRecord]"):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """Stops after writing every queued record, even when the queue is full"""
+
+    def enqueue_sentinel(self):
+        # Waits for the writer thread to make room, instead of raising queue.Full
+        self.queue.put(self._sentinel)
+
+
+class RateLimiter:
+    """
+    Allows `limit` records per event per window. Records past the limit
+    are counted; the first record of a later window reports the count.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW_SECONDS):
+        self.limit = limit
+        self.window = window
+        # event -> (window start, records in window, suppressed since last written)
+        self._events: Dict[str, Tuple[float, int, int]] = {}
+        self.suppressed = 0
+
+    def allow(self, event: str) -> Optional[int]:
+        """None if the record is suppressed, else how many were suppressed before it"""
+        now = time.monotonic()
+        started, count, suppressed = self._events.get(event, (now, 0, 0))
+        if now - started >= self.window:
+            started, count = now, 0
+        if count >= self.limit:
+            self._events[event] = (started, count, suppressed + 1)
+            self.suppressed += 1
+            return None
+        self._events[event] = (started, count + 1, 0)
+        return suppressed
+
+
+class LogPipeline:
+    """The queue, writer thread and policies shared by every structured logger"""
+
+    def __init__(self, stream=None, queue_size: int = LOG_QUEUE_SIZE, level: str = LOG_LEVEL,
+                 sample_rates: Optional[Dict[str, float]] = None, rate_limiter: Optional[RateLimiter] = None,
+                 name: str = ROOT_LOGGER):
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+        self.sample_rates = dict(LOG_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.sampled_out = 0
+        self._stream = stream
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(queue_size)
+        self._handler = DroppingQueueHandler(self._queue)
+        self._listener: Optional[QueueListener] = None
+
+    @property
+    def started(self) -> bool:
+        return self._listener is not None
+
+    def start(self):
+        """Start the writer thread (done on first use)"""
+        if self.started:
+            return
+        writer = logging.StreamHandler(self._stream or sys.stdout)
+        writer.setFormatter(JsonFormatter())
+        self._listener = DrainingQueueListener(self._queue, writer)
+        self._listener.start()
+        self.logger.addHandler(self._handler)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write what is queued and stop the writer thread"""
+        if not self.started:
+            return
+        self.logger.removeHandler(self._handler)
+        self._listener.stop()
+        self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._queue.qsize(),
+            "dropped": self._handler.dropped,
+            "sampled_out": self.sampled_out,
+            "rate_limited": self.rate_limiter.suppressed,
+        }
+
+
+class StructuredLogger:
+    """
+    Logs events with fields, e.g. log.info("payment_verified", chain_id=84532).
+    A disabled level, a sampled-out event or a rate-limited warning costs a
+    few checks and creates no record.
+    """
+
+    def __init__(self, name: str, pipeline: LogPipeline):
+        self.pipeline = pipeline
+        self.logger = pipeline.logger.getChild(name)
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False):
+        if not self.logger.isEnabledFor(level):
+            return
+        pipeline = self.pipeline
+        rate = pipeline.sample_rates.get(event)
+        if rate is not None and random() >= rate:
+            pipeline.sampled_out += 1
+            return
+        suppressed = 0
+        if level >= logging.WARNING:
+            suppressed = pipeline.rate_limiter.allow(event)
+            if suppressed is None:
+                return
+        if not pipeline.started:
+            pipeline.start()
+        record = self.logger.makeRecord(
+            self.logger.name, level, "", 0, event, (), sys.exc_info() if exc_info else None,
+            extra={"fields": fields, "sample_rate": rate, "suppressed": suppressed}
+        )
+        self.logger.handle(record)
+
+    def debug(self, event: str, **fields: Any):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any):
+        """Log an error with the exception being handled"""
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """A structured logger for a module, e.g. get_logger("payments")"""
+    return StructuredLogger(name, log_pipeline)
+
+
+# Global log pipeline instance
+log_pipeline = LogPipeline()
@@ -0,0 +1,263 @@
+"""
+Prometheus-style metrics: counters, gauges and histograms, rendered in the
+text exposition format for /metrics
+"""
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default histogram buckets, in seconds (1 ms to 30 s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class CounterValue:
+    """One counter series"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class GaugeValue:
+    """One gauge series"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class HistogramValue:
+    """
+    One histogram series. Bucket counts and the sum live in preallocated
+    arrays, so an observation updates them in place.
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One count per bucket, plus one for values above the last bound
+        self.counts = array("Q", [0] * (len(bounds) + 1))
+        self.sum = array("d", [0.0])
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum[0] += value
+
+
+class Metric(ABC):
+    """
+    A named metric with a fixed set of label names; labels(...) returns the
+    series for one combination of label values, creating it on first use.
+
+    Recording never takes a lock: the API process updates metrics from its
+    event loop, and a rare lost update from a worker thread is acceptable.
+    Hot paths can bind a series once and keep it.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], Any] = {}
+
+    @abstractmethod
+    def _new_series(self) -> Any:
+        """Create the value holder for one series"""
+        pass
+
+    def labels(self, *values: str) -> Any:
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} takes labels {self.label_names}")
+            series = self._series.setdefault(values, self._new_series())
+        return series
+
+    @abstractmethod
+    def _lines(self) -> List[str]:
+        """Render every series as exposition lines"""
+        pass
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._lines()]
+
+
+class Counter(Metric):
+    """A value that only goes up"""
+
+    kind = "counter"
+
+    def _new_series(self) -> CounterValue:
+        return CounterValue()
+
+    def inc(self, amount: float = 1):
+        """Increment the unlabeled series"""
+        self.labels().inc(amount)
+
+    def _lines(self) -> List[str]:
+        return [
+            f"{self.name}{_label_text(self.label_names, values)} {_format_value(series.value)}"
+            for values, series in list(self._series.items())
+        ]
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down. With `function`, the unlabeled value is
+    read from it at scrape time instead, so the hot path pays nothing.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help_text, label_names)
+        self.function = function
+
+    def _new_series(self) -> GaugeValue:
+        return GaugeValue()
+
+    def set(self, value: float):
+        """Set the unlabeled series"""
+        self.labels().set(value)
+
+    def _lines(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return [
+            f"{self.name}{_label_text(self.label_names, values)} {_format_value(series.value)}"
+            for values, series in list(self._series.items())
+        ]
+
+
+class Histogram(Metric):
+    """Counts of observations in fixed buckets, with their sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self) -> HistogramValue:
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        """Observe a value in the unlabeled series"""
+        self.labels().observe(value)
+
+    def _lines(self) -> List[str]:
+        lines = []
+        for values, series in list(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.label_names, values, le)} {cumulative}")
+            labels = _label_text(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series.sum[0])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics a process exposes"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names, function))
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry, and the backend's metrics
+metrics = MetricsRegistry()
+
+job_requests = metrics.counter(
+    "x402_job_requests_total", "Job requests by outcome", ["outcome"]
+)
+signature_verify_seconds = metrics.histogram(
+    "x402_signature_verify_seconds", "Time to verify a payment signature", ["kind"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+payment_wait_seconds = metrics.histogram(
+    "x402_payment_wait_seconds", "Time verify-payment waited for an on-chain payment", ["outcome"]
+)
+rpc_request_seconds = metrics.histogram(
+    "x402_rpc_request_seconds", "Chain RPC request latency", ["chain", "method"]
+)
+rpc_errors = metrics.counter(
+    "x402_rpc_errors_total", "Chain RPC requests that failed", ["chain", "method"]
+)
+first_output_seconds = metrics.histogram(
+    "x402_job_first_output_seconds", "Time from stream start to a job's first output", ["job_type"]
+)
+expired_jobs = metrics.counter(
+    "x402_expired_jobs_total", "Unpaid or unexecuted jobs dropped when their window expired"
+)
+loop_lag_seconds = metrics.histogram(
+    "x402_event_loop_lag_seconds", "How late the event loop ran a timer",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+loop_stalls = metrics.counter(
+    "x402_event_loop_stalls_total", "Times a callback blocked the event loop past LOOP_SLOW_SECONDS"
+)
@@ -0,0 +1,178 @@
+"""
+Runtime diagnostics: an event-loop lag monitor, and a sampling profiler
+that runs for a set time and returns folded stacks (the input format of
+flamegraph.pl, speedscope and most flame graph tools).
+
+Neither runs unless started: the monitor is one timer task plus a
+watchdog thread, and the profiler samples only while a profile is taken.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from telemetry.metrics import loop_lag_seconds, loop_stalls
+from telemetry.logs import get_logger
+from config import LOOP_MONITOR_INTERVAL, LOOP_SLOW_SECONDS, PROFILE_INTERVAL
+
+log = get_logger("telemetry.profiling")
+
+# Stalls whose stacks are kept for /api/admin/loop-monitor
+MAX_RECENT_STALLS = 20
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs a timer that fires every
+    `interval` seconds. A watchdog thread checks the timer's heartbeat; if
+    the loop has been blocked for `slow_seconds`, it captures the loop
+    thread's stack, which shows the callback that is blocking it.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, slow_seconds: float = LOOP_SLOW_SECONDS):
+        self.interval = interval
+        self.slow_seconds = slow_seconds
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.recent_stalls: "deque[Dict[str, Any]]" = deque(maxlen=MAX_RECENT_STALLS)
+        self._beat = 0.0
+        # The stall being reported, until the loop runs again and its length is known
+        self._open_stall: Optional[Dict[str, Any]] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop: Optional[threading.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start monitoring the running event loop"""
+        if self.running:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._measure())
+        self._stop = threading.Event()
+        threading.Thread(target=self._watch, args=(self._stop,), name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stop.set()
+
+    async def _measure(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            loop_lag_seconds.observe(lag)
+            self.samples += 1
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            stall, self._open_stall = self._open_stall, None
+            if stall is not None:
+                stall["blocked_seconds"] = round(lag, 3)
+
+    def _watch(self, stop: threading.Event):
+        reported = None
+        while not stop.wait(self.slow_seconds / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.slow_seconds or beat == reported:
+                continue
+            # Report each stall once, with the stack the loop is stuck in
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.stalls += 1
+            loop_stalls.inc()
+            self._open_stall = {
+                "at": datetime.now(timezone.utc).isoformat(),
+                "blocked_seconds": round(blocked, 3),
+                "stack": stack,
+            }
+            self.recent_stalls.append(self._open_stall)
+            log.warning("event_loop_blocked", blocked_seconds=round(blocked, 3), stack=stack)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "slow_seconds": self.slow_seconds,
+            "samples": self.samples,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+            "stalls": self.stalls,
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread at a fixed interval for a set time.
+    Samples are aggregated as folded stacks: one line per distinct stack,
+    "thread;outermost;...;innermost count".
+    """
+
+    def __init__(self):
+        self.running = False
+        self.profiles = 0
+        self._stop = threading.Event()
+
+    def _sample(self, seconds: float, interval: float, stop: threading.Event) -> Counter:
+        stacks: Counter = Counter()
+        own = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not stop.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(labels))] += 1
+        return stacks
+
+    async def profile(self, seconds: float, interval: float = PROFILE_INTERVAL) -> str:
+        """Sample for `seconds` in a background thread and return folded stacks"""
+        if self.running:
+            raise RuntimeError("A profile is already being taken")
+        self.running = True
+        self._stop = threading.Event()
+        try:
+            stacks = await asyncio.to_thread(self._sample, seconds, interval, self._stop)
+        finally:
+            # Sampling ends early if the request is cancelled
+            self._stop.set()
+            self.running = False
+        self.profiles += 1
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"running": self.running, "profiles": self.profiles}
+
+
+# Global loop monitor and profiler instances
+loop_monitor = LoopMonitor()
+profiler = SamplingProfiler()
@@ -0,0 +1,335 @@
+"""
+Trace spans for paid jobs: request, payment verification, execution and
+streaming. Spans carry the job ID, and trace context crosses requests in
+the W3C `traceparent` header, so one job's spans form one trace.
+
+Tracing is off unless an exporter is configured (TRACE_EXPORT). Then a
+trace is recorded if the client marked it sampled, or otherwise for a
+TRACE_SAMPLE_RATE share of requests. Finished spans are buffered and
+exported in the background, to a JSON lines file or an OTLP/HTTP JSON
+collector.
+"""
+import asyncio
+import contextvars
+import json
+import re
+import time
+import urllib.request
+from collections import deque
+from random import getrandbits, random
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from telemetry.logs import get_logger
+from config import TRACE_EXPORT, TRACE_SAMPLE_RATE, TRACE_FLUSH_SECONDS, TRACE_MAX_PENDING_SPANS
+
+log = get_logger("telemetry.tracing")
+
+SERVICE_NAME = "x402-backend"
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+class SpanContext(NamedTuple):
+    """What a child span, or the next request, needs from its parent"""
+    trace_id: str  # 32 hex digits
+    span_id: str  # 16 hex digits
+    sampled: bool
+
+
+# The span whose block is executing
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation. Used as a context manager: the span is current
+    inside the block, and ends when the block exits. An unsampled span is
+    current too, so its children are not sampled either, but it records
+    nothing.
+    """
+
+    __slots__ = ("tracer", "name", "context", "parent_id", "job_id", "attributes", "events",
+                 "start_ns", "end_ns", "status", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, context: SpanContext, parent_id: Optional[str],
+                 job_id: Optional[str], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.job_id = job_id
+        self.attributes = attributes
+        self.events: List[tuple] = []
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = "ok"
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str):
+        """Mark a point in time within the span (e.g. the first output)"""
+        if self.context.sampled:
+            self.events.append((time.time_ns(), name))
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.context.sampled:
+                self.tracer.finished(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            if issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+                self.status = "cancelled"
+            else:
+                self.record_error(exc)
+        self.end()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited in another context (a generator closed elsewhere)
+            _current_span.set(None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "job_id": self.job_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": [{"name": name, "time_ns": at} for at, name in self.events],
+        }
+
+
+class NoopSpan:
+    """The span handed out while tracing is off: every call does nothing"""
+
+    __slots__ = ()
+
+    context = None
+    job_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self) -> "NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class FileSpanExporter:
+    """Appends finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Dict[str, Any]]):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span, default=str) + "\n")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Spans (Span.to_dict()) as an OTLP/JSON ExportTraceServiceRequest"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": "x402"},
+                "spans": [
+                    {
+                        "traceId": span["trace_id"],
+                        "spanId": span["span_id"],
+                        "parentSpanId": span["parent_id"] or "",
+                        "name": span["name"],
+                        "kind": 1,  # internal
+                        "startTimeUnixNano": str(span["start_ns"]),
+                        "endTimeUnixNano": str(span["end_ns"]),
+                        "attributes": _otlp_attributes(
+                            {**span["attributes"], "job.id": span["job_id"]} if span["job_id"] else span["attributes"]
+                        ),
+                        "events": [
+                            {"name": event["name"], "timeUnixNano": str(event["time_ns"])}
+                            for event in span["events"]
+                        ],
+                        # 1 = ok, 2 = error
+                        "status": {"code": 2 if span["status"] == "error" else 1},
+                    }
+                    for span in spans
+                ],
+            }],
+        }]
+    }
+
+
+class OtlpSpanExporter:
+    """Posts finished spans to an OTLP/HTTP collector, JSON encoded"""
+
+    def __init__(self, endpoint: str, timeout: float = 5):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+
+    def export(self, spans: List[Dict[str, Any]]):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(to_otlp(spans)).encode(), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+def create_exporter(spec: str) -> Union[FileSpanExporter, OtlpSpanExporter, None]:
+    """Build the exporter TRACE_EXPORT names: "file:<path>", "otlp:<url>" or "" (none)"""
+    if not spec:
+        return None
+    kind, _, target = spec.partition(":")
+    if kind == "file" and target:
+        return FileSpanExporter(target)
+    if kind == "otlp" and target:
+        return OtlpSpanExporter(target)
+    raise ValueError(f"Unknown trace exporter: {spec}")
+
+
+class Tracer:
+    """Creates spans, and buffers finished ones until they are exported"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, exporter=None,
+                 max_pending: int = TRACE_MAX_PENDING_SPANS):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.pending: "deque[Span]" = deque(maxlen=max_pending)
+        self.recorded = 0
+        self.dropped = 0
+        self.exported = 0
+        self.export_errors = 0
+
+    def span(self, name: str, job_id: Optional[str] = None, parent: Optional[SpanContext] = None,
+             **attributes: Any) -> Union[Span, NoopSpan]:
+        """
+        Start a span, as a child of `parent` (e.g. from a traceparent header)
+        or else of the current span. Without either, it starts a new trace,
+        sampled at the sample rate. The job ID is inherited from the current
+        span if not given.
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+
+        current = _current_span.get()
+        if current is not None:
+            job_id = job_id or current.job_id
+            parent = parent or current.context
+
+        if parent is None:
+            trace_id = f"{getrandbits(128):032x}"
+            parent_id = None
+            sampled = random() < self.sample_rate
+        else:
+            trace_id, parent_id, sampled = parent
+        context = SpanContext(trace_id, f"{getrandbits(64):016x}", sampled)
+        return Span(self, name, context, parent_id, job_id, attributes)
+
+    def child(self, name: str, **attributes: Any) -> Union[Span, NoopSpan]:
+        """A span under the current one; outside a trace, nothing is recorded"""
+        if _current_span.get() is None:
+            return NOOP_SPAN
+        return self.span(name, **attributes)
+
+    @staticmethod
+    def current() -> Optional[Span]:
+        return _current_span.get()
+
+    @staticmethod
+    def extract(traceparent: Optional[str]) -> Optional[SpanContext]:
+        """Parse a W3C traceparent header (None if absent or malformed)"""
+        match = TRACEPARENT.match(traceparent.strip().lower()) if traceparent else None
+        if match is None or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+            return None
+        return SpanContext(match.group(1), match.group(2), bool(int(match.group(3), 16) & 1))
+
+    @staticmethod
+    def inject(context: SpanContext) -> str:
+        """A traceparent header continuing the trace from `context`"""
+        return f"00-{context.trace_id}-{context.span_id}-{'01' if context.sampled else '00'}"
+
+    def finished(self, span: Span):
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(span)
+        self.recorded += 1
+
+    async def flush(self):
+        """Export the spans finished so far"""
+        if not self.pending or self.exporter is None:
+            return
+        spans = []
+        while self.pending:
+            spans.append(self.pending.popleft().to_dict())
+        try:
+            await asyncio.to_thread(self.exporter.export, spans)
+            self.exported += len(spans)
+        except Exception as e:
+            self.export_errors += 1
+            log.warning("trace_export_failed", spans_dropped=len(spans), error=str(e))
+
+    async def run(self, interval: float = TRACE_FLUSH_SECONDS):
+        """Background task: export finished spans periodically"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.exporter is not None,
+            "sample_rate": self.sample_rate,
+            "recorded": self.recorded,
+            "exported": self.exported,
+            "pending": len(self.pending),
+            "dropped": self.dropped,
+            "export_errors": self.export_errors,
+        }
+
+
+# Global tracer instance
+tracer = Tracer(exporter=create_exporter(TRACE_EXPORT))
@@ -27,7 +27,8 @@ def test_list_jobs():
     assert resp.status_code == 200
     data = resp.json()
     assert "ping" in data["jobs"]
-    assert data["jobs"]["ping"]["price"] == "0.01"
+    assert data["jobs"]["ping"]["price"] == "0.0025"
+    assert data["jobs"]["ping"]["price_unit"] == "packet"
     print("   ✓ List jobs PASS")
 
 
@@ -46,7 +47,7 @@ def test_job_request():
     data = resp.json()
     assert "job_id" in data
     assert data["message"] == "Payment Required"
-    assert data["payment"]["amount"] == "0.01"
+    assert data["payment"]["amount"] == "0.0075"  # 3 packets
     assert "expires_at" in data
     print(f"   ✓ Job request PASS (job_id: {data['job_id'][:8]}...)")
     return data["job_id"]
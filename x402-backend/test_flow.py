@@ -2,8 +2,63 @@
 Test script to verify the x402 PoC flow
 """
 import asyncio
+import io
+import json
+import os
 import sys
-from jobs.ping import PingJob
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from eth_account import Account
+from eth_account.messages import encode_typed_data
+
+# The probe tests target local servers; worker processes inherit this too
+os.environ["PROBE_ALLOW_PRIVATE"] = "true"
+
+from jobs.base import Job, JobTimeoutError, job_executions
+from jobs.process import JobProcess
+from jobs.ping import PingJob, PingParser
+from jobs.traceroute import TracerouteJob, parse_hop_line
+from jobs.http_probe import HttpProbeJob
+from jobs.tcp_probe import TcpProbeJob
+from jobs.dns_cache import DnsCache, ResolutionError
+from runner.pool import WorkerPool, WorkerError
+from dispatch.queue import MemoryQueue
+from dispatch.relay import Dispatcher
+from dispatch.worker import WorkerNode
+from jobs.stats import P2Quantile
+from jobs.result_cache import ResultCache, result_cache
+from jobs.registry import JobRegistry
+from jobs.batch_ping import BatchPingJob
+from payments.pricing import PricingEngine
+from payments.sessions import SessionStore, SessionError, InsufficientBalance
+from payments.settlement import SettlementEngine
+from payments.speculative import SpeculativePayments
+from payments.confirmations import ReorgTracker, wait_for_payment
+from payments.log_stream import LogStream
+from simchain.chain import ChainError, SimulatedChain
+from simchain.node import SimulatedNode
+from simchain.payments import SimulatedBlockSource
+from simchain.settlement import SimulatedSettlementChain
+from payments.merkle import MerkleTree, job_leaf, verify_proof
+from payments.base_token import MultiChainVerifier, PaymentVerifier
+from payments.ledger import PaymentLedger
+from payments.x402_auth import (
+    BATCH_AUTHORIZATION_TYPES, DEPOSIT_CLAIM_TYPES, PAYMENT_AUTHORIZATION_TYPES, SPENDING_CAP_TYPES,
+    get_payment_domain, verify_batch_signature, verify_deposit_claim, verify_payment_signature, verify_spending_cap
+)
+from telemetry.metrics import Metric, MetricsRegistry, rpc_request_seconds
+from telemetry.tracing import NOOP_SPAN, FileSpanExporter, OtlpSpanExporter, Tracer, tracer
+from telemetry.collector import Collector
+from telemetry.profiling import LoopMonitor, SamplingProfiler
+from telemetry.logs import LogPipeline, RateLimiter, StructuredLogger
+from config import CHAIN_ID, TOKEN_ADDRESS, PAYMENT_RECIPIENT_ADDRESS, U_TOKEN_CHAINS, JOB_MANIFEST
+from streaming.sse import stream_job_output
+from fastapi import HTTPException
+from starlette.requests import Request
+import main as api
 
 
 async def test_ping_job():
@@ -36,7 +91,7 @@ async def test_ping_job():
     # Execute the job
     try:
         async for output in job.execute():
-            print(output, end='')
+            print(output if isinstance(output, dict) else output.rstrip())
         print("-" * 50)
         print("Job execution: PASS")
         return True
@@ -73,10 +128,1879 @@ async def test_validation():
 
         print(f"{description:30} - {status:5} (valid={is_valid}, error='{error}')")
 
+    # A batch must fit in the per-job wall-clock cap at its parallelism
+    hosts = [f"host{i}.example" for i in range(50)]
+    batch_cases = [
+        ({"hosts": hosts, "count": 10}, False, "Batch over the wall cap"),
+        ({"hosts": hosts, "count": 10, "parallelism": 16}, True, "Batch within the wall cap"),
+    ]
+
+    for params, should_pass, description in batch_cases:
+        job = BatchPingJob(job_id="test", params=params)
+        is_valid, error = job.validate_params()
+        if is_valid:
+            is_valid, error = job.validate_time_limit()
+
+        status = "PASS" if is_valid == should_pass else "FAIL"
+        if is_valid == should_pass:
+            passed += 1
+        else:
+            failed += 1
+
+        print(f"{description:30} - {status:5} (valid={is_valid}, error='{error}')")
+
     print(f"\nValidation tests: {passed} passed, {failed} failed")
     return failed == 0
 
 
+async def test_ping_parser():
+    """Test structured event parsing of ping output"""
+    print("\n\nTesting Ping Output Parsing")
+    print("=" * 50)
+
+    parser = PingParser("example.com", 4)
+    lines = [
+        "PING example.com (93.184.216.34) 56(84) bytes of data.",
+        "64 bytes from 93.184.216.34: icmp_seq=1 ttl=56 time=10.0 ms",
+        "64 bytes from 93.184.216.34: icmp_seq=2 ttl=56 time=20.0 ms",
+        "64 bytes from 93.184.216.34: icmp_seq=4 ttl=56 time=30.0 ms",
+    ]
+    events = [event for line in lines for event in parser.feed(line)]
+    events += parser.finish()
+
+    types = [event["type"] for event in events]
+    summary = events[-1]
+    checks = [
+        (types == ["reply", "reply", "reply", "timeout", "summary"], "Event sequence"),
+        (events[3]["seq"] == 3, "Missing sequence reported as timeout"),
+        (summary["loss_pct"] == 25.0, "Loss percentage"),
+        (summary["rtt_min_ms"] == 10.0 and summary["rtt_max_ms"] == 30.0, "RTT min/max"),
+        (summary["rtt_avg_ms"] == 20.0, "RTT average"),
+        (abs(summary["rtt_mdev_ms"] - 8.165) < 0.001, "RTT mdev"),
+    ]
+
+    # A ping that never ran reports no invented timeouts
+    job = PingJob(job_id="test-unresolvable", params={"host": "unresolvable.invalid", "count": 3})
+    failed_events = [event async for event in job.execute()]
+    checks.append((
+        [event["type"] for event in failed_events] == ["error", "summary"]
+        and failed_events[-1]["transmitted"] == 0 and failed_events[-1]["error"],
+        "Failed ping summarized without timeouts",
+    ))
+
+    estimator = P2Quantile(0.5)
+    for value in range(1, 1002):
+        estimator.add(float(value))
+    checks.append((abs(estimator.value - 501) < 5, "Streaming p50 estimate"))
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _ScriptedTraceroute(TracerouteJob):
+    """Traceroute whose probes answer from a fixed path instead of running ping"""
+
+    # ttl -> (addr, rtt_ms, probe_ms, reached); hops past the destination answer as the destination
+    path = {
+        1: ("10.0.0.1", None, 5.0, False),
+        2: (None, None, None, False),
+        3: ("192.0.2.1", 20.0, 21.0, True),
+    }
+
+    async def _probe(self, address, ttl):
+        self.params.setdefault("probed", []).append(ttl)
+        addr, rtt_ms, probe_ms, reached = self.path.get(ttl, self.path[3])
+        # Nearer hops answer first
+        await asyncio.sleep(0.01 * ttl)
+        return {"ttl": ttl, "addr": addr, "rtt_ms": rtt_ms, "probe_ms": probe_ms, "reached": reached}
+
+
+async def test_traceroute():
+    """Test traceroute hop parsing, destination filtering, MTR statistics and the path summary"""
+    print("\n\nTesting Traceroute")
+    print("=" * 50)
+
+    exceeded = parse_hop_line("From 10.0.0.1 icmp_seq=1 Time to live exceeded")
+    bsd_exceeded = parse_hop_line("92 bytes from 10.0.0.2: Time to live exceeded")
+    reply = parse_hop_line("64 bytes from 192.0.2.1: icmp_seq=1 ttl=56 time=20.5 ms")
+    other = parse_hop_line("PING 192.0.2.1 (192.0.2.1) 56(84) bytes of data.")
+
+    # A fake ping on PATH: intermediate hops get a probe duration, not an RTT
+    bin_dir = tempfile.mkdtemp()
+    with open(os.path.join(bin_dir, "ping"), "w") as f:
+        f.write("#!/bin/sh\nsleep 0.05\necho 'From 10.0.0.1 icmp_seq=1 Time to live exceeded'\n")
+    os.chmod(os.path.join(bin_dir, "ping"), 0o755)
+    search_path = os.environ["PATH"]
+    os.environ["PATH"] = bin_dir + os.pathsep + search_path
+    try:
+        probed = await TracerouteJob(job_id="test-probe", params={"host": "192.0.2.1"})._probe("192.0.2.1", 1)
+    finally:
+        os.environ["PATH"] = search_path
+        os.unlink(os.path.join(bin_dir, "ping"))
+        os.rmdir(bin_dir)
+
+    trace = _ScriptedTraceroute(job_id="test-trace", params={"host": "192.0.2.1", "max_hops": 6})
+    trace_events = [event async for event in trace.execute()]
+    hops = [event for event in trace_events if event["type"] == "hop"]
+    path = trace_events[-1]
+
+    mtr = _ScriptedTraceroute(job_id="test-mtr", params={"host": "192.0.2.1", "max_hops": 6, "mode": "mtr", "cycles": 2})
+    mtr_events = [event async for event in mtr.execute()]
+    mtr_hops = [event for event in mtr_events if event["type"] == "hop"]
+    mtr_path = mtr_events[-1]
+
+    checks = [
+        (exceeded == {"addr": "10.0.0.1", "rtt_ms": None, "reached": False}
+         and bsd_exceeded["addr"] == "10.0.0.2", "TTL-exceeded lines parsed"),
+        (reply == {"addr": "192.0.2.1", "rtt_ms": 20.5, "reached": True} and other is None, "Echo reply parsed"),
+        (probed["addr"] == "10.0.0.1" and probed["rtt_ms"] is None
+         and probed["probe_ms"] >= 50, "Intermediate hop timed as probe"),
+        (sorted(hop["ttl"] for hop in hops) == [1, 2, 3], "Hops past destination dropped"),
+        (path["type"] == "path" and path["reached"]
+         and [hop["ttl"] for hop in path["hops"]] == [1, 2, 3], "Path summary up to destination"),
+        ([hop["timing"] for hop in path["hops"]] == ["probe", "probe", "rtt"]
+         and path["hops"][1]["loss_pct"] == 100.0, "Path timing labelled, lost hop"),
+        (mtr.params["probed"][6:] == [1, 2, 3], "MTR re-probes up to destination"),
+        ([hop["cycle"] for hop in mtr_hops] == [1, 1, 1, 2, 2, 2]
+         and mtr_hops[-1]["stats"]["received"] == 2, "MTR per-hop stats updated"),
+        (mtr_path["hops"][2]["rtt_avg_ms"] == 20.0
+         and mtr_path["hops"][0]["rtt_avg_ms"] == 5.0, "MTR path averages per hop"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_batch_ping():
+    """Test batch ping interleaves per-host output under the parallelism limit"""
+    print("\n\nTesting Batch Ping")
+    print("=" * 50)
+
+    running = 0
+    peak = 0
+
+    async def fake_execute(self):
+        nonlocal running, peak
+        host = self.params["host"]
+        text = self.output_format == "text"
+        running += 1
+        peak = max(peak, running)
+        try:
+            for seq in (1, 2):
+                await asyncio.sleep(0.01)
+                yield f"reply {seq}\n" if text else {"type": "reply", "host": host, "seq": seq}
+            received = 0 if host.startswith("down") else 2
+            yield f"{received} received\n" if text else {"type": "summary", "host": host, "received": received}
+        finally:
+            running -= 1
+
+    hosts = ["a.example", "b.example", "down.example", "c.example", "d.example"]
+    execute = PingJob.execute
+    PingJob.execute = fake_execute
+    try:
+        job = BatchPingJob(job_id="test-batch", params={"hosts": hosts, "parallelism": 2})
+        events = [event async for event in job.execute()]
+        events_peak = peak
+
+        peak = 0
+        job = BatchPingJob(job_id="test-batch-text", params={"hosts": hosts, "parallelism": 3, "format": "text"})
+        lines = "".join([chunk async for chunk in job.execute()]).splitlines()
+    finally:
+        PingJob.execute = execute
+
+    host_events = events[:-1]
+    summary = events[-1]
+    host_lines = [line for line in lines if line.startswith("[")]
+    checks = [
+        (len(host_events) == 15 and len({event["host"] for event in host_events[:2]}) == 2, "Hosts' output interleaved"),
+        (all(sum(event["host"] == host for event in host_events) == 3 for host in hosts), "Events tagged per host"),
+        (events_peak == 2 and peak == 3, "At most parallelism pings at once"),
+        (summary == {"type": "batch_summary", "targets": 5, "alive": ["a.example", "b.example", "c.example", "d.example"],
+                     "dead": ["down.example"]}, "Batch summary counts"),
+        (len(host_lines) == 15 and all(line.split("] ")[0][1:] in hosts for line in host_lines)
+         and lines[-1] == "Batch ping completed (5 hosts)", "Text lines prefixed with host"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _ProbeTargetHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP server used as a local probe target"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"pong"
+        self.wfile.write(
+            b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+        )
+
+    def log_message(self, *args):
+        pass
+
+
+async def test_probe_jobs():
+    """Test TCP and HTTP probes against a local HTTP server"""
+    print("\n\nTesting TCP/HTTP Probe Jobs")
+    print("=" * 50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProbeTargetHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        tcp_job = TcpProbeJob(job_id="test-tcp", params={"host": "127.0.0.1", "port": port, "count": 2, "interval": 0})
+        tcp_events = [event async for event in tcp_job.execute()]
+
+        http_job = HttpProbeJob(job_id="test-http", params={
+            "url": f"http://127.0.0.1:{port}/", "count": 3, "interval": 0, "keepalive": True
+        })
+        http_events = [event async for event in http_job.execute()]
+
+        blocked_events = []
+        for blocked_job in (
+            TcpProbeJob(job_id="test-tcp-private", params={"host": "127.0.0.1", "port": port, "count": 1}),
+            HttpProbeJob(job_id="test-http-metadata", params={"url": "http://169.254.169.254/latest/", "count": 1}),
+            HttpProbeJob(job_id="test-http-mapped", params={"url": f"http://[::ffff:10.0.0.1]:{port}/", "count": 1}),
+        ):
+            blocked_job.allow_private = False
+            blocked_events.append([event async for event in blocked_job.execute()])
+    finally:
+        server.shutdown()
+
+    attempts = [event for event in http_events if event["type"] == "attempt"]
+    checks = [
+        (tcp_job.validate_params()[0] and http_job.validate_params()[0], "Parameter validation"),
+        (tcp_events[-1]["type"] == "summary" and tcp_events[-1]["received"] == 2, "TCP connect attempts"),
+        (len(attempts) == 3 and all(event["status"] == 200 for event in attempts), "HTTP attempts"),
+        (attempts[0]["connect_ms"] is not None and not attempts[0]["reused"], "First attempt connects"),
+        (all(event["reused"] for event in attempts[1:]), "Later attempts reuse pooled connection"),
+        (all(event["ttfb_ms"] is not None for event in attempts), "Time to first byte measured"),
+        (all(events[0]["type"] == "error" and "non-public" in events[0]["message"]
+             and events[-1]["received"] == 0 for events in blocked_events), "Non-public targets refused"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_dns_cache():
+    """Test DNS cache hits, negative caching and lookup coalescing"""
+    print("\n\nTesting DNS Cache")
+    print("=" * 50)
+
+    cache = DnsCache(ttl=60, negative_ttl=5)
+    lookups = []
+
+    async def fake_lookup(host):
+        lookups.append(host)
+        await asyncio.sleep(0.01)
+        if host.endswith(".invalid"):
+            raise OSError("Name or service not known")
+        return ["192.0.2.1"]
+
+    cache._lookup = fake_lookup
+
+    concurrent = await asyncio.gather(*(cache.resolve("example.com") for _ in range(5)))
+    cached = await cache.resolve("EXAMPLE.com")
+
+    failures = 0
+    for _ in range(2):
+        try:
+            await cache.resolve("nowhere.invalid")
+        except ResolutionError:
+            failures += 1
+
+    stats = cache.stats()
+    checks = [
+        (all(result == ["192.0.2.1"] for result in concurrent), "Concurrent lookups resolve"),
+        (cached == ["192.0.2.1"], "Cached answer reused"),
+        (lookups.count("example.com") == 1, "Concurrent lookups coalesced"),
+        (failures == 2 and lookups.count("nowhere.invalid") == 1, "Failures cached negatively"),
+        (await cache.resolve("192.0.2.7") == ["192.0.2.7"], "IP literals bypass the resolver"),
+        (stats["hits"] == 1 and stats["coalesced"] == 4 and stats["negative_hits"] == 1, "Hit counters"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_registry():
+    """Test lazy job discovery from the manifest"""
+    print("\n\nTesting Job Registry")
+    print("=" * 50)
+
+    registry = JobRegistry()
+    listed = registry.list_jobs()
+    loaded_after_listing = registry.loaded_jobs()
+    ping_class = registry.get_job_class("ping")
+
+    # Importing every job must not change what the manifest advertised
+    registry.preload(["*"])
+    described = registry.list_jobs()
+
+    checks = [
+        ("ping" in listed and listed["ping"]["price"] == "0.0025", "Jobs listed from manifest"),
+        (loaded_after_listing == [], "Listing imports no job code"),
+        (ping_class is PingJob and registry.loaded_jobs() != [], "Job imported on first use"),
+        (described == listed, "Manifest matches job classes"),
+        (registry.get_job_class("nope") is None, "Unknown job type"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_pricing():
+    """Test per-unit, tiered and surge pricing from the precomputed tables"""
+    print("\n\nTesting Pricing Engine")
+    print("=" * 50)
+
+    load = {"streams": 0}
+    engine = PricingEngine(capacity=10, load=lambda: load["streams"])
+    engine.prepare()
+
+    def ping(count):
+        return engine.quote(PingJob(job_id="price", params={"host": "8.8.8.8", "count": count}))
+
+    hosts = [f"host{i}.example" for i in range(30)]
+    batch = BatchPingJob(job_id="price", params={"hosts": hosts})
+
+    one, four, ten = ping(1), ping(4), ping(10)
+    batch_price = engine.quote(batch)
+    load["streams"] = 8
+    surged = ping(4)
+    schedule = engine.schedule("ping")
+
+    checks = [
+        (one == (Decimal("0.0025"), 2500000000000000), "Ping priced per packet"),
+        (four[0] == Decimal("0.01"), "Default ping keeps its price"),
+        (ten[0] == Decimal("0.0225"), "Packets past the tier discounted"),
+        (batch_price[0] == Decimal("0.19"), "Batch tiers graduated"),
+        (surged == (Decimal("0.015"), 15000000000000000), "Surge multiplier under load"),
+        (schedule["current_multiplier"] == "1.5" and len(schedule["tiers"]) == 2, "Schedule published"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_sessions():
+    """Test spending-cap sessions: debits, token checks and settlement"""
+    print("\n\nTesting Prepaid Sessions")
+    print("=" * 50)
+
+    account = Account.create()
+    now = int(time.time())
+    cap = {
+        "recipient": PAYMENT_RECIPIENT_ADDRESS,
+        "token": TOKEN_ADDRESS,
+        "cap": str(10**16),
+        "nonce": "test-cap-nonce",
+        "timestamp": now,
+        "validUntil": now + 600,
+    }
+    signed = Account.sign_message(encode_typed_data(full_message={
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **SPENDING_CAP_TYPES
+        },
+        "primaryType": "SpendingCap",
+        "domain": get_payment_domain(),
+        "message": cap,
+    }), account.key)
+    cap["signature"] = signed.signature.hex()
+    is_valid, signer, _ = verify_spending_cap(cap)
+
+    store = SessionStore(secret="test-secret", ttl=60)
+    session, token = store.open(signer, int(cap["cap"]), "cap", cap["nonce"], valid_until=cap["validUntil"])
+
+    # A deposit is claimed by signing over a nonce the server issued
+    nonce, _ = store.issue_nonce()
+    claim = {**cap, "amount": str(10**16), "nonce": nonce}
+    del claim["cap"], claim["signature"]
+    signed = Account.sign_message(encode_typed_data(full_message={
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **DEPOSIT_CLAIM_TYPES
+        },
+        "primaryType": "DepositClaim",
+        "domain": get_payment_domain(),
+        "message": claim,
+    }), account.key)
+    claim_valid, claimer, _ = verify_deposit_claim({**claim, "signature": signed.signature.hex()})
+    claim_forged, _, _ = verify_deposit_claim({**claim, "signature": "0x" + "00" * 65})
+    nonce_issued = store.nonce_valid(nonce) and not store.nonce_valid("made-up-nonce")
+    nonce_once = store.use_nonce(nonce) and not store.use_nonce(nonce) and not store.nonce_valid(nonce)
+    for _ in range(3):
+        store.debit(token, 3 * 10**15)
+
+    def rejected(call, error=SessionError):
+        try:
+            call()
+        except error:
+            return True
+        return False
+
+    tampered = token[:-1] + ("0" if token[-1] != "0" else "1")
+    checks = [
+        (is_valid and signer == account.address, "Spending cap signer recovered"),
+        (claim_valid and claimer == account.address and not claim_forged, "Deposit claim signer recovered"),
+        (nonce_issued and nonce_once, "Deposit claim nonce used once"),
+        (session.balance_wei == 10**15 and session.jobs == 3, "Jobs debited from balance"),
+        (rejected(lambda: store.debit(token, 2 * 10**15), InsufficientBalance), "Insufficient balance rejected"),
+        (rejected(lambda: store.debit(tampered, 1)), "Tampered token rejected"),
+        (rejected(lambda: SessionStore(secret="other").authenticate(token)), "Token from another secret rejected"),
+        (rejected(lambda: store.open(signer, 1, "cap", cap["nonce"])), "Reused cap nonce rejected"),
+    ]
+
+    records = store.settle()
+    store.close(session)
+    checks += [
+        (len(records) == 1 and records[0]["amount_wei"] == str(9 * 10**15), "Spend settled in one record"),
+        (rejected(lambda: store.debit(token, 1)), "Closed session rejects debits"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_settlement():
+    """Test batched settlement on the simulated chain: per-payer batching and retries"""
+    print("\n\nTesting Batched Settlement")
+    print("=" * 50)
+
+    spender, alice, bob = "0x" + "5" * 40, "0x" + "a" * 40, "0x" + "b" * 40
+    chain = SimulatedChain()
+    for payer in (alice, bob):
+        chain.mint(payer, 10**18)
+    chain.approve(alice, spender, 10**18)
+    engine = SettlementEngine({84532: SimulatedSettlementChain(chain, spender)}, max_attempts=3, retry_seconds=0)
+
+    for i in range(3):
+        engine.submit(f"alice-{i}", alice, 10**16)
+    engine.submit("bob-0", bob, 10**16)
+
+    # First batch never reaches the node; the retry sends one transfer per payer
+    chain.fail_sends(2)
+    await engine.settle_batch()
+    failed_send = engine.status("alice-0")
+    await engine.settle_batch()
+    chain.mine()
+    # Bob's transfer reverted (no allowance) and is resent right away
+    settled = await engine.settle_batch()
+    bob_reverted = engine.status("bob-0")
+
+    # Bob approves before his resent transfer is mined
+    chain.approve(bob, spender, 10**18)
+    chain.mine()
+    settled += await engine.settle_batch()
+
+    engine.submit("carol-0", "0x" + "c" * 40, 10**16)
+    for _ in range(3):
+        await engine.settle_batch()
+        chain.mine()
+    await engine.settle_batch()
+
+    alice_statuses = {engine.status(f"alice-{i}")["tx_hash"] for i in range(3)}
+
+    checks = [
+        (failed_send["status"] == "pending" and failed_send["attempts"] == 1, "Failed send queued for retry"),
+        (len(alice_statuses) == 1 and chain.blocks[1] and len(chain.blocks[1]) == 2, "One transfer per payer per batch"),
+        (bob_reverted["attempts"] == 2 and "reverted" in bob_reverted["error"], "Reverted transfer retried"),
+        (settled == 4 and engine.status("bob-0")["status"] == "settled", "All authorizations settled"),
+        (chain.balance_of(PAYMENT_RECIPIENT_ADDRESS) == 4 * 10**16, "Recipient collected each payment once"),
+        (engine.status("carol-0")["status"] == "failed", "Gave up after max attempts"),
+        (engine.stats()["transfers"] == 6 and engine.stats()["failed"] == 1, "Batches and transfers counted"),
+    ]
+
+    # Nothing queues without a settlement account, and finished records age out
+    disabled = SettlementEngine()
+    disabled.submit("dave-0", "0x" + "d" * 40, 10**16)
+    records_before = engine.stats()["records"]
+    engine.history_seconds = 0
+    await engine.settle_batch()
+    checks += [
+        (disabled.status("dave-0") is None and disabled.stats()["pending"] == 0
+         and disabled.stats()["dropped"] == 1, "Dropped when settlement is off"),
+        (records_before == 5 and engine.stats()["records"] == 0, "Finished records evicted"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_batch_authorization():
+    """Test Merkle batch authorization: proofs per job, one signature per batch"""
+    print("\n\nTesting Batch Authorization")
+    print("=" * 50)
+
+    proofs_ok = True
+    for size in (1, 2, 3, 7, 100):
+        jobs = [(f"job-{i}", (i + 1) * 10**15) for i in range(size)]
+        tree = MerkleTree.for_jobs(jobs)
+        proofs_ok &= all(verify_proof(job_leaf(*job), tree.proof(i), tree.root) for i, job in enumerate(jobs))
+
+    jobs = [(f"job-{i}", 10**16) for i in range(100)]
+    tree = MerkleTree.for_jobs(jobs)
+    root = "0x" + tree.root.hex()
+    wrong_amount = verify_proof(job_leaf("job-0", 2 * 10**16), tree.proof(0), tree.root)
+    wrong_job = verify_proof(job_leaf("job-0", 10**16), tree.proof(1), tree.root)
+
+    account = Account.create()
+    batch = json.loads(_batch_header(account, root, 100 * 10**16, 100))
+
+    is_valid, signer, _ = verify_batch_signature(batch, root, str(100 * 10**16), 100)
+    other_root = "0x" + MerkleTree.for_jobs(jobs[:99] + [("job-99", 10**15)]).root.hex()
+    repriced, _, error = verify_batch_signature(batch, other_root, str(100 * 10**16), 100)
+
+    checks = [
+        (proofs_ok, "Every job's proof verifies"),
+        (not wrong_amount and not wrong_job, "Altered leaf or proof rejected"),
+        (len(tree.proof(0)) == 7, "Proofs are log2(batch) long"),
+        (is_valid and signer == account.address, "One signature recovers for the batch"),
+        (not repriced and "root mismatch" in error, "Jobs differing from the quote rejected"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+def _payment_header(account, job_id: str, amount_wei: int) -> str:
+    """A signed X-PAYMENT header paying amount_wei for one job"""
+    now = int(time.time())
+    payment = {
+        "recipient": PAYMENT_RECIPIENT_ADDRESS,
+        "token": TOKEN_ADDRESS,
+        "amount": str(amount_wei),
+        "jobId": job_id,
+        "timestamp": now,
+        "validUntil": now + 300,
+    }
+    signed = Account.sign_message(encode_typed_data(full_message={
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **PAYMENT_AUTHORIZATION_TYPES
+        },
+        "primaryType": "PaymentAuthorization",
+        "domain": get_payment_domain(),
+        "message": payment,
+    }), account.key)
+    return json.dumps({**payment, "signature": signed.signature.hex()})
+
+
+def _batch_header(account, jobs_root: str, total_wei: int, count: int) -> str:
+    """A signed X-PAYMENT header paying total_wei for the count jobs under jobs_root"""
+    now = int(time.time())
+    batch = {
+        "recipient": PAYMENT_RECIPIENT_ADDRESS,
+        "token": TOKEN_ADDRESS,
+        "totalAmount": str(total_wei),
+        "jobCount": count,
+        "jobsRoot": jobs_root,
+        "timestamp": now,
+        "validUntil": now + 300,
+    }
+    signed = Account.sign_message(encode_typed_data(full_message={
+        "types": {
+            "EIP712Domain": [
+                {"name": "name", "type": "string"},
+                {"name": "version", "type": "string"},
+                {"name": "chainId", "type": "uint256"},
+            ],
+            **BATCH_AUTHORIZATION_TYPES
+        },
+        "primaryType": "BatchAuthorization",
+        "domain": get_payment_domain(),
+        "message": batch,
+    }), account.key)
+    return json.dumps({**batch, "signature": signed.signature.hex()})
+
+
+def _api_request(headers) -> Request:
+    """A bare request to call an API endpoint with directly"""
+    return Request({
+        "type": "http", "method": "POST", "path": "/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+async def _response_status(call) -> int:
+    """HTTP status an endpoint call ends with (200 unless it raises)"""
+    try:
+        await call
+    except HTTPException as e:
+        return e.status_code
+    return 200
+
+
+async def test_reauthorization():
+    """Test a paid job ID can't be authorized again and settlement is keyed by authorization"""
+    print("\n\nTesting Job Re-authorization")
+    print("=" * 50)
+
+    account = Account.create()
+    chain = SimulatedChain()
+    chains = api.settlement_engine.chains
+    api.settlement_engine.chains = {CHAIN_ID: SimulatedSettlementChain(chain, "0x" + "5" * 40)}
+
+    def ping(job_id, count):
+        return api.JobRequest(
+            job_type="ping", params={"host": "8.8.8.8", "count": count},
+            wallet_address=account.address, job_id=job_id
+        )
+
+    batch = api.BatchJobRequest(
+        jobs=[{"job_type": "ping", "params": {"host": "8.8.8.8", "count": 1}, "job_id": f"batch-{i}"} for i in range(2)],
+        wallet_address=account.address
+    )
+
+    async def request_batch():
+        quote = json.loads((await api.request_job_batch(batch, _api_request({}))).body)["payment"]
+        header = _batch_header(account, quote["jobs_root"], int(quote["amount_wei"]), quote["job_count"])
+        await api.request_job_batch(batch, _api_request({"X-PAYMENT": header}))
+        return header
+
+    try:
+        # job-x is paid for one packet, then re-signed for ten
+        cheap = _payment_header(account, "job-x", 25 * 10**14)
+        first = await _response_status(api.request_job(ping("job-x", 1), _api_request({"X-PAYMENT": cheap})))
+        swapped = await _response_status(api.request_job(
+            ping("job-x", 10), _api_request({"X-PAYMENT": _payment_header(account, "job-x", 225 * 10**14)})
+        ))
+        runs = api.pending_jobs["job-x"]["job"].params["count"]
+        settlement = api.settlement_engine.job_status("job-x")
+
+        # Once its entry is cleaned up, the settlement record still refuses it
+        del api.pending_jobs["job-x"]
+        after_cleanup = await _response_status(api.request_job(ping("job-x", 1), _api_request({"X-PAYMENT": cheap})))
+
+        # With settlement off nothing is recorded, but a copy of a used authorization is still refused
+        api.settlement_engine.chains = {}
+        header = _payment_header(account, "job-y", 25 * 10**14)
+        await api.request_job(ping("job-y", 1), _api_request({"X-PAYMENT": header}))
+        del api.pending_jobs["job-y"]
+        replayed = await _response_status(api.request_job(ping("job-y", 1), _api_request({"X-PAYMENT": header})))
+
+        # Same for a batch: once its jobs are cleaned up, replaying its authorization runs nothing
+        header = await request_batch()
+        for item in batch.jobs:
+            del api.pending_jobs[item.job_id]
+        batch_replayed = await _response_status(api.request_job_batch(batch, _api_request({"X-PAYMENT": header})))
+        batch_rerun = any(item.job_id in api.pending_jobs for item in batch.jobs)
+
+        # With settlement on, each job in a batch is settled under the batch authorization
+        api.settlement_engine.chains = {CHAIN_ID: SimulatedSettlementChain(chain, "0x" + "5" * 40)}
+        batch.jobs[0].job_id, batch.jobs[1].job_id = "batch-2", "batch-3"
+        await request_batch()
+        batch_keys = [api.settlement_engine.job_status(item.job_id)["key"] for item in batch.jobs]
+    finally:
+        api.settlement_engine.chains = chains
+        for job_id in ("job-x", "job-y", "batch-0", "batch-1", "batch-2", "batch-3"):
+            api.pending_jobs.pop(job_id, None)
+
+    checks = [
+        (first == 200 and swapped == 409 and runs == 1, "Paid job can't be re-signed"),
+        (settlement["amount_wei"] == str(25 * 10**14) and settlement["key"] != "job-x", "Settled by authorization"),
+        (after_cleanup == 409, "Refused while settlement is tracked"),
+        (replayed == 409, "Used authorization not accepted again"),
+        (batch_replayed == 409 and not batch_rerun, "Used batch authorization refused"),
+        (batch_keys[0].split(":")[0] == batch_keys[1].split(":")[0] != "batch-2", "Batch settled by authorization"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_speculative():
+    """Test speculative authorization: risk limits, wallet flagging and withheld output"""
+    print("\n\nTesting Speculative Authorization")
+    print("=" * 50)
+
+    receipts = {}
+
+    async def wait_for_receipt(tx_hash, timeout):
+        return await receipts.setdefault(tx_hash, asyncio.get_running_loop().create_future())
+
+    price = 10**16
+    tracker = SpeculativePayments(max_price_wei=5 * price, wallet_limit_wei=2 * price, confirm_seconds=5)
+    wallet = "0x" + "a" * 40
+
+    too_expensive = tracker.refusal(wallet, 6 * price)
+    first, _ = tracker.start("job-1", wallet, price, "0x01", wait_for_receipt)
+    reused, _ = tracker.start("job-3", wallet, price, "0x01", wait_for_receipt)
+    second, _ = tracker.start("job-2", wallet, price, "0x02", wait_for_receipt)
+    over_limit = tracker.refusal(wallet, price)
+    await asyncio.sleep(0)
+
+    # Two requests pass refusal() before either has inspected its transfer;
+    # start() re-checks, so only one fits under the wallet limit
+    racing = SpeculativePayments(max_price_wei=5 * price, wallet_limit_wei=price, confirm_seconds=5)
+
+    async def admit(job_id, tx_hash):
+        if racing.refusal(wallet, price):
+            return None, "refused before inspection"
+        await asyncio.sleep(0)  # inspect_transfer
+        return racing.start(job_id, wallet, price, tx_hash, wait_for_receipt)
+
+    (race_won, _), (race_lost, race_refusal) = await asyncio.gather(admit("race-1", "0x11"), admit("race-2", "0x12"))
+    race_exposure = racing.stats()["outstanding_wei"]
+    receipts["0x11"].set_result(True)
+    await race_won
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProbeTargetHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        # Output streams right away; it is cut off once the payment fails
+        job = TcpProbeJob(job_id="spec-1", params={"host": "127.0.0.1", "port": port, "count": 3, "interval": 0.2})
+        streamed = []
+        async for event in stream_job_output(job, payment=first, withhold=False):
+            streamed.append(event["event"])
+            if event["event"] == "attempt" and not receipts["0x01"].done():
+                receipts["0x01"].set_result(False)
+                await asyncio.sleep(0)
+        await first
+
+        # With withhold, nothing past "start" is sent until the payment confirms
+        job = TcpProbeJob(job_id="spec-2", params={"host": "127.0.0.1", "port": port, "count": 2, "interval": 0})
+        held = stream_job_output(job, payment=second, withhold=True)
+        started = (await held.__anext__())["event"]
+        next_event = asyncio.create_task(held.__anext__())
+        await asyncio.sleep(0.3)
+        waited = not next_event.done()
+        receipts["0x02"].set_result(True)
+        released = [(await next_event)["event"]] + [event["event"] async for event in held]
+    finally:
+        server.shutdown()
+
+    checks = [
+        (too_expensive is not None and over_limit is not None, "Price and wallet limits enforced"),
+        (reused is None, "Reused transaction refused"),
+        (race_lost is None and race_refusal is not None and race_exposure == str(price), "Limit re-checked when job starts"),
+        (streamed[:2] == ["start", "attempt"] and streamed[-1] == "error", "Output cut off when payment fails"),
+        (tracker.refusal(wallet, price) is not None and tracker.stats()["flagged_wallets"] == 1, "Failed payment flags wallet"),
+        (started == "start" and waited, "Output withheld until confirmation"),
+        (released[-1] == "complete" and await second, "Output released on confirmation"),
+        (tracker.stats()["outstanding_wei"] == "0", "Exposure released when settled"),
+    ]
+
+    # Flags expire, so the flagged set stays bounded
+    tracker.flag_seconds = 0
+    checks.append((
+        tracker.refusal(wallet, price) is None and tracker.stats()["flagged_wallets"] == 0,
+        "Wallet flag expires",
+    ))
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _FakeChainVerifier:
+    """Stands in for one chain's PaymentVerifier: finds the payment after `delay`, if at all"""
+
+    def __init__(self, delay, found):
+        self.delay = delay
+        self.found = found
+        self.cancelled = False
+
+    async def verify_payment(self, from_address, expected_amount, timeout, confirmations=0, claim=None):
+        try:
+            await asyncio.sleep(self.delay if self.found else timeout)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return (True, f"0x{self.delay}") if self.found else (False, None)
+
+
+async def test_confirmations():
+    """Test confirmation policies and reorg handling on the forking simulated chain"""
+    print("\n\nTesting Confirmations and Reorgs")
+    print("=" * 50)
+
+    chain = SimulatedChain(safe_depth=4, finalized_depth=8)
+    source = SimulatedBlockSource(chain)
+    price = 10**16
+    # One payer per case, so earlier payments don't match
+    payers = ["0x" + digit * 40 for digit in "abcde"]
+    for payer in payers:
+        chain.mint(payer, 10**18)
+
+    def pay(payer):
+        return chain.send_transaction(payer, "transfer", PAYMENT_RECIPIENT_ADDRESS, price)
+
+    def wait(payer, policy, timeout=2):
+        return asyncio.create_task(wait_for_payment(source, payer, price, policy, timeout, poll_interval=0.01))
+
+    async def mine(blocks=1):
+        for _ in range(blocks):
+            chain.mine()
+            await asyncio.sleep(0.05)
+
+    # 0 confirmations: accepted as soon as the transfer is mined
+    tx = pay(payers[0])
+    await mine()
+    instant = await wait(payers[0], 0)
+
+    # 3 confirmations: not before the third block on top of the transfer
+    waiter = wait(payers[1], 3)
+    deep_tx = pay(payers[1])
+    await mine(3)
+    early = waiter.done()
+    await mine()
+    deep = await waiter
+
+    # A reorg re-mines the transfer in another block before it confirms
+    waiter = wait(payers[2], 2)
+    remined_tx = pay(payers[2])
+    await mine()
+    first_hash = chain.receipt(remined_tx)["blockHash"]
+    chain.reorg(1)
+    await mine(3)
+    remined = await waiter
+    remined_hash = chain.receipt(remined_tx)["blockHash"]
+
+    # A reorg drops the transfer: it never confirms
+    waiter = wait(payers[3], 2, timeout=0.5)
+    dropped_tx = pay(payers[3])
+    await mine()
+    chain.reorg(1, drop=[dropped_tx])
+    await mine(3)
+    dropped = await waiter
+
+    # "safe": the transfer's block must be at or below the safe block
+    waiter = wait(payers[4], "safe")
+    safe_tx = pay(payers[4])
+    await mine(4)
+    before_safe = waiter.done()
+    await mine()
+    safe = await waiter
+
+    # Accepted payments are watched until finalized
+    tracker = ReorgTracker({84532: source})
+    kept_tx, lost_tx = pay(payers[0]), pay(payers[1])
+    await mine()
+    kept = tracker.watch(84532, kept_tx)
+    lost = tracker.watch(84532, lost_tx)
+    await tracker.check()
+    chain.reorg(1, drop=[lost_tx])
+    await mine()
+    await tracker.check()
+    await tracker.check()
+    lost_detected = lost.done() and not lost.result()
+    kept_pending = not kept.done()
+    await mine(8)
+    await tracker.check()
+
+    try:
+        chain.reorg(9)
+        deep_reorg_refused = False
+    except ChainError:
+        deep_reorg_refused = True
+
+    checks = [
+        (instant == tx, "0 confirmations: accepted once mined"),
+        (not early and deep == deep_tx, "3 confirmations: waits for 3 blocks"),
+        (remined == remined_tx and remined_hash != first_hash, "Re-mined transfer still confirms"),
+        (dropped is None, "Reorged-out transfer never confirms"),
+        (not before_safe and safe == safe_tx, "Safe policy waits for the safe block"),
+        (lost_detected, "Accepted payment lost to reorg flagged"),
+        (kept_pending and kept.done() and kept.result() and tracker.stats()["remined"] == 1,
+         "Re-mined payment kept until finalized"),
+        (deep_reorg_refused, "Finalized blocks cannot be reorged"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_log_stream():
+    """Test push-mode payment detection against the websocket simulated node"""
+    print("\n\nTesting Log Subscription")
+    print("=" * 50)
+
+    chain = SimulatedChain()
+    node = SimulatedNode(chain, TOKEN_ADDRESS)
+    url = await node.start()
+    polling = SimulatedBlockSource(chain)
+    stream = LogStream(url, TOKEN_ADDRESS, polling, reconnect_seconds=0.05)
+    price = 10**16
+    payers = ["0x" + digit * 40 for digit in "abcd"]
+    for payer in payers:
+        chain.mint(payer, 10**18)
+
+    def pay(payer):
+        return chain.send_transaction(payer, "transfer", PAYMENT_RECIPIENT_ADDRESS, price)
+
+    async def until(condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return condition()
+
+    # Before connecting, reads go to the polling source
+    early_tx = pay(payers[0])
+    chain.mine()
+    fallback = await stream.transfers(payers[0], 0, chain.block_number) == [(early_tx, price)]
+
+    task = asyncio.create_task(stream.run())
+    connected = await until(lambda: stream.live)
+    backfilled = await stream.transfers(payers[0], 0, chain.block_number) == [(early_tx, price)]
+
+    # A waiting payment sees the transfer as the node pushes it, not on the next poll
+    waiter = asyncio.create_task(wait_for_payment(stream, payers[1], price, 0, timeout=5, poll_interval=2))
+    await asyncio.sleep(0.1)
+    pushed_tx = pay(payers[1])
+    chain.mine()
+    mined_at = time.monotonic()
+    pushed = await waiter
+    latency = time.monotonic() - mined_at
+
+    # Transfers mined while disconnected are backfilled on reconnect
+    node.refuse_connections = True
+    await node.drop_connections()
+    disconnected = await until(lambda: not stream.live)
+    gap_tx = pay(payers[2])
+    chain.mine()
+    chain.mine()
+    node.refuse_connections = False
+    reconnected = await until(lambda: stream.live and stream.connects == 2)
+    gap = await stream.transfers(payers[2], 0, chain.block_number) == [(gap_tx, price)]
+
+    # A reorg's removed log takes the transfer out of the index
+    reorged_tx = pay(payers[3])
+    chain.mine()
+    indexed = await until(lambda: stream.stats()["indexed"] == 4)
+    chain.reorg(1, drop=[reorged_tx])
+    removed = await until(lambda: stream.stats()["indexed"] == 3)
+    reorged_receipt = await stream.receipt(reorged_tx)
+
+    task.cancel()
+    await node.stop()
+
+    checks = [
+        (fallback, "Polls while not subscribed"),
+        (connected and backfilled, "Backfills on first connect"),
+        (pushed == pushed_tx and latency < 1, "Pushed transfer detected without polling"),
+        (disconnected and reconnected and gap, "Resubscribes and backfills the gap"),
+        (indexed and removed and reorged_receipt is None, "Removed logs drop reorged transfers"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_rpc_node():
+    """Test PaymentVerifier over JSON-RPC against the simulated node"""
+    print("\n\nTesting Simulated RPC Node")
+    print("=" * 50)
+
+    chain = SimulatedChain(seed=7)
+    node = SimulatedNode(chain, TOKEN_ADDRESS, seed=7)
+    await node.start()
+    verifier = PaymentVerifier(rpc_url=node.http_url)
+    payer = "0x" + "ab" * 20
+    chain.mint(payer, 10**18)
+
+    # Same seed, same hashes
+    replay = SimulatedChain(seed=7)
+    deterministic = replay.block_hashes == chain.block_hashes
+
+    balance = await verifier.check_balance(payer)
+
+    # A scripted transfer is found by the verifier's log filter
+    paid_tx = chain.script_transfer(2, payer, PAYMENT_RECIPIENT_ADDRESS, 10**16)
+    chain.mine()
+    chain.mine()
+    success, tx_hash = await verifier.verify_payment(payer, Decimal("0.01"), timeout=5)
+    receipt = await verifier.receipt(paid_tx)
+
+    # A transfer pays for one thing: claimed for job-a, it is skipped for job-b
+    multi = MultiChainVerifier([84532], ledger=PaymentLedger())
+    multi.verifiers = {84532: verifier}
+    claimed = await multi.verify_payment(payer, Decimal("0.01"), timeout=5, purpose="job-a")
+    reclaimed = await multi.verify_payment(payer, Decimal("0.01"), timeout=5, purpose="job-a")
+    double_spend = await multi.verify_payment(payer, Decimal("0.01"), timeout=1, purpose="job-b")
+    other_chain = await multi.verify_payment(payer, Decimal("0.01"), timeout=1, purpose="job-a", chain_id=1)
+
+    # Cap sessions need the balance, and the allowance for the settlement account
+    spender = "0x" + "5" * 40
+    covered = await multi.funding_error(84532, payer, 10**17)
+    over_balance = await multi.funding_error(84532, payer, 2 * 10**18)
+    no_allowance = await multi.funding_error(84532, payer, 10**17, spender)
+    chain.approve(payer, spender, 10**17)
+    approved = await multi.funding_error(84532, payer, 10**17, spender)
+
+    # A pending transfer can be inspected before it is mined
+    pending_tx = chain.send_transaction(payer, "transfer", PAYMENT_RECIPIENT_ADDRESS, 10**16)
+    inspected, _, inspect_error = await verifier.inspect_transfer(payer, Decimal("0.01"), pending_tx)
+
+    # A reorg takes a mined transfer off the chain
+    chain.mine()
+    mined = await verifier.receipt(pending_tx) is not None
+    _, _, mined_error = await verifier.inspect_transfer(payer, Decimal("0.01"), pending_tx)
+    chain.reorg(1, drop=[pending_tx])
+    reorged = await verifier.receipt(pending_tx) is None
+
+    # Injected latency and errors
+    node.latency = 0.2
+    started = time.monotonic()
+    await verifier.head()
+    slow = time.monotonic() - started >= 0.2
+    node.latency = 0
+    node.error_rate = 1
+    failing, _ = await verifier.verify_payment(payer, Decimal("0.01"), timeout=1)
+    node.error_rate = 0
+
+    await node.stop()
+
+    checks = [
+        (deterministic, "Seeded chains repeat their hashes"),
+        (balance == Decimal(1), "balanceOf answered over eth_call"),
+        (success and tx_hash == paid_tx and receipt["blockNumber"] == 2, "Scripted transfer verified over RPC"),
+        (node.calls.get("eth_getFilterLogs", 0) >= 1, "Verifier's log filter served"),
+        (inspected and inspect_error is None, "Pending transfer inspected over RPC"),
+        (mined_error == "Transaction is already mined", "Mined transfer not taken as speculative"),
+        (claimed == reclaimed == (True, paid_tx, 84532), "Transfer claimed for its job"),
+        (double_spend == other_chain == (False, None, None)
+         and multi.ledger.stats()["refused"] >= 1, "Claimed transfer can't pay again"),
+        (covered is None and approved is None and "Balance" in over_balance
+         and "Allowance" in no_allowance, "Cap funding checked against chain"),
+        (mined and reorged, "Reorged receipt disappears"),
+        (slow, "Injected latency delays requests"),
+        (not failing and node.errors > 0, "Injected errors fail verification"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_metrics():
+    """Test metric recording and the Prometheus text format"""
+    print("\n\nTesting Metrics")
+    print("=" * 50)
+
+    registry = MetricsRegistry()
+    requests_total = registry.counter("requests_total", "Requests", ["outcome"])
+    queue = registry.gauge("queue_depth", "Queued items", function=lambda: 7)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+    authorized = requests_total.labels("authorized")
+    authorized.inc()
+    authorized.inc()
+    requests_total.labels('say "hi"\n').inc()
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value)
+    text = registry.render()
+
+    try:
+        registry.counter("requests_total", "Again")
+        duplicate_refused = False
+    except ValueError:
+        duplicate_refused = True
+
+    try:
+        requests_total.labels("a", "b")
+        wrong_labels_refused = False
+    except ValueError:
+        wrong_labels_refused = True
+
+    try:
+        Metric("bare", "No series type")
+        abstract_refused = False
+    except TypeError:
+        abstract_refused = True
+
+    # The RPC middleware times every request a verifier makes
+    chain = SimulatedChain()
+    node = SimulatedNode(chain, TOKEN_ADDRESS)
+    await node.start()
+    verifier = PaymentVerifier(rpc_url=node.http_url)
+    block_numbers = rpc_request_seconds.labels("84532", "eth_blockNumber")
+    before = sum(block_numbers.counts)
+    await verifier.head()
+    await verifier.head()
+    rpc_timed = sum(block_numbers.counts) - before == 2
+    await node.stop()
+
+    checks = [
+        ('requests_total{outcome="authorized"} 2' in text, "Labeled counter rendered"),
+        ('outcome="say \\"hi\\"\\n"' in text, "Label values escaped"),
+        ("queue_depth 7" in text and "# TYPE queue_depth gauge" in text, "Gauge read at scrape time"),
+        ('latency_seconds_bucket{le="0.1"} 2' in text and 'latency_seconds_bucket{le="1"} 3' in text
+         and 'latency_seconds_bucket{le="+Inf"} 4' in text, "Histogram buckets are cumulative"),
+        ("latency_seconds_sum 3.65" in text and "latency_seconds_count 4" in text, "Histogram sum and count"),
+        (duplicate_refused and wrong_labels_refused, "Bad registrations refused"),
+        (abstract_refused, "Bare Metric can't be instantiated"),
+        (rpc_timed, "RPC requests timed per method"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _EchoJob(Job):
+    """Echoes its params' text from a child process"""
+
+    @classmethod
+    def get_name(cls):
+        return "echo"
+
+    @classmethod
+    def get_price(cls):
+        return 0
+
+    def validate_params(self):
+        return True, ""
+
+    async def execute(self):
+        async with await JobProcess.start("echo", self.params["text"]) as process:
+            async for line in process.lines():
+                yield line
+
+
+async def test_tracing():
+    """Test trace spans, context propagation and export"""
+    print("\n\nTesting Tracing")
+    print("=" * 50)
+
+    # Without an exporter every span is the shared no-op
+    off = Tracer(sample_rate=1)
+    noop = off.span("request_job", job_id="job-1") is NOOP_SPAN
+
+    # traceparent headers round-trip; malformed ones are ignored
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    context = Tracer.extract(header)
+    round_trip = context is not None and context.sampled and Tracer.inject(context) == header
+    malformed_ignored = all(
+        Tracer.extract(value) is None
+        for value in (None, "", "00-xyz-00f067aa0ba902b7-01", "00-" + "0" * 32 + "-00f067aa0ba902b7-01")
+    )
+
+    collector = Collector()
+    await collector.start()
+    traced = Tracer(sample_rate=0, exporter=OtlpSpanExporter(collector.url))
+
+    # A sampled client trace is recorded even at sample rate 0; children
+    # inherit the trace and job ID
+    with traced.span("request_job", job_id="job-1", parent=context) as request_span:
+        with traced.span("verify_payment_signature") as signature_span:
+            pass
+    # Nothing is recorded for an unsampled root, or for its children
+    with traced.span("request_job", job_id="job-2"):
+        with traced.span("verify_payment_signature"):
+            pass
+    outside = traced.child("rpc eth_blockNumber") is NOOP_SPAN
+    recorded = traced.recorded == 2
+    await traced.flush()
+    spans = {span["name"]: span for span in collector.trace(context.trace_id)}
+    linked = (
+        spans.get("request_job", {}).get("parent_id") == context.span_id
+        and spans.get("verify_payment_signature", {}).get("parent_id") == request_span.context.span_id
+        and spans["verify_payment_signature"]["span_id"] == signature_span.context.span_id
+    )
+    job_inherited = spans.get("verify_payment_signature", {}).get("job_id") == "job-1"
+
+    # Streaming a job under a trace: the stream, the job and its child
+    # process start are spans of it, exported to a file
+    trace_file = f"/tmp/x402-trace-{time.time_ns()}.jsonl"
+    tracer.exporter = FileSpanExporter(trace_file)
+    try:
+        with tracer.span("execute_job", job_id="job-3", parent=context) as execute_span:
+            pass
+        job = _EchoJob(job_id="job-3", params={"text": "hello"})
+        events = [event async for event in stream_job_output(job, trace=execute_span.context)]
+        await tracer.flush()
+    finally:
+        tracer.exporter = None
+    with open(trace_file) as f:
+        exported = {span["name"]: span for span in map(json.loads, f)}
+    os.remove(trace_file)
+    stream_span = exported.get("stream_job_output", {})
+    job_span = exported.get("Job.execute", {})
+    stream_traced = (
+        [event["event"] for event in events] == ["start", "output", "complete"]
+        and stream_span.get("parent_id") == execute_span.context.span_id
+        and [event["name"] for event in stream_span.get("events", [])] == ["first_output"]
+    )
+    job_traced = (
+        job_span.get("parent_id") == stream_span.get("span_id")
+        and job_span.get("job_id") == "job-3"
+        and exported.get("subprocess start", {}).get("parent_id") == job_span.get("span_id")
+    )
+
+    await collector.stop()
+
+    checks = [
+        (noop, "Tracing off returns the no-op span"),
+        (round_trip and malformed_ignored, "traceparent extract and inject"),
+        (recorded and outside, "Sampling follows the client's trace"),
+        (linked, "Child spans link to their parents"),
+        (job_inherited, "Job ID inherited by child spans"),
+        (stream_traced, "Stream span records first output"),
+        (job_traced, "Job execution and process start traced"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+def _block_loop(seconds: float):
+    """A synchronous call made on the event loop, as a sync RPC call would be"""
+    time.sleep(seconds)
+
+
+def _spin(stop: threading.Event):
+    """CPU-bound work in a thread, for the profiler to find"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+async def test_diagnostics():
+    """Test the event-loop lag monitor and the sampling profiler"""
+    print("\n\nTesting Runtime Diagnostics")
+    print("=" * 50)
+
+    monitor = LoopMonitor(interval=0.02, slow_seconds=0.1)
+    monitor.start()
+    await asyncio.sleep(0.1)
+    lag_before = monitor.max_lag
+    _block_loop(0.3)
+    await asyncio.sleep(0.1)
+    stall = monitor.recent_stalls[-1] if monitor.recent_stalls else {}
+    monitor.stop()
+    samples = monitor.samples
+    await asyncio.sleep(0.1)
+
+    stop = threading.Event()
+    spinner = threading.Thread(target=_spin, args=(stop,), name="spinner")
+    spinner.start()
+    profiler = SamplingProfiler()
+    try:
+        profile, concurrent = await asyncio.gather(
+            profiler.profile(0.3, 0.002), profiler.profile(0.1), return_exceptions=True
+        )
+    finally:
+        stop.set()
+        spinner.join()
+    lines = profile.splitlines() if isinstance(profile, str) else []
+    spinner_samples = sum(
+        int(line.rpartition(" ")[2]) for line in lines if line.startswith("spinner;") and "_spin (" in line
+    )
+    well_formed = bool(lines) and all(line.rpartition(" ")[2].isdigit() for line in lines)
+
+    checks = [
+        (lag_before < 0.1 and monitor.max_lag >= 0.25, "Loop lag measured"),
+        (monitor.stalls == 1 and "_block_loop" in stall.get("stack", "")
+         and stall["blocked_seconds"] >= 0.25, "Blocking callback's stack captured"),
+        (not monitor.running and monitor.samples == samples, "Monitor stops cleanly"),
+        (well_formed and spinner_samples > 10, "Profile has folded thread stacks"),
+        (isinstance(concurrent, RuntimeError) and not profiler.running, "One profile at a time"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _BlockingStream(io.StringIO):
+    """A log stream whose writes wait until it is released"""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def write(self, text):
+        self.released.wait()
+        return super().write(text)
+
+
+async def test_logging():
+    """Test structured logging: JSON records, sampling, rate limits, drops"""
+    print("\n\nTesting Structured Logging")
+    print("=" * 50)
+
+    stream = io.StringIO()
+    pipeline = LogPipeline(
+        stream, queue_size=100, level="INFO", sample_rates={"noisy": 0.0, "kept": 1.0},
+        rate_limiter=RateLimiter(limit=2, window=0.2), name="x402-test"
+    )
+    log = StructuredLogger("payments", pipeline)
+    log.info("payment_verified", chain_id=84532, amount_wei=10**18)
+    log.debug("not_logged")
+    log.info("noisy")
+    log.info("kept")
+    for _ in range(5):
+        log.warning("payment_check_failed", error="timeout")
+    await asyncio.sleep(0.25)
+    log.warning("payment_check_failed", error="timeout")
+    try:
+        raise ValueError("bad receipt")
+    except ValueError:
+        log.exception("receipt_check_failed")
+    pipeline.stop()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    events = [record["event"] for record in records]
+    checks_failed = [record for record in records if record["event"] == "payment_check_failed"]
+
+    blocked = _BlockingStream()
+    full = LogPipeline(blocked, queue_size=5, level="INFO", name="x402-test-full")
+    slow_log = StructuredLogger("jobs", full)
+    started = time.perf_counter()
+    for i in range(200):
+        slow_log.info("job_completed", job_id=i)
+    elapsed = time.perf_counter() - started
+    dropped = full.stats()["dropped"]
+    blocked.released.set()
+    full.stop()
+    written = len(blocked.getvalue().splitlines())
+
+    checks = [
+        (records[0] == {**records[0], "level": "info", "logger": "x402-test.payments",
+                        "event": "payment_verified", "chain_id": 84532, "amount_wei": 10**18}
+         and "ts" in records[0], "Records are JSON with their fields"),
+        ("not_logged" not in events, "Records below the level are skipped"),
+        ("noisy" not in events and "kept" in events
+         and pipeline.stats()["sampled_out"] == 1, "Events are sampled"),
+        (len(checks_failed) == 3 and checks_failed[-1].get("suppressed") == 3
+         and pipeline.stats()["rate_limited"] == 3, "Repeated warnings are rate limited"),
+        ("ValueError: bad receipt" in records[-1].get("exception", ""), "Exceptions include the traceback"),
+        (elapsed < 0.1 and dropped > 0, "A full queue drops without blocking"),
+        (written + dropped == 200 and full.stats()["queued"] == 0, "Stopping writes queued records"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_multichain():
+    """Test multi-chain payments: concurrent verification and per-chain signatures"""
+    print("\n\nTesting Multi-Chain Payments")
+    print("=" * 50)
+
+    # Payment seen on Sepolia first; the slower Base Sepolia watch is cancelled
+    verifier = MultiChainVerifier([84532, 11155111])
+    slow = _FakeChainVerifier(5, True)
+    verifier.verifiers = {84532: slow, 11155111: _FakeChainVerifier(0.1, True)}
+    start = time.perf_counter()
+    first = await verifier.verify_payment("0x" + "a" * 40, Decimal("0.01"), timeout=10)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0)
+
+    verifier.verifiers = {84532: _FakeChainVerifier(0, False), 11155111: _FakeChainVerifier(0, False)}
+    missing = await verifier.verify_payment("0x" + "a" * 40, Decimal("0.01"), timeout=0.1)
+
+    account = Account.create()
+
+    def sign_payment(chain_id, token):
+        now = int(time.time())
+        payment = {
+            "recipient": PAYMENT_RECIPIENT_ADDRESS,
+            "token": token,
+            "amount": str(10**16),
+            "jobId": "chain-job",
+            "timestamp": now,
+            "validUntil": now + 300,
+        }
+        signed = Account.sign_message(encode_typed_data(full_message={
+            "types": {
+                "EIP712Domain": [
+                    {"name": "name", "type": "string"},
+                    {"name": "version", "type": "string"},
+                    {"name": "chainId", "type": "uint256"},
+                ],
+                **PAYMENT_AUTHORIZATION_TYPES
+            },
+            "primaryType": "PaymentAuthorization",
+            "domain": get_payment_domain(chain_id),
+            "message": payment,
+        }), account.key)
+        return {**payment, "chainId": chain_id, "signature": signed.signature.hex()}
+
+    sepolia_token = U_TOKEN_CHAINS[11155111]["token"]
+    sepolia = verify_payment_signature(sign_payment(11155111, sepolia_token), "chain-job", str(10**16))
+    wrong_token = verify_payment_signature(sign_payment(11155111, TOKEN_ADDRESS), "chain-job", str(10**16))
+    unsupported = verify_payment_signature(sign_payment(1, TOKEN_ADDRESS), "chain-job", str(10**16))
+    # Signed for Sepolia but presented as a Base Sepolia payment: recovers someone else
+    replayed = sign_payment(11155111, TOKEN_ADDRESS)
+    replayed["chainId"] = 84532
+    replayed = verify_payment_signature(replayed, "chain-job", str(10**16))
+
+    # One payer on two chains needs a transfer on each
+    spender, payer = "0x" + "5" * 40, "0x" + "a" * 40
+    chains = {chain_id: SimulatedChain() for chain_id in (84532, 11155111)}
+    for chain in chains.values():
+        chain.mint(payer, 10**18)
+        chain.approve(payer, spender, 10**18)
+    engine = SettlementEngine({
+        chain_id: SimulatedSettlementChain(chain, spender) for chain_id, chain in chains.items()
+    })
+    engine.submit("base-job", payer, 10**16, 84532)
+    engine.submit("sepolia-job", payer, 10**16, 11155111)
+    engine.submit("mainnet-job", payer, 10**16, 1)
+    await engine.settle_batch()
+    for chain in chains.values():
+        chain.mine()
+    await engine.settle_batch()
+
+    checks = [
+        (first == (True, "0x0.1", 11155111) and elapsed < 1, "First chain with the payment wins"),
+        (slow.cancelled and missing == (False, None, None), "Slower chains cancelled; none found"),
+        (sepolia[0] and sepolia[1] == account.address, "Sepolia signature verifies"),
+        (not wrong_token[0] and "Token" in wrong_token[2], "Other chain's token rejected"),
+        (not unsupported[0] and "Unsupported chain" in unsupported[2], "Unsupported chain rejected"),
+        (replayed[1] != account.address, "Signature bound to its chain"),
+        (engine.status("base-job")["status"] == engine.status("sepolia-job")["status"] == "settled"
+         and engine.transfers == 2, "Settled per chain"),
+        (engine.status("mainnet-job") is None and engine.stats()["dropped"] == 1, "Unsettleable chain dropped"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_result_cache():
+    """Test opt-in replay of recorded results, per-type counters and LRU eviction"""
+    print("\n\nTesting Result Cache")
+    print("=" * 50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProbeTargetHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def events(job_id, **extra):
+        params = {"host": "127.0.0.1", "port": port, "count": 2, "interval": 0, **extra}
+        job = TcpProbeJob(job_id=job_id, params=params)
+        return [event["event"] async for event in stream_job_output(job)]
+
+    try:
+        result_cache.clear()
+        live = await events("cache-1")
+        replayed = await events("cache-2", cache=True)
+        fresh_only = await events("cache-3", cache=True, max_age=0)
+        not_opted_in = await events("cache-4")
+    finally:
+        server.shutdown()
+
+    counts = result_cache.stats()["by_type"]["tcp_probe"]
+    invalid = TcpProbeJob(job_id="cache-5", params={"cache": True, "max_age": 3600}).validate_cache_params()
+
+    # Sixteen 40-byte results fill the cache; a seventeenth evicts the least recently used
+    small = ResultCache(max_bytes=16 * 40)
+    jobs = [TcpProbeJob(job_id=f"lru-{i}", params={"host": f"h{i}", "port": 1, "cache": True}) for i in range(17)]
+
+    async def record(job):
+        async def outputs():
+            yield "x" * 40
+        async for _ in small.record(job, outputs()):
+            pass
+
+    for job in jobs[:16]:
+        await record(job)
+    small.replay(jobs[0])
+    await record(jobs[16])
+
+    # A failed run isn't recorded, whatever its output format
+    failures = ResultCache()
+    params = {"host": "unresolvable.invalid", "count": 1, "format": "text", "cache": True}
+    failing = PingJob(job_id="cache-fail", params=params)
+    text = [output async for output in failures.record(failing, failing.run())]
+    failure_skipped = any(failing.is_failure(output) for output in text) and failures.replay(failing) is None
+
+    checks = [
+        (live[1:] == ["attempt", "attempt", "summary", "complete"], "Live execution streamed"),
+        (replayed[1] == "cached" and replayed[2:] == live[1:], "Opted-in client served replay"),
+        (fresh_only[1] == "attempt", "max_age=0 forces a fresh run"),
+        (not_opted_in[1] == "attempt", "Clients not opting in run live"),
+        (counts["hits"] == 1 and counts["misses"] == 1, "Hits and misses counted per type"),
+        (not invalid[0], "max_age above max_staleness rejected"),
+        (small.replay(jobs[1]) is None and small.replay(jobs[0]) is not None, "Least recently used evicted"),
+        (failure_skipped, "Failed text run not cached"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _SleepJob(Job):
+    """Starts a shell that forks a background sleeper, then waits on it"""
+
+    @classmethod
+    def get_name(cls):
+        return "sleep"
+
+    @classmethod
+    def get_price(cls):
+        return 0
+
+    def validate_params(self):
+        return True, ""
+
+    def time_limit(self):
+        return self.params["limit"]
+
+    async def execute(self):
+        async with await JobProcess.start("sh", "-c", "sleep 30 & echo $!; wait") as process:
+            self.params["pids"] = [process.process.pid]
+            async for line in process.lines():
+                self.params["pids"].append(int(line))
+                yield line
+            await process.wait()
+
+
+def _any_alive(pids) -> bool:
+    """True if any pid is still running (zombies awaiting reaping count as dead)"""
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                if f.read().rsplit(")", 1)[1].split()[0] != "Z":
+                    return True
+        except FileNotFoundError:
+            pass
+    return False
+
+
+async def test_cancellation():
+    """Test job time limits and cancellation kill the job's whole process group"""
+    print("\n\nTesting Job Cancellation and Time Limits")
+    print("=" * 50)
+
+    before = job_executions.stats()
+
+    # Time limit: run() raises and the process group is killed
+    job = _SleepJob(job_id="test-timeout", params={"limit": 0.5})
+    timed_out = False
+    try:
+        async for _ in job.run():
+            pass
+    except JobTimeoutError:
+        timed_out = True
+    timeout_pids = job.params["pids"]
+
+    # Consumer cancelled mid-stream, as when an SSE client disconnects
+    job = _SleepJob(job_id="test-cancel", params={"limit": 30})
+    started = asyncio.Event()
+
+    async def consume():
+        async for _ in job.run():
+            started.set()
+
+    task = asyncio.create_task(consume())
+    await started.wait()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    cancel_pids = job.params["pids"]
+
+    await asyncio.sleep(0.1)
+    after = job_executions.stats()
+
+    checks = [
+        (timed_out, "Time limit raises JobTimeoutError"),
+        (len(timeout_pids) == 2 and not _any_alive(timeout_pids), "Timed-out process group killed"),
+        (len(cancel_pids) == 2 and not _any_alive(cancel_pids), "Cancelled process group killed"),
+        (after["timed_out"] - before["timed_out"] == 1, "Timeout counted"),
+        (after["cancelled"] - before["cancelled"] == 1, "Cancellation counted"),
+        (after["processes"] == 0 and after["running"] == 0, "No processes or executions left"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+async def test_worker_pool():
+    """Test job execution in worker processes, including limit enforcement"""
+    print("\n\nTesting Worker Pool")
+    print("=" * 50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProbeTargetHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # Make _SleepJob available to the workers, which build their own registry
+    with open(JOB_MANIFEST) as f:
+        manifest = json.load(f)
+    manifest["jobs"].append({"name": "sleep", "entry": "test_flow:_SleepJob", "price": "0"})
+    manifest_file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    with manifest_file:
+        json.dump(manifest, manifest_file)
+    os.environ["JOB_MANIFEST"] = manifest_file.name
+
+    pool = WorkerPool(size=1, wall_seconds=3)
+    pool.start()
+    try:
+        quick = TcpProbeJob(job_id="test-pool", params={"host": "127.0.0.1", "port": port, "count": 2, "interval": 0})
+        events = [event async for event in pool.run(quick)]
+
+        slow = TcpProbeJob(job_id="test-slow", params={"host": "127.0.0.1", "port": port, "count": 5, "interval": 1})
+        timed_out = False
+        try:
+            async for _ in pool.run(slow):
+                pass
+        except WorkerError:
+            timed_out = True
+
+        # The job's processes run in their own session, outside the worker's group
+        sleeper_pids = []
+        try:
+            async for line in pool.run(_SleepJob(job_id="test-pool-sleep", params={"limit": 30})):
+                sleeper_pids.append(int(line))
+                with open(f"/proc/{sleeper_pids[0]}/stat") as f:
+                    sleeper_pids.append(int(f.read().rsplit(")", 1)[1].split()[2]))
+        except WorkerError:
+            pass
+
+        after_replace = [event async for event in pool.run(quick)]
+
+        # The API process counts a pooled job as running while a worker has it
+        idle = job_executions.running
+        counted = {job_executions.running async for _ in pool.run(quick)}
+        released = job_executions.running == idle
+    finally:
+        pool.stop()
+        server.shutdown()
+        del os.environ["JOB_MANIFEST"]
+        os.unlink(manifest_file.name)
+
+    checks = [
+        (events[-1]["type"] == "summary" and events[-1]["received"] == 2, "Job output streamed from worker"),
+        (timed_out, "Wall-clock limit enforced"),
+        (len(sleeper_pids) == 2 and not _any_alive(sleeper_pids), "Job's processes killed with worker"),
+        (pool.workers_replaced == 2, "Killed workers replaced"),
+        (after_replace[-1]["type"] == "summary", "Replacement worker runs jobs"),
+        (counted == {idle + 1} and released, "Pooled job counted as running"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
+class _FlakyQueue(MemoryQueue):
+    """Memory queue whose output and completion calls fail while `failures` lasts, like a lost API"""
+
+    def __init__(self, failures: int, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def _maybe_fail(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise OSError("connection reset")
+
+    async def append_output(self, task_id, worker_id, outputs):
+        self._maybe_fail()
+        return await super().append_output(task_id, worker_id, outputs)
+
+    async def complete(self, task_id, worker_id, error=None):
+        self._maybe_fail()
+        return await super().complete(task_id, worker_id, error)
+
+
+async def test_dispatch():
+    """Test remote dispatch: leases, output relay and re-dispatch from a dead worker"""
+    print("\n\nTesting Remote Dispatch")
+    print("=" * 50)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProbeTargetHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    queue = MemoryQueue(lease_seconds=0.5)
+    dispatcher = Dispatcher(queue)
+    reaper = asyncio.create_task(dispatcher.reap_expired_leases())
+
+    async def dead_worker_then_live_worker():
+        # Leases the job and never heartbeats, as if its node crashed
+        while await queue.lease("dead-worker") is None:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)
+        node = WorkerNode(queue, heartbeat_seconds=0.1, idle_seconds=0.01)
+        return asyncio.create_task(node.run_forever())
+
+    workers = asyncio.create_task(dead_worker_then_live_worker())
+    try:
+        job = TcpProbeJob(job_id="test-dispatch", params={"host": "127.0.0.1", "port": port, "count": 2, "interval": 0})
+        idle = job_executions.running
+        outputs = []
+        counted = set()
+        async for output in dispatcher.run(job):
+            outputs.append(output)
+            counted.add(job_executions.running)
+        released = job_executions.running == idle
+    finally:
+        (await workers).cancel()
+        reaper.cancel()
+        server.shutdown()
+
+    types = [output["type"] for output in outputs]
+    checks = [
+        (types[0] == "redispatch" and outputs[0]["attempt"] == 2, "Lost worker's job re-dispatched"),
+        (types[1:] == ["attempt", "attempt", "summary"], "Output relayed from live worker"),
+        (await queue.lease("late-worker") is None, "Finished job not leased again"),
+        (max(counted) > idle and released, "Leased job counted as running"),
+    ]
+
+    # Output and completion both fail for the first task; the slot must survive
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ProbeTargetHandler)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    flaky = _FlakyQueue(failures=2)
+    params = {"host": "127.0.0.1", "port": port, "count": 2, "interval": 0}
+    cancelled = job_executions.cancelled
+    node = asyncio.create_task(WorkerNode(flaky, idle_seconds=0.01).run_forever())
+    try:
+        await flaky.enqueue("flaky-1", "tcp_probe", params)
+        await flaky.enqueue("flaky-2", "tcp_probe", params)
+        for _ in range(500):
+            _, _, status, _ = await flaky.read_output("flaky-2", 0)
+            if status == "done" or node.done():
+                break
+            await asyncio.sleep(0.01)
+        survived = not node.done()
+    finally:
+        node.cancel()
+        server.shutdown()
+
+    checks += [
+        (survived and status == "done", "Slot survives a failing API"),
+        (job_executions.cancelled == cancelled + 1, "Abandoned job closed"),
+    ]
+
+    failed = 0
+    for ok, description in checks:
+        print(f"{description:40} - {'PASS' if ok else 'FAIL'}")
+        if not ok:
+            failed += 1
+
+    return failed == 0
+
+
 async def main():
     """Run all tests"""
     print("x402 PoC - Testing Suite")
@@ -88,6 +2012,78 @@ async def main():
     # Test validation
     results.append(await test_validation())
 
+    # Test output parsing
+    results.append(await test_ping_parser())
+
+    # Test traceroute
+    results.append(await test_traceroute())
+
+    # Test batch ping
+    results.append(await test_batch_ping())
+
+    # Test DNS cache
+    results.append(await test_dns_cache())
+
+    # Test TCP/HTTP probes
+    results.append(await test_probe_jobs())
+
+    # Test job registry
+    results.append(await test_registry())
+
+    # Test pricing
+    results.append(await test_pricing())
+
+    # Test prepaid sessions
+    results.append(await test_sessions())
+
+    # Test batched settlement
+    results.append(await test_settlement())
+
+    # Test batch authorization
+    results.append(await test_batch_authorization())
+
+    # Test job re-authorization
+    results.append(await test_reauthorization())
+
+    # Test speculative authorization
+    results.append(await test_speculative())
+
+    # Test confirmations and reorgs
+    results.append(await test_confirmations())
+
+    # Test multi-chain payments
+    results.append(await test_multichain())
+
+    # Test payment detection by log subscription
+    results.append(await test_log_stream())
+
+    # Test payment verification over JSON-RPC
+    results.append(await test_rpc_node())
+
+    # Test metrics
+    results.append(await test_metrics())
+
+    # Test tracing
+    results.append(await test_tracing())
+
+    # Test loop lag monitor and profiler
+    results.append(await test_diagnostics())
+
+    # Test structured logging
+    results.append(await test_logging())
+
+    # Test result cache
+    results.append(await test_result_cache())
+
+    # Test cancellation and time limits
+    results.append(await test_cancellation())
+
+    # Test worker pool
+    results.append(await test_worker_pool())
+
+    # Test remote dispatch
+    results.append(await test_dispatch())
+
     # Test ping execution
     results.append(await test_ping_job())
 
@@ -452,7 +452,7 @@ function displayJobs() {
         card.className = 'job-card';
         card.innerHTML = `
             <h3>${jobInfo.name.charAt(0).toUpperCase() + jobInfo.name.slice(1)}</h3>
-            <p class="price">${jobInfo.price} U</p>
+            <p class="price">${jobInfo.price} U / ${jobInfo.price_unit}</p>
         `;
         card.addEventListener('click', () => selectJob(jobName, jobInfo));
         elements.jobsList.appendChild(card);
@@ -468,7 +468,7 @@ function selectJob(jobName, jobInfo) {
     });
     event.target.closest('.job-card').classList.add('selected');
 
-    elements.jobPrice.textContent = jobInfo.price;
+    elements.jobPrice.textContent = `${jobInfo.price} / ${jobInfo.price_unit}`;
     elements.jobForm.classList.remove('hidden');
 }
 
@@ -494,7 +494,7 @@ async function requestJobExecution() {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 job_type: state.selectedJob.name,
-                params: { host, count },
+                params: { host, count, format: 'text' },
                 wallet_address: state.wallet
             })
         });
@@ -574,7 +574,7 @@ async function payForJob() {
             }]
         });
 
-        updateStatus('Payment sent! Waiting for confirmation...');
+        updateStatus('Payment sent! Verifying...');
 
         // Show transaction link with truncated hash
         const explorerUrl = `https://base-sepolia.blockscout.com/tx/${txHash}`;
@@ -585,12 +585,8 @@ async function payForJob() {
         elements.txLinkContainer.classList.remove('hidden');
         appendOutput(`Transaction: ${explorerUrl}\n`);
 
-        // Wait for transaction confirmation
-        await waitForTransaction(txHash);
-
-        updateStatus('Payment confirmed! Verifying on blockchain...');
-
-        // Verify payment with backend (with retry logic)
+        // Verify payment with backend (with retry logic). Low-price jobs start
+        // as soon as the transfer is seen; others wait for it to be mined.
         await verifyPayment(txHash, 0);
 
     } catch (error) {
@@ -612,37 +608,6 @@ function encodeTransferData(to, amount) {
     return functionSignature + paddedAddress + paddedAmount;
 }
 
-async function waitForTransaction(txHash) {
-    return new Promise((resolve, reject) => {
-        const checkInterval = setInterval(async () => {
-            try {
-                const receipt = await window.ethereum.request({
-                    method: 'eth_getTransactionReceipt',
-                    params: [txHash]
-                });
-
-                if (receipt) {
-                    clearInterval(checkInterval);
-                    if (receipt.status === '0x1') {
-                        resolve(receipt);
-                    } else {
-                        reject(new Error('Transaction failed'));
-                    }
-                }
-            } catch (error) {
-                clearInterval(checkInterval);
-                reject(error);
-            }
-        }, 2000);
-
-        // Timeout after 5 minutes
-        setTimeout(() => {
-            clearInterval(checkInterval);
-            reject(new Error('Transaction confirmation timeout'));
-        }, 300000);
-    });
-}
-
 async function verifyPayment(txHash, retryCount = 0) {
     const MAX_RETRIES = 10;
     const RETRY_DELAY = 3000; // 3 seconds
@@ -655,13 +620,14 @@ async function verifyPayment(txHash, retryCount = 0) {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 job_id: state.currentJobId,
-                tx_hash: txHash
+                tx_hash: txHash,
+                speculative: true
             })
         });
 
         const data = await response.json();
 
-        if (data.status === 'verified' || data.status === 'already_paid') {
+        if (data.status === 'verified' || data.status === 'speculative' || data.status === 'already_paid') {
             updateStatus('Payment verified! Starting execution...');
             elements.paymentSection.classList.add('hidden');
             await executeJob();
@@ -68,6 +68,8 @@ function App() {
       if (params.count) {
         params.count = parseInt(params.count);
       }
+      // The console renders raw lines, so ask for text rather than typed events
+      params.format = 'text';
 
       const requestResponse = await fetch(`${config.apiUrl}/api/jobs/request`, {
         method: 'POST',
@@ -128,12 +130,13 @@ function App() {
             body: JSON.stringify({
               job_id: paymentData.job_id,
               tx_hash: txHash,
+              speculative: true,
             }),
           });
 
           const verifyData: PaymentVerificationResponse = await verifyResponse.json();
 
-          if (verifyData.status === 'verified' || verifyData.status === 'already_paid') {
+          if (verifyData.status === 'verified' || verifyData.status === 'speculative' || verifyData.status === 'already_paid') {
             verified = true;
             setPaymentStatus('Payment verified! Executing job...');
 
@@ -273,7 +276,7 @@ function App() {
             >
               {Object.entries(jobs).map(([name, job]) => (
                 <option key={name} value={name}>
-                  {job.name} - {job.price} U
+                  {job.name} - {job.price} U / {job.price_unit}
                 </option>
               ))}
             </select>
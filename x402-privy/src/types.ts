@@ -3,6 +3,7 @@
 export interface Job {
   name: string;
   price: string;
+  price_unit: string;
 }
 
 export interface JobsResponse {
@@ -26,7 +27,7 @@ export interface PaymentRequiredResponse {
 }
 
 export interface PaymentVerificationResponse {
-  status: 'verified' | 'already_paid' | 'payment_not_found';
+  status: 'verified' | 'speculative' | 'already_paid' | 'payment_not_found';
   tx_hash?: string;
   execution_url?: string;
   message?: string;